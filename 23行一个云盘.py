@@ -1,9 +1,11 @@
-from flask import Flask, request, jsonify, send_from_directory, abort, render_template_string  # 导入flask基础组件及模板渲染
+from flask import Flask, request, jsonify, send_from_directory, abort, render_template  # 导入flask基础组件及模板渲染
 from werkzeug.utils import secure_filename  # 文件名安全处理
 from flask_httpauth import HTTPBasicAuth  # flask-httpauth 用于简易登录认证
-from werkzeug.security import generate_password_hash, check_password_hash  # 生成和校验密码哈希
+from werkzeug.security import generate_password_hash  # 生成密码哈希
+from auth_cache import CredentialCache  # 口令校验缓存，避免每个请求都重算哈希
 import os  # 操作系统路径相关
 import shutil  # 高级文件操作（支持目录移动）
+from jinja2 import DictLoader  # 字典模板加载器
 
 # 创建Flask应用
 application = Flask(__name__)  # 主应用实例
@@ -24,9 +26,11 @@ users = {
     "admin": generate_password_hash("password123")  # admin用户密码
 }
 
+credential_cache = CredentialCache()  # 校验成功的口令缓存 60 秒，改密码后自动失效
+
 @auth.verify_password  # 验证用户密码
 def verify_password(username, password):
-    if username in users and check_password_hash(users.get(username), password):
+    if credential_cache.check(username, password, users.get(username)):
         return username  # 认证成功
     return None  # 认证失败
 
@@ -44,11 +48,8 @@ def resolve_full_path(relative_path):  # 解析安全绝对路径，避免路径
         abort(400, 'Invalid path')
     return abs_path
 
-@application.route('/')  # 首页路由，渲染单页应用
-@auth.login_required  # 需要登录认证
-def render_user_interface():
-    # 此处用render_template_string直接内嵌HTML模板字符串
-    return render_template_string("""
+# 单页应用模板，启动时注册到Jinja环境，按名称编译一次后缓存，请求时不再重复编译
+INDEX_HTML = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -331,7 +332,13 @@ def render_user_interface():
 
 </body>
 </html>
-""", bg_color=THEME_BG_COLOR, border_color=THEME_BORDER_COLOR, text_color=THEME_TEXT_COLOR)  # 注入样式变量
+"""
+application.jinja_loader = DictLoader({'index.html': INDEX_HTML})  # 名称带.html后缀以保持自动转义
+
+@application.route('/')  # 首页路由，渲染单页应用
+@auth.login_required  # 需要登录认证
+def render_user_interface():
+    return render_template('index.html', bg_color=THEME_BG_COLOR, border_color=THEME_BORDER_COLOR, text_color=THEME_TEXT_COLOR)  # 注入样式变量
 
 @application.route('/api/list')  # 列出目录内容接口
 @auth.login_required
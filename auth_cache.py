@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+auth_cache.py
+HTTP Basic 认证云盘共用的口令校验缓存。浏览器每个请求都会重发用户名和口令，
+check_password_hash 每次都要完整计算一遍 PBKDF2/scrypt，一次页面加载几十个请求就是几十次哈希。
+这里把校验成功的结果在内存中保存一小段时间（TTL），再次出现同一组口令时直接放行。
+    - 缓存键是 HMAC(进程随机密钥, 用户名, 口令)，内存中不保存明文口令，进程重启即失效
+    - 每条记录绑定校验时的口令哈希，用户改密码（哈希变化）后旧口令立即失效；也可调用 invalidate()
+    - 只缓存成功的校验，错误口令每次都走完整哈希
+    - LRU 上限防止内存无限增长
+用法:
+    credential_cache = CredentialCache()
+    @auth.verify_password
+    def verify_password(username, password):
+        if credential_cache.check(username, password, users.get(username)):
+            return username
+基准测试（对比有无缓存的请求/秒）:
+    python auth_cache.py [--requests 200]
+"""
+import argparse
+import collections
+import hashlib
+import hmac
+import os
+import struct
+import threading
+import time
+
+from werkzeug.security import check_password_hash
+
+DEFAULT_TTL = 60                       # 秒
+DEFAULT_MAX_ENTRIES = 1024
+
+class CredentialCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._secret = os.urandom(32)
+        self._entries = collections.OrderedDict()    # 键 -> (用户名, 口令哈希, 过期时间)
+        self._lock = threading.Lock()
+
+    def _key(self, username, password):
+        user = username.encode("utf-8")
+        # 带长度前缀，避免 ("ab", "c") 与 ("a", "bc") 拼接后相同
+        msg = struct.pack(">I", len(user)) + user + password.encode("utf-8")
+        return hmac.new(self._secret, msg, hashlib.sha256).digest()
+
+    def check(self, username, password, stored_hash):
+        """校验口令；stored_hash 为该用户当前的口令哈希，用户不存在时传 None"""
+        if not username or password is None or not stored_hash:
+            return False
+        key = self._key(username, password)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] == stored_hash and entry[2] > now:
+                    self._entries.move_to_end(key)
+                    return True
+                del self._entries[key]
+        if not check_password_hash(stored_hash, password):
+            return False
+        with self._lock:
+            self._entries[key] = (username, stored_hash, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, username=None):
+        """删除某用户（默认全部）的缓存记录，修改或删除用户后调用"""
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+                return
+            for key in [k for k, e in self._entries.items() if e[0] == username]:
+                del self._entries[key]
+
+# ======= 基准测试 =======
+
+def _bench_app(cache):
+    from flask import Flask
+    from flask_httpauth import HTTPBasicAuth
+    from werkzeug.security import generate_password_hash
+
+    app = Flask(__name__)
+    auth = HTTPBasicAuth()
+    users = {"admin": generate_password_hash("password123")}
+
+    @auth.verify_password
+    def verify_password(username, password):
+        if cache is not None:
+            return username if cache.check(username, password, users.get(username)) else None
+        if username in users and check_password_hash(users[username], password):
+            return username
+        return None
+
+    @app.route("/api/list")
+    @auth.login_required
+    def list_entries():
+        return {"entries": []}
+
+    return app
+
+def benchmark(requests=200):
+    import base64
+    headers = {"Authorization": "Basic " + base64.b64encode(b"admin:password123").decode("ascii")}
+    results = {}
+    for name, cache in (("无缓存", None), ("有缓存", CredentialCache())):
+        client = _bench_app(cache).test_client()
+        client.get("/api/list", headers=headers)        # 预热
+        start = time.perf_counter()
+        for _ in range(requests):
+            assert client.get("/api/list", headers=headers).status_code == 200
+        results[name] = requests / (time.perf_counter() - start)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="口令校验缓存基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="每种情况的请求数")
+    args = parser.parse_args()
+    for name, rate in benchmark(args.requests).items():
+        print(f"{name}: {rate:,.0f} 请求/秒")
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,53 @@
 batch_gcm_tool_mt.py
 交互式批量对目录下所有文件进行 AES-256-GCM 加密/解密，就地覆盖，
 支持多线程加速，并对失败的文件进行统计和日志输出，保持原文件的 access/modify 时间不变。
-依赖:
+依赖（任选其一，见 cipher_backends.py）:
     pip install pycryptodome
+    pip install cryptography
 运行:
-    python batch_gcm_tool_mt.py
+    python batch_gcm_tool_mt.py [--backend auto|pycryptodome|cryptography] [--legacy]
+                                [--compress none|zlib|lzma|zstd]
+文件格式:
+    magic "BATCHGCM" | version | 压缩编码 | 保留 (共 16 字节) | salt | nonce | tag | 密文
+    16 字节文件头作为 AAD 参与认证；读取文件头即可判断文件是否已加密。
+    --compress 开启先压缩后加密，首块熵过高（jpg/mp4 等）的文件不压缩，编码记录在文件头中。
+    --legacy 用于解密没有文件头的旧版本加密文件。
+校验模式:
+    只读取并校验每个文件的 tag，不写任何文件；结果写入 JSON 报告，
+    状态为 ok / bad_tag / truncated / wrong_format / unreadable。
+    格式中没有记录密文长度，truncated 只表示文件在 salt/nonce/tag 处就已结束；
+    正文被截断与被篡改无法区分，都报告为 bad_tag。
+小文件打包:
+    把目录下的小文件打包进少量加密容器 (*.bgcmpack)，每个容器只做一次 PBKDF2:
+    magic "BGCMPACK" | version | 保留 | salt | 条目密文... | 加密索引 | 尾部
+    尾部 = 索引偏移 | 索引长度 | 索引 nonce | 索引 tag | magic，固定 52 字节。
+    索引记录 路径 -> 偏移、长度、nonce、tag、时间戳与权限，可单独列出或随机提取条目:
+    python batch_gcm_tool_mt.py --list pack.bgcmpack
+    python batch_gcm_tool_mt.py --extract pack.bgcmpack some/dir/photo.jpg [--out DIR]
+密钥派生:
+    一次运行内加密的文件共用一个随机盐（每个文件的 nonce 仍独立随机），同一盐只做一次 PBKDF2；
+    --key-handle NAME 改为向密钥代理（key_agent.py）请求密钥，并使用代理为该句柄固定的盐
+    代替每次运行的随机盐：句柄存活期间多次运行加密的文件共用一个盐，代理只派生、缓存一个密钥，
+    重复运行也不必重新派生。旧代理不支持固定盐时仍用随机盐，每次运行都要在代理里派生一次。
+断点续跑:
+    每处理完一个文件即向目录下的 .batch_gcm_journal 追加一行记录，中断后以同一模式
+    重跑会跳过已完成的文件；全部成功后自动删除该日志。启动时清理上次中断遗留的临时文件
+    （包括旧版本留下、且原文件仍在的 <文件>.tmp）。
 """
 import os
 import sys
+import json
+import struct
+import argparse
+import hashlib
 import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from Crypto.Cipher import AES
-from Crypto.Protocol.KDF import PBKDF2
-from Crypto.Random import get_random_bytes
+import cipher_backends
+import compress_stage
+import key_agent
 # 常量定义
 SALT_SIZE = 16
 KEY_SIZE = 32
@@ -25,78 +58,479 @@ NONCE_SIZE = 12
 TAG_SIZE = 16
 PBKDF2_ITERS = 100_000
 BUFFER_SIZE = 64 * 1024
-# 全局用于收集失败文件信息
+VERIFY_BUFFER_SIZE = 1024 * 1024  # 校验时用大缓冲区顺序读，尽量吃满磁盘带宽
+ALGORITHM = cipher_backends.AES_GCM
+MAGIC = b"BATCHGCM"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sBB6x")  # magic | version | 压缩编码 | 保留，共 16 字节
+TMP_SUFFIX = ".bgcm.tmp"
+LEGACY_TMP_SUFFIX = ".tmp"  # 旧版本使用的临时文件后缀
+JOURNAL_NAME = ".batch_gcm_journal"
+PACK_MAGIC = b"BGCMPACK"
+PACK_VERSION = 1
+PACK_SUFFIX = ".bgcmpack"
+PACK_MAX_FILE = 1024 * 1024  # 不超过此大小的文件才打包
+PACK_TARGET_SIZE = 256 * 1024 * 1024  # 单个容器的目标大小
+PACK_FOOTER = struct.Struct("<QQ12s16s8s")  # 索引偏移 | 索引长度 | 索引 nonce | 索引 tag | magic
+# 全局用于收集失败/跳过文件信息
 failure_lock = threading.Lock()
 failures = []  # list of tuples (file_path, error_message)
-def derive_key(password: str, salt: bytes) -> bytes:
-    """用 PBKDF2 从口令派生 AES-256 密钥"""
-    return PBKDF2(password, salt, dkLen=KEY_SIZE, count=PBKDF2_ITERS)
-def encrypt_single(path: str, password: str) -> None:
-    """对单个文件执行 AES-GCM 加密，就地覆盖，并保持 atime/mtime"""
+skipped = []  # list of tuples (file_path, reason)
+# 已派生密钥的缓存：(口令或代理句柄, 盐) -> [锁, 密钥]，同一盐并发请求时只派生一次
+KEY_CACHE_SIZE = 1024
+_key_cache = OrderedDict()
+_key_cache_lock = threading.Lock()
+_run_salt = os.urandom(SALT_SIZE)
+def derive_key(password, salt: bytes) -> bytes:
+    """用 PBKDF2 从口令派生 AES-256 密钥（HMAC-SHA1、latin-1 编码，与 pycryptodome PBKDF2 默认行为一致）；
+    password 为 key_agent.AgentKey 时由密钥代理派生"""
+    ident = (password if isinstance(password, str) else ("agent", password.handle), bytes(salt))
+    with _key_cache_lock:
+        entry = _key_cache.get(ident)
+        if entry is None:
+            entry = _key_cache[ident] = [threading.Lock(), None]
+            if len(_key_cache) > KEY_CACHE_SIZE:
+                _key_cache.popitem(last=False)
+        else:
+            _key_cache.move_to_end(ident)
+    with entry[0]:
+        if entry[1] is None:
+            if isinstance(password, str):
+                entry[1] = hashlib.pbkdf2_hmac("sha1", password.encode("latin-1"), salt, PBKDF2_ITERS, KEY_SIZE)
+            else:
+                entry[1] = password.derive(salt)
+        return entry[1]
+def use_agent_salt(agent) -> None:
+    """改用代理为句柄固定的盐：多次运行写出的文件共用一个盐，代理端只缓存一个密钥，
+    不会因为目录由很多次运行加密（每次一个新盐）而挤满代理的每句柄密钥缓存"""
+    global _run_salt
+    try:
+        _run_salt = agent.salt(SALT_SIZE)
+    except key_agent.AgentError as e:
+        print(f"Key agent cannot provide a salt ({e}), using a fresh salt for this run.")
+def get_password(args):
+    """返回口令，或在 --key-handle 可用时返回密钥代理句柄"""
+    if args.key_handle:
+        agent = key_agent.AgentKey(args.key_handle, "sha1", "latin-1", PBKDF2_ITERS, KEY_SIZE, args.agent_socket)
+        try:
+            handles = key_agent.request({"op": "list"}, args.agent_socket)["handles"]
+            if args.key_handle in handles:
+                use_agent_salt(agent)
+                return agent
+            print(f"Key agent has no handle {args.key_handle!r}, falling back to password.")
+        except key_agent.AgentError as e:
+            print(f"Key agent unavailable ({e}), falling back to password.")
+    password = ""
+    while not password:
+        password = input("Password: ").strip()
+    return password
+def read_version(path: str):
+    """只读取 16 字节文件头，返回格式版本；不是本工具加密的文件返回 None"""
+    with open(path, "rb") as f:
+        head = f.read(HEADER.size)
+    if len(head) == HEADER.size:
+        magic, version, _ = HEADER.unpack(head)
+        if magic == MAGIC:
+            return version
+    return None
+def remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+def encrypt_single(path: str, password: str, backend, compress: str = "none") -> bool:
+    """对单个文件执行（可选压缩后）AES-GCM 加密，就地覆盖，并保持 atime/mtime；已加密的文件跳过并返回 False"""
+    if read_version(path) is not None:
+        print(f"[Skipped] {path} (already encrypted)")
+        return False
     stat = os.stat(path)
-    salt = get_random_bytes(SALT_SIZE)
+    salt = _run_salt
     key = derive_key(password, salt)
-    nonce = get_random_bytes(NONCE_SIZE)
-    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-    tmp_path = path + ".tmp"
-    with open(path, "rb") as f_in, open(tmp_path, "wb") as f_out:
-        # 写入 salt | nonce | 占位 tag
-        f_out.write(salt)
-        f_out.write(nonce)
-        f_out.write(b"\x00" * TAG_SIZE)
-        # 分块加密并写入
-        while True:
+    nonce = os.urandom(NONCE_SIZE)
+    tmp_path = path + TMP_SUFFIX
+    try:
+        with open(path, "rb") as f_in, open(tmp_path, "wb") as f_out:
             chunk = f_in.read(BUFFER_SIZE)
-            if not chunk:
-                break
-            f_out.write(cipher.encrypt(chunk))
-        # 写入真正的 tag
-        tag = cipher.digest()
-        f_out.seek(SALT_SIZE + NONCE_SIZE)
-        f_out.write(tag)
-    os.replace(tmp_path, path)
+            codec = compress_stage.choose_codec(compress, chunk)  # 首块熵采样
+            compressor = compress_stage.Compressor(codec)
+            header = HEADER.pack(MAGIC, FORMAT_VERSION, compress_stage.CODEC_IDS[codec])
+            cipher = backend.encryptor(ALGORITHM, key, nonce, header)
+            # 写入 文件头 | salt | nonce | 占位 tag
+            f_out.write(header)
+            f_out.write(salt)
+            f_out.write(nonce)
+            f_out.write(b"\x00" * TAG_SIZE)
+            # 分块（压缩、）加密并写入
+            while chunk:
+                f_out.write(cipher.update(compressor.compress(chunk)))
+                chunk = f_in.read(BUFFER_SIZE)
+            f_out.write(cipher.update(compressor.flush()))
+            # 写入真正的 tag
+            tag = cipher.finalize()
+            f_out.seek(HEADER.size + SALT_SIZE + NONCE_SIZE)
+            f_out.write(tag)
+        os.replace(tmp_path, path)
+    except BaseException:
+        remove_quietly(tmp_path)
+        raise
     os.utime(path, (stat.st_atime, stat.st_mtime))
     print(f"[Encrypted] {path}")
-def decrypt_single(path: str, password: str) -> None:
-    """对单个文件执行 AES-GCM 解密，就地覆盖，并保持 atime/mtime"""
+    return True
+def decrypt_single(path: str, password: str, backend, legacy: bool = False) -> bool:
+    """对单个文件执行 AES-GCM 解密，就地覆盖，并保持 atime/mtime；未加密的文件跳过并返回 False"""
+    version = read_version(path)
+    if version is None and not legacy:
+        print(f"[Skipped] {path} (not encrypted)")
+        return False
+    if version is not None and version != FORMAT_VERSION:
+        raise ValueError(f"unsupported format version {version}")
     stat = os.stat(path)
-    tmp_path = path + ".tmp"
+    tmp_path = path + TMP_SUFFIX
     with open(path, "rb") as f_in:
+        aad = b""
+        if version is not None:
+            aad = f_in.read(HEADER.size)  # 文件头参与认证
         salt = f_in.read(SALT_SIZE)
         nonce = f_in.read(NONCE_SIZE)
         tag = f_in.read(TAG_SIZE)
         if len(salt) != SALT_SIZE or len(nonce) != NONCE_SIZE or len(tag) != TAG_SIZE:
             raise ValueError("invalid header (salt/nonce/tag)")
+        codec = HEADER.unpack(aad)[2] if aad else 0
+        decompressor = compress_stage.StreamDecompressor(codec)
         key = derive_key(password, salt)
-        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-        with open(tmp_path, "wb") as f_out:
+        if codec != compress_stage.CODEC_IDS["none"]:
+            # 压缩的文件先完整校验一遍 tag，确认未被篡改后才把数据交给解压器
+            body_offset = f_in.tell()
+            cipher = backend.decryptor(ALGORITHM, key, nonce, aad)
             while True:
                 chunk = f_in.read(BUFFER_SIZE)
                 if not chunk:
                     break
-                f_out.write(cipher.decrypt(chunk))
-        cipher.verify(tag)
+                cipher.update(chunk)
+            cipher.verify(tag)
+            f_in.seek(body_offset)
+        cipher = backend.decryptor(ALGORITHM, key, nonce, aad)
+        try:
+            with open(tmp_path, "wb") as f_out:
+                while True:
+                    chunk = f_in.read(BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    for piece in decompressor.feed(cipher.update(chunk)):
+                        f_out.write(piece)
+            cipher.verify(tag)
+            decompressor.finish()
+        except BaseException:
+            remove_quietly(tmp_path)
+            raise
     os.replace(tmp_path, path)
     os.utime(path, (stat.st_atime, stat.st_mtime))
     print(f"[Decrypted] {path}")
+    return True
+def verify_single(path: str, password: str, backend, legacy: bool = False) -> tuple:
+    """只校验 tag，不写任何文件；返回 (状态, 说明)"""
+    version = read_version(path)
+    if version is None and not legacy:
+        return "wrong_format", "missing BATCHGCM header"
+    if version is not None and version != FORMAT_VERSION:
+        return "wrong_format", f"unsupported format version {version}"
+    with open(path, "rb", buffering=0) as f_in:
+        aad = f_in.read(HEADER.size) if version is not None else b""
+        head = f_in.read(SALT_SIZE + NONCE_SIZE + TAG_SIZE)
+        if len(head) != SALT_SIZE + NONCE_SIZE + TAG_SIZE:
+            return "truncated", "file ends inside salt/nonce/tag"
+        salt = head[:SALT_SIZE]
+        nonce = head[SALT_SIZE:SALT_SIZE + NONCE_SIZE]
+        tag = head[SALT_SIZE + NONCE_SIZE:]
+        cipher = backend.decryptor(ALGORITHM, derive_key(password, salt), nonce, aad)
+        buf = bytearray(VERIFY_BUFFER_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = f_in.readinto(buf)
+            if not n:
+                break
+            cipher.update(view[:n])  # 输出的明文直接丢弃
+    try:
+        cipher.verify(tag)
+    except ValueError:
+        return "bad_tag", "authentication tag mismatch (tampered or truncated)"
+    return "ok", ""
+def run_verify(directory: str, password: str, backend, legacy: bool, max_workers: int) -> int:
+    """并行校验目录下所有文件，写出 JSON 报告，返回未通过的文件数"""
+    paths = [t[0] for t in collect_tasks(directory, "verify", password, backend, None, legacy)]
+    print(f"Verifying {len(paths)} files with {max_workers} threads...")
+    results = []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(verify_single, p, password, backend, legacy): p for p in paths}
+        for fut in as_completed(futures):
+            try:
+                status, detail = fut.result()
+            except Exception as ex:  # 单个文件出错只记录，不中断整个校验
+                status, detail = "unreadable", f"{type(ex).__name__}: {ex}"
+            results.append({"path": futures[fut], "status": status, "detail": detail})
+    elapsed = time.time() - start
+    summary = {}
+    for r in results:
+        summary[r["status"]] = summary.get(r["status"], 0) + 1
+    report = {
+        "tool": "batch_gcm_tool_mt",
+        "directory": os.path.abspath(directory),
+        "finished": datetime.now().isoformat(),
+        "seconds": round(elapsed, 3),
+        "summary": summary,
+        "files": sorted(results, key=lambda r: r["path"]),
+    }
+    report_file = os.path.join(os.getcwd(), f"batch_gcm_verify_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nVerified in {elapsed:.2f}s: " + ", ".join(f"{k}={v}" for k, v in sorted(summary.items())))
+    print(f"Report: {report_file}")
+    return len(results) - summary.get("ok", 0)
+class RunJournal:
+    """追加写入的运行日志：首行记录模式，其后每行一个已完成文件的相对路径"""
+    def __init__(self, root_dir: str, mode: str):
+        self.root = root_dir
+        self.path = os.path.join(root_dir, JOURNAL_NAME)
+        self.done = set()
+        self.lock = threading.Lock()
+        resume = False
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            try:
+                resume = bool(lines) and json.loads(lines[0]).get("mode") == mode
+            except ValueError:
+                resume = False
+            for line in lines[1:] if resume else []:
+                try:
+                    self.done.add(json.loads(line)["path"])
+                except (ValueError, KeyError, TypeError):
+                    continue  # 中断时写了一半的行
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if not resume:
+            self.record_line({"mode": mode, "started": datetime.now().isoformat()})
+    def record_line(self, obj: dict) -> None:
+        with self.lock:
+            self.file.write(json.dumps(obj, ensure_ascii=False) + "\n")
+            self.file.flush()
+    def is_done(self, path: str) -> bool:
+        return os.path.relpath(path, self.root) in self.done
+    def mark_done(self, path: str) -> None:
+        self.record_line({"path": os.path.relpath(path, self.root)})
+    def close(self, remove: bool) -> None:
+        self.file.close()
+        if remove:
+            remove_quietly(self.path)
 def worker(task: tuple):
     """线程执行函数"""
-    path, mode, password = task
+    path, mode, password, backend, journal, legacy, compress = task
     try:
         if mode == "encrypt":
-            encrypt_single(path, password)
+            processed = encrypt_single(path, password, backend, compress)
         else:
-            decrypt_single(path, password)
+            processed = decrypt_single(path, password, backend, legacy)
+        if not processed:
+            with failure_lock:
+                skipped.append(path)
+        journal.mark_done(path)
     except Exception as ex:
         with failure_lock:
             failures.append((path, str(ex)))
-def collect_tasks(root_dir: str, mode: str, password: str):
-    """收集所有待处理文件任务"""
+def cleanup_stale_tmp(root_dir: str) -> int:
+    """删除上次中断遗留的临时文件，返回删除数量。
+    旧版本的临时文件名是 <文件>.tmp：只在同目录下 <文件> 仍存在时删除（os.replace 之前中断，
+    原文件完好）；没有对应原文件的 *.tmp 可能是用户自己的文件，保留不动"""
+    removed = 0
+    for dirpath, _, filenames in os.walk(root_dir):
+        names = set(filenames)
+        for fname in filenames:
+            if fname.endswith(TMP_SUFFIX) or (fname.endswith(LEGACY_TMP_SUFFIX)
+                                              and fname[:-len(LEGACY_TMP_SUFFIX)] in names):
+                remove_quietly(os.path.join(dirpath, fname))
+                removed += 1
+    return removed
+def collect_tasks(root_dir: str, mode: str, password: str, backend, journal,
+                  legacy: bool = False, compress: str = "none"):
+    """收集所有待处理文件任务，跳过日志中已完成的文件以及本工具自身的日志/临时文件"""
     tasks = []
     for dirpath, _, filenames in os.walk(root_dir):
         for fname in filenames:
-            tasks.append((os.path.join(dirpath, fname), mode, password))
+            if fname == JOURNAL_NAME or fname.endswith(TMP_SUFFIX) or fname.endswith(PACK_SUFFIX):
+                continue
+            path = os.path.join(dirpath, fname)
+            if journal is not None and journal.is_done(path):
+                continue
+            tasks.append((path, mode, password, backend, journal, legacy, compress))
     return tasks
+def plan_packs(root_dir: str) -> list:
+    """收集可打包的小文件，按容器目标大小分组"""
+    groups, current, current_size = [], [], 0
+    for dirpath, _, filenames in os.walk(root_dir):
+        for fname in sorted(filenames):
+            if fname == JOURNAL_NAME or fname.endswith(TMP_SUFFIX) or fname.endswith(PACK_SUFFIX):
+                continue
+            path = os.path.join(dirpath, fname)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if size > PACK_MAX_FILE:
+                continue
+            if current and current_size + size > PACK_TARGET_SIZE:
+                groups.append(current)
+                current, current_size = [], 0
+            current.append(path)
+            current_size += size
+    if current:
+        groups.append(current)
+    return groups
+def pack_files(container: str, root_dir: str, paths: list, password: str, backend) -> list:
+    """把 paths 打包加密进一个容器，成功后删除原文件，返回已打包的文件列表"""
+    salt = _run_salt
+    key = derive_key(password, salt)
+    header = HEADER.pack(PACK_MAGIC, PACK_VERSION, 0)
+    entries, packed = [], []
+    tmp_path = container + TMP_SUFFIX
+    try:
+        with open(tmp_path, "wb") as f_out:
+            f_out.write(header)
+            f_out.write(salt)
+            offset = HEADER.size + SALT_SIZE
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                    with open(path, "rb") as f_in:
+                        data = f_in.read()
+                except OSError as ex:
+                    with failure_lock:
+                        failures.append((path, str(ex)))
+                    continue
+                if data[:len(MAGIC)] == MAGIC:
+                    with failure_lock:
+                        skipped.append(path)  # 已经是加密文件，不再打包
+                    continue
+                rel = os.path.relpath(path, root_dir).replace(os.sep, "/")
+                nonce = os.urandom(NONCE_SIZE)
+                cipher = backend.encryptor(ALGORITHM, key, nonce, rel.encode("utf-8"))  # 路径作为 AAD
+                f_out.write(cipher.update(data))
+                entries.append({"path": rel, "offset": offset, "length": len(data),
+                                "nonce": nonce.hex(), "tag": cipher.finalize().hex(),
+                                "atime": st.st_atime, "mtime": st.st_mtime, "mode": st.st_mode & 0o7777})
+                packed.append(path)
+                offset += len(data)
+            index = json.dumps({"entries": entries}, ensure_ascii=False).encode("utf-8")
+            nonce = os.urandom(NONCE_SIZE)
+            cipher = backend.encryptor(ALGORITHM, key, nonce, header + salt)
+            f_out.write(cipher.update(index))
+            f_out.write(PACK_FOOTER.pack(offset, len(index), nonce, cipher.finalize(), PACK_MAGIC))
+            f_out.flush()
+            os.fsync(f_out.fileno())  # 容器落盘后才能删除原文件
+        os.replace(tmp_path, container)
+    except BaseException:
+        remove_quietly(tmp_path)
+        raise
+    for path in packed:
+        os.remove(path)
+    print(f"[Packed] {container} ({len(packed)} files)")
+    return packed
+def open_pack(f, password: str, backend) -> tuple:
+    """读取容器尾部并解密索引，返回 (key, entries)"""
+    size = os.fstat(f.fileno()).st_size
+    head = f.read(HEADER.size + SALT_SIZE)
+    if size < HEADER.size + SALT_SIZE + PACK_FOOTER.size or HEADER.unpack(head[:HEADER.size])[0] != PACK_MAGIC:
+        raise ValueError("not a BGCMPACK container")
+    if HEADER.unpack(head[:HEADER.size])[1] != PACK_VERSION:
+        raise ValueError(f"unsupported pack version {HEADER.unpack(head[:HEADER.size])[1]}")
+    f.seek(size - PACK_FOOTER.size)
+    index_offset, index_len, nonce, tag, magic = PACK_FOOTER.unpack(f.read(PACK_FOOTER.size))
+    if magic != PACK_MAGIC or index_offset + index_len + PACK_FOOTER.size != size:
+        raise ValueError("container footer damaged or truncated")
+    key = derive_key(password, head[HEADER.size:])
+    f.seek(index_offset)
+    cipher = backend.decryptor(ALGORITHM, key, nonce, head)
+    index = cipher.update(f.read(index_len))
+    cipher.verify(tag)
+    return key, json.loads(index.decode("utf-8"))["entries"]
+def read_entry(f, key: bytes, entry: dict, backend) -> bytes:
+    """随机读取并校验单个条目"""
+    f.seek(entry["offset"])
+    cipher = backend.decryptor(ALGORITHM, key, bytes.fromhex(entry["nonce"]), entry["path"].encode("utf-8"))
+    data = cipher.update(f.read(entry["length"]))
+    cipher.verify(bytes.fromhex(entry["tag"]))
+    return data
+def entry_target(base_dir: str, rel: str) -> str:
+    """条目路径转为 base_dir 下的目标路径，拒绝越出 base_dir 的路径"""
+    target = os.path.normpath(os.path.join(base_dir, *rel.split("/")))
+    if os.path.isabs(rel) or os.path.commonpath([os.path.abspath(base_dir), os.path.abspath(target)]) != os.path.abspath(base_dir):
+        raise ValueError(f"unsafe entry path {rel!r}")
+    return target
+def write_entry(target: str, data: bytes, entry: dict) -> None:
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp_path = target + TMP_SUFFIX
+    with open(tmp_path, "wb") as f_out:
+        f_out.write(data)
+    os.chmod(tmp_path, entry["mode"])
+    os.replace(tmp_path, target)
+    os.utime(target, (entry["atime"], entry["mtime"]))
+def unpack_container(container: str, password: str, backend) -> int:
+    """还原容器内所有条目到容器所在目录，成功后删除容器，返回条目数"""
+    base_dir = os.path.dirname(container)
+    with open(container, "rb") as f:
+        key, entries = open_pack(f, password, backend)
+        for entry in entries:
+            write_entry(entry_target(base_dir, entry["path"]), read_entry(f, key, entry, backend), entry)
+    os.remove(container)
+    print(f"[Unpacked] {container} ({len(entries)} files)")
+    return len(entries)
+def run_pack(directory: str, password: str, backend, max_workers: int) -> int:
+    """并行打包小文件，每组一个容器，返回打包的文件数"""
+    groups = plan_packs(directory)
+    stamp = f"{datetime.now():%Y%m%d_%H%M%S}"
+    print(f"Packing {sum(len(g) for g in groups)} small files into {len(groups)} container(s)...")
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for i, group in enumerate(groups, 1):
+            container = os.path.join(directory, f"pack_{stamp}_{i:05d}{PACK_SUFFIX}")
+            futures[executor.submit(pack_files, container, directory, group, password, backend)] = container
+        for fut in as_completed(futures):
+            try:
+                count += len(fut.result())
+            except Exception as ex:
+                with failure_lock:
+                    failures.append((futures[fut], str(ex)))
+    return count
+def run_unpack(directory: str, password: str, backend, max_workers: int) -> int:
+    """并行还原目录下所有容器，返回还原的文件数"""
+    containers = [os.path.join(d, f) for d, _, fs in os.walk(directory) for f in fs if f.endswith(PACK_SUFFIX)]
+    print(f"Unpacking {len(containers)} container(s)...")
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(unpack_container, c, password, backend): c for c in containers}
+        for fut in as_completed(futures):
+            try:
+                count += fut.result()
+            except Exception as ex:
+                with failure_lock:
+                    failures.append((futures[fut], str(ex)))
+    return count
+def list_or_extract(container: str, password: str, backend, entry_path=None, out_dir: str = ".") -> None:
+    """--list / --extract：只读索引，按需随机读取单个条目"""
+    with open(container, "rb") as f:
+        key, entries = open_pack(f, password, backend)
+        if entry_path is None:
+            for e in entries:
+                print(f"{e['length']:>12}  {datetime.fromtimestamp(e['mtime']):%Y-%m-%d %H:%M:%S}  {e['path']}")
+            print(f"{len(entries)} entries")
+            return
+        for e in entries:
+            if e["path"] == entry_path.replace(os.sep, "/"):
+                target = entry_target(out_dir, e["path"])
+                write_entry(target, read_entry(f, key, e, backend), e)
+                print(f"[Extracted] {target}")
+                return
+    raise ValueError(f"entry {entry_path!r} not found in {container}")
 def write_log(entries, log_path):
     """将失败信息写入日志文件"""
     with open(log_path, "w", encoding="utf-8") as f:
@@ -105,21 +539,73 @@ def write_log(entries, log_path):
         for path, err in entries:
             f.write(f"{path} : {err}\n")
 def main():
+    parser = argparse.ArgumentParser(description="Batch AES-256-GCM Multi-threaded Tool")
+    parser.add_argument("--backend", default="auto", choices=["auto"] + cipher_backends.names(),
+                        help="cipher backend; auto benchmarks the available ones and picks the fastest")
+    parser.add_argument("--legacy", action="store_true",
+                        help="also decrypt/verify files without the BATCHGCM header (written by older versions)")
+    parser.add_argument("--compress", default="none", choices=compress_stage.available(),
+                        help="compress before encrypting (files that look incompressible are stored as is)")
+    parser.add_argument("--key-handle", default=None, metavar="NAME",
+                        help="get keys from the local key agent (key_agent.py) instead of a password")
+    parser.add_argument("--agent-socket", default=None, help="key agent socket path")
+    parser.add_argument("--list", metavar="PACK", help="list the entries of a .bgcmpack container")
+    parser.add_argument("--extract", nargs=2, metavar=("PACK", "ENTRY"),
+                        help="extract a single entry from a .bgcmpack container")
+    parser.add_argument("--out", default=".", help="output directory for --extract (default: current)")
+    args = parser.parse_args()
     print("=== Batch AES-256-GCM Multi-threaded Tool ===")
+    try:
+        backend = cipher_backends.select(ALGORITHM, args.backend)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    print(f"Cipher backend: {backend.name}")
+    if args.list or args.extract:
+        password = get_password(args)
+        try:
+            if args.list:
+                list_or_extract(args.list, password, backend)
+            else:
+                list_or_extract(args.extract[0], password, backend, args.extract[1], args.out)
+        except (OSError, ValueError) as ex:
+            print(f"Error: {ex}")
+            sys.exit(1)
+        return
     choice = ""
-    while choice not in ("1", "2"):
+    while choice not in ("1", "2", "3", "4", "5"):
         print("1) Encrypt")
         print("2) Decrypt")
-        choice = input("Select 1 or 2: ").strip()
-    mode = "encrypt" if choice == "1" else "decrypt"
+        print("3) Verify only (writes nothing)")
+        print("4) Pack small files into encrypted containers")
+        print("5) Unpack containers")
+        choice = input("Select 1-5: ").strip()
+    mode = {"1": "encrypt", "2": "decrypt", "3": "verify", "4": "pack", "5": "unpack"}[choice]
     directory = ""
     while not os.path.isdir(directory := input("Directory to process: ").strip()):
         print("Invalid directory, try again.")
-    password = ""
-    while not password:
-        password = input("Password: ").strip()
+    password = get_password(args)
     max_workers = min(32, (os.cpu_count() or 1) * 2)
-    tasks = collect_tasks(directory, mode, password)
+    if mode == "verify":
+        sys.exit(1 if run_verify(directory, password, backend, args.legacy, max_workers) else 0)
+    if mode in ("pack", "unpack"):
+        start = time.time()
+        run = run_pack if mode == "pack" else run_unpack
+        count = run(directory, password, backend, max_workers)
+        elapsed = time.time() - start
+        print(f"\n{mode.capitalize()}ed {count} files in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} files/s)")
+        if skipped:
+            print(f"{len(skipped)} file(s) skipped (already encrypted).")
+        for p, e in failures:
+            print(f"  {p} -> {e}")
+        sys.exit(1 if failures else 0)
+    removed = cleanup_stale_tmp(directory)
+    if removed:
+        print(f"Removed {removed} stale temporary file(s) from an interrupted run.")
+    journal = RunJournal(directory, mode)
+    if journal.done:
+        print(f"Resuming: {len(journal.done)} file(s) already done in a previous run.")
+    tasks = collect_tasks(directory, mode, password, backend, journal, args.legacy, args.compress)
     print(f"Found {len(tasks)} files, starting with {max_workers} threads...")
     start = time.time()
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -127,7 +613,11 @@ def main():
         for _ in as_completed(futures):  # 这里的下划线 '_' 也是英文字符
             pass
     elapsed = time.time() - start
+    journal.close(remove=not failures)
     print(f"\nCompleted in {elapsed:.2f}s")
+    if skipped:
+        reason = "already encrypted" if mode == "encrypt" else "not encrypted"
+        print(f"{len(skipped)} file(s) skipped ({reason}).")
     if failures:
         print(f"{len(failures)} file(s) failed:")
         for p, e in failures:
@@ -136,6 +626,7 @@ def main():
                                 f"batch_gcm_errors_{mode}_{datetime.now():%Y%m%d_%H%M%S}.log")
         write_log(failures, log_file)
         print(f"See log: {log_file}")
+        print(f"Re-run in {mode} mode to retry; finished files are recorded in {journal.path}")
     else:
         print("All done successfully.")
 if __name__ == "__main__":
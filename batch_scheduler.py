@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+batch_scheduler.py
+加密工具共用的内存预算调度器。任务按文件大小从大到小排序（最长处理时间优先，
+缩短总耗时），只有在途任务的估算内存之和不超过预算时才提交新任务；
+单个任务超出预算时在没有其他在途任务时单独运行。结束后可报告峰值 RSS 与单文件耗时。
+用法:
+    sched = BudgetScheduler(executor, budget, cost=lambda size: ...)
+    for item, result, error in sched.run(func, items, sizes, *extra_args):
+        ...
+    print(sched.report())
+"""
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+try:
+    import resource
+except ImportError:                    # Windows 没有 resource 模块
+    resource = None
+
+DEFAULT_BUDGET_MB = 512
+
+def _timed(func, item, args):
+    # 在工作者内计时，排除排队等待时间
+    start = time.perf_counter()
+    result = func(item, *args)
+    return time.perf_counter() - start, result
+
+def peak_rss():
+    """返回本进程与已回收子进程中最大的峰值 RSS（字节），不支持时返回 None"""
+    if resource is None:
+        return None
+    unit = 1 if sys.platform == "darwin" else 1024       # macOS 单位为字节，Linux 为 KB
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * unit
+
+class BudgetScheduler:
+    def __init__(self, executor, budget, cost):
+        self.executor = executor
+        self.budget = budget           # 字节
+        self.cost = cost               # 文件大小 -> 估算内存占用
+        self.latencies = []            # [(item, 秒)]
+
+    def run(self, func, items, sizes, *args):
+        """按预算提交 func(item, *args)，逐个产出 (item, result, error)"""
+        pending = sorted(items, key=lambda it: sizes.get(it, 0), reverse=True)
+        pending.reverse()              # 列表末尾是最大的文件，pop() 为 O(1)
+        running = {}                   # future -> (item, cost)
+        in_use = 0
+        while pending or running:
+            while pending:
+                item = pending[-1]
+                need = self.cost(sizes.get(item, 0))
+                if running and in_use + need > self.budget:
+                    break
+                pending.pop()
+                running[self.executor.submit(_timed, func, item, args)] = (item, need)
+                in_use += need
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item, need = running.pop(fut)
+                in_use -= need
+                try:
+                    elapsed, result = fut.result()
+                except Exception as e:
+                    yield item, None, e
+                    continue
+                self.latencies.append((item, elapsed))
+                yield item, result, None
+
+    def report(self, slowest=5):
+        """返回汇总报告文本：峰值 RSS 与单文件耗时分布"""
+        lines = []
+        rss = peak_rss()
+        if rss is not None:
+            lines.append(f"峰值 RSS: {rss / 1048576:.1f} MB（预算 {self.budget / 1048576:.0f} MB）")
+        if self.latencies:
+            times = sorted(t for _, t in self.latencies)
+            n = len(times)
+            lines.append(f"单文件耗时: 平均 {sum(times) / n:.3f}s  中位 {times[n // 2]:.3f}s  "
+                         f"P95 {times[min(n - 1, int(n * 0.95))]:.3f}s  最大 {times[-1]:.3f}s")
+            lines.append("最慢的文件:")
+            for item, t in sorted(self.latencies, key=lambda x: x[1], reverse=True)[:slowest]:
+                lines.append(f"  {t:8.3f}s  {item}")
+        return "\n".join(lines)
+
+def file_sizes(paths):
+    """一次性 stat 所有文件，无法访问的按 0 处理（由任务本身报告错误）"""
+    sizes = {}
+    for p in paths:
+        try:
+            sizes[p] = os.path.getsize(p)
+        except OSError:
+            sizes[p] = 0
+    return sizes
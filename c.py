@@ -2,12 +2,13 @@ import os
 import sqlite3
 import uuid
 from flask import (
-    Flask, g, render_template_string,
+    Flask, g, render_template,
     request, redirect, url_for,
     session, flash, send_from_directory, abort, jsonify
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from jinja2 import DictLoader
 
 # ---------- 配置 ----------
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -60,7 +61,7 @@ BASE_HTML = """
       {% endfor %}
     {% endif %}
   {% endwith %}
-  {{ body }}
+  {% block body %}{% endblock %}
 </div>
 <ul id="ctx-menu"><li onclick="doDelete()">删除</li></ul>
 <script>
@@ -113,6 +114,68 @@ function onDrop(e){
 </body></html>
 """
 
+# 页面模板启动时注册到 Jinja 环境，按名称编译一次后缓存，请求时不再重复编译
+TEMPLATES = {
+    'base.html': BASE_HTML,
+    'register.html': """{% extends "base.html" %}{% block body %}
+    <h2>注册</h2><form method="post">
+      <input name="username" placeholder="用户名" class="form-control mb-2">
+      <input name="password" placeholder="密码" type="password" class="form-control mb-2">
+      <button class="btn btn-primary">注册</button>
+    </form>
+    {% endblock %}""",
+    'login.html': """{% extends "base.html" %}{% block body %}
+    <h2>登录</h2><form method="post">
+      <input name="username" placeholder="用户名" class="form-control mb-2">
+      <input name="password" placeholder="密码" type="password" class="form-control mb-2">
+      <button class="btn btn-primary">登录</button>
+    </form>
+    {% endblock %}""",
+    'index.html': """{% extends "base.html" %}{% block body %}
+    <h3>
+      {% if cur %}<a href="{{url_for('index',folder_id=cur['parent_id'])}}">← 上级</a>{{cur['name']}}
+      {% else %}根目录{% endif %}
+    </h3>
+    <form class="d-flex mb-3" method="post"
+          action="{{url_for('create_folder',parent_id=folder_id)}}">
+      <input name="name" placeholder="新建文件夹" class="form-control me-2">
+      <button class="btn btn-primary">创建</button>
+    </form>
+    <form class="d-flex mb-3" method="post" enctype="multipart/form-data"
+          action="{{url_for('upload',folder_id=folder_id)}}">
+      <input type="file" name="file" class="form-control me-2">
+      <button class="btn btn-success">上传</button>
+    </form>
+    <table class="table">
+      <tr><th>类型</th><th>名称</th><th>操作</th></tr>
+      {% for f in folders %}
+      <tr draggable="true" data-id="{{f['id']}}" data-type="folder"
+          ondragstart="onDragStart(event)"
+          oncontextmenu="showMenu(event,{{f['id']}},'folder')"
+          ondragover="onDragOver(event)" ondragleave="onDragLeave(event)"
+          ondrop="onDrop(event)">
+        <td>📁</td>
+        <td><a href="{{url_for('index',folder_id=f['id'])}}">{{f['name']}}</a></td>
+        <td></td>
+      </tr>
+      {% endfor %}
+      {% for f in files %}
+      <tr draggable="true" data-id="{{f['id']}}" data-type="file"
+          ondragstart="onDragStart(event)"
+          oncontextmenu="showMenu(event,{{f['id']}},'file')">
+        <td>📄</td>
+        <td>{{f['filename']}}</td>
+        <td>
+          <a class="btn btn-sm btn-outline-primary"
+             href="{{url_for('download',file_id=f['id'])}}">下载</a>
+        </td>
+      </tr>
+      {% endfor %}
+    </table>
+        {% endblock %}""",
+}
+app.jinja_loader = DictLoader(TEMPLATES)
+
 # ---------- DB 操作 ----------
 def get_db():
     if 'db' not in g:
@@ -161,13 +224,7 @@ def register():
             c.execute("INSERT INTO user(name,pwd) VALUES(?,?)",
                       (name, generate_password_hash(pwd)))
             db.commit(); flash('注册成功','success'); return redirect(url_for('login'))
-    body="""
-    <h2>注册</h2><form method="post">
-      <input name="username" placeholder="用户名" class="form-control mb-2">
-      <input name="password" placeholder="密码" type="password" class="form-control mb-2">
-      <button class="btn btn-primary">注册</button>
-    </form>"""
-    return render_template_string(BASE_HTML, body=body)
+    return render_template('register.html')
 
 @app.route('/login', methods=('GET','POST'))
 def login():
@@ -179,13 +236,7 @@ def login():
             session['user_id'],session['username']=user['id'],user['name']
             return redirect(url_for('index'))
         flash('登录失败','danger')
-    body="""
-    <h2>登录</h2><form method="post">
-      <input name="username" placeholder="用户名" class="form-control mb-2">
-      <input name="password" placeholder="密码" type="password" class="form-control mb-2">
-      <button class="btn btn-primary">登录</button>
-    </form>"""
-    return render_template_string(BASE_HTML, body=body)
+    return render_template('login.html')
 
 @app.route('/logout')
 def logout():
@@ -213,49 +264,7 @@ def index(folder_id):
         ("folder_id=?" if folder_id else "folder_id IS NULL"),
         (uid,folder_id) if folder_id else (uid,)
     ).fetchall()
-    body=render_template_string("""
-    <h3>
-      {% if cur %}<a href="{{url_for('index',folder_id=cur['parent_id'])}}">← 上级</a>{{cur['name']}}
-      {% else %}根目录{% endif %}
-    </h3>
-    <form class="d-flex mb-3" method="post"
-          action="{{url_for('create_folder',parent_id=folder_id or '')}}">
-      <input name="name" placeholder="新建文件夹" class="form-control me-2">
-      <button class="btn btn-primary">创建</button>
-    </form>
-    <form class="d-flex mb-3" method="post" enctype="multipart/form-data"
-          action="{{url_for('upload',folder_id=folder_id or '')}}">
-      <input type="file" name="file" class="form-control me-2">
-      <button class="btn btn-success">上传</button>
-    </form>
-    <table class="table">
-      <tr><th>类型</th><th>名称</th><th>操作</th></tr>
-      {% for f in folders %}
-      <tr draggable="true" data-id="{{f['id']}}" data-type="folder"
-          ondragstart="onDragStart(event)"
-          oncontextmenu="showMenu(event,{{f['id']}},'folder')"
-          ondragover="onDragOver(event)" ondragleave="onDragLeave(event)"
-          ondrop="onDrop(event)">
-        <td>📁</td>
-        <td><a href="{{url_for('index',folder_id=f['id'])}}">{{f['name']}}</a></td>
-        <td></td>
-      </tr>
-      {% endfor %}
-      {% for f in files %}
-      <tr draggable="true" data-id="{{f['id']}}" data-type="file"
-          ondragstart="onDragStart(event)"
-          oncontextmenu="showMenu(event,{{f['id']}},'file')">
-        <td>📄</td>
-        <td>{{f['filename']}}</td>
-        <td>
-          <a class="btn btn-sm btn-outline-primary"
-             href="{{url_for('download',file_id=f['id'])}}">下载</a>
-        </td>
-      </tr>
-      {% endfor %}
-    </table>
-    """, cur=cur, folders=folders, files=files, folder_id=folder_id)
-    return render_template_string(BASE_HTML, body=body)
+    return render_template('index.html', cur=cur, folders=folders, files=files, folder_id=folder_id)
 
 @app.route('/folder/create', methods=('POST',), defaults={'parent_id':None})
 @app.route('/folder/create/<int:parent_id>', methods=('POST',))
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cipher_backends.py
+加密工具共用的 AEAD 后端注册表。同一算法的所有后端输出逐字节一致，
+启动时做一次短小的微基准测试，自动挑选当前机器上最快的可用实现。
+支持的算法:
+    aes-256-gcm         pycryptodome / cryptography
+    chacha20-poly1305   pycryptodome / cryptography / numpy / pure
+可选依赖（均可缺省，pure 后端始终可用）:
+    pip install pycryptodome cryptography numpy
+用法:
+    backend = select("chacha20-poly1305", "auto")
+    enc = backend.encryptor("chacha20-poly1305", key, nonce, aad)
+    ct = enc.update(data); tag = enc.finalize()
+    dec = backend.decryptor("chacha20-poly1305", key, nonce, aad)
+    pt = dec.update(ct); dec.verify(tag)     # 校验失败抛出 ValueError
+"""
+import hmac
+import struct
+import time
+
+AES_GCM = "aes-256-gcm"
+CHACHA20_POLY1305 = "chacha20-poly1305"
+ALGORITHMS = (AES_GCM, CHACHA20_POLY1305)
+TAG_SIZE = 16
+BENCH_SIZE = 4096                      # 微基准每轮数据量
+BENCH_SECONDS = 0.02                   # 每个后端的测量时长上限
+
+# ======= Poly1305 / ChaCha20 纯 Python 基础实现 =======
+
+def _pad16(n):
+    return b"\x00" * ((16 - n % 16) % 16)
+
+class _Poly1305:
+    """增量式 Poly1305，接口与 cryptography 的 Poly1305 一致（update/finalize）"""
+    P = (1 << 130) - 5
+
+    def __init__(self, one_time_key):
+        r = int.from_bytes(one_time_key[:16], "little")
+        self.r = r & 0x0ffffffc0ffffffc0ffffffc0fffffff     # 按规范裁剪 r
+        self.s = int.from_bytes(one_time_key[16:32], "little")
+        self.acc = 0
+        self.buf = b""
+
+    def update(self, data):
+        if self.buf:
+            data = self.buf + data
+        full = len(data) - len(data) % 16
+        acc, r, p = self.acc, self.r, self.P
+        for i in range(0, full, 16):
+            acc = (acc + int.from_bytes(data[i:i+16], "little") + (1 << 128)) * r % p
+        self.acc = acc
+        self.buf = bytes(data[full:])
+
+    def finalize(self):
+        acc = self.acc
+        if self.buf:
+            acc = (acc + int.from_bytes(self.buf + b"\x01", "little")) * self.r % self.P
+        return ((acc + self.s) & ((1 << 128) - 1)).to_bytes(16, "little")
+
+def _rotl32(v, c):
+    return ((v << c) & 0xffffffff) | (v >> (32 - c))
+
+def _quarter_round(w, a, b, c, d):
+    w[a] = (w[a] + w[b]) & 0xffffffff; w[d] = _rotl32(w[d] ^ w[a], 16)
+    w[c] = (w[c] + w[d]) & 0xffffffff; w[b] = _rotl32(w[b] ^ w[c], 12)
+    w[a] = (w[a] + w[b]) & 0xffffffff; w[d] = _rotl32(w[d] ^ w[a], 8)
+    w[c] = (w[c] + w[d]) & 0xffffffff; w[b] = _rotl32(w[b] ^ w[c], 7)
+
+def _pure_keystream(key, nonce, counter, blocks):
+    head = list(struct.unpack("<12I", b"expand 32-byte k" + key))
+    tail = list(struct.unpack("<3I", nonce))
+    out = []
+    for i in range(blocks):
+        state = head + [(counter + i) & 0xffffffff] + tail
+        w = state[:]
+        for _ in range(10):
+            _quarter_round(w, 0, 4, 8, 12); _quarter_round(w, 1, 5, 9, 13)
+            _quarter_round(w, 2, 6, 10, 14); _quarter_round(w, 3, 7, 11, 15)
+            _quarter_round(w, 0, 5, 10, 15); _quarter_round(w, 1, 6, 11, 12)
+            _quarter_round(w, 2, 7, 8, 13); _quarter_round(w, 3, 4, 9, 14)
+        out.append(struct.pack("<16I", *[(w[j] + state[j]) & 0xffffffff for j in range(16)]))
+    return b"".join(out)
+
+def _numpy_keystream(key, nonce, counter, blocks):
+    import numpy as np
+    # 一次为所有块计算：每一行是 16 个状态字中的一个，每一列是一个块
+    state = np.empty((16, blocks), dtype=np.uint32)
+    state[:12] = np.frombuffer(b"expand 32-byte k" + key, dtype="<u4")[:, None]
+    state[12] = (counter + np.arange(blocks, dtype=np.uint64)).astype(np.uint32)
+    state[13:] = np.frombuffer(nonce, dtype="<u4")[:, None]
+    w = state.copy()
+
+    def qr(a, b, c, d):
+        for x, y, z, n in ((a, b, d, 16), (c, d, b, 12), (a, b, d, 8), (c, d, b, 7)):
+            w[x] += w[y]
+            v = w[z] ^ w[x]
+            w[z] = (v << np.uint32(n)) | (v >> np.uint32(32 - n))
+
+    for _ in range(10):
+        qr(0, 4, 8, 12); qr(1, 5, 9, 13); qr(2, 6, 10, 14); qr(3, 7, 11, 15)
+        qr(0, 5, 10, 15); qr(1, 6, 11, 12); qr(2, 7, 8, 13); qr(3, 4, 9, 14)
+    w += state
+    return np.ascontiguousarray(w.T).astype("<u4").tobytes()
+
+class _ChaChaPolyContext:
+    """基于 keystream 函数与 Poly1305 的流式 ChaCha20-Poly1305（RFC 8439）"""
+
+    def __init__(self, keystream, mac_factory, key, nonce, aad, decrypt):
+        self._keystream = keystream
+        self._key, self._nonce = key, nonce
+        self._decrypt = decrypt
+        self._mac = mac_factory(keystream(key, nonce, 0, 1)[:32])   # counter=0 生成一次性密钥
+        self._mac.update(bytes(aad) + _pad16(len(aad)))
+        self._aad_len = len(aad)
+        self._ct_len = 0
+        self._counter = 1
+        self._rest = b""                                            # 上次剩余的 keystream
+
+    def _xor(self, data):
+        n = len(data)
+        stream = self._rest
+        if n > len(stream):
+            blocks = (n - len(stream) + 63) // 64
+            stream += self._keystream(self._key, self._nonce, self._counter, blocks)
+            self._counter += blocks
+        stream, self._rest = stream[:n], stream[n:]
+        x = int.from_bytes(data, "little") ^ int.from_bytes(stream, "little")
+        return x.to_bytes(n, "little")
+
+    def update(self, data):
+        if self._decrypt:
+            self._mac.update(bytes(data))
+            out = self._xor(data)
+        else:
+            out = self._xor(data)
+            self._mac.update(out)
+        self._ct_len += len(data)
+        return out
+
+    def _tag(self):
+        self._mac.update(_pad16(self._ct_len) + struct.pack("<QQ", self._aad_len, self._ct_len))
+        return self._mac.finalize()
+
+    def finalize(self):
+        return self._tag()
+
+    def verify(self, tag):
+        if not hmac.compare_digest(self._tag(), bytes(tag)):
+            raise ValueError("MAC check failed")
+
+# ======= 后端 =======
+
+class Backend:
+    name = ""
+    native = False                     # 原生实现会释放 GIL，线程池即可并行
+    algorithms = ()
+
+    def encryptor(self, algorithm, key, nonce, aad=b""):
+        raise NotImplementedError
+
+    def decryptor(self, algorithm, key, nonce, aad=b""):
+        raise NotImplementedError
+
+class PureBackend(Backend):
+    name = "pure"
+    algorithms = (CHACHA20_POLY1305,)
+
+    def encryptor(self, algorithm, key, nonce, aad=b""):
+        return _ChaChaPolyContext(_pure_keystream, _Poly1305, key, nonce, aad, False)
+
+    def decryptor(self, algorithm, key, nonce, aad=b""):
+        return _ChaChaPolyContext(_pure_keystream, _Poly1305, key, nonce, aad, True)
+
+class NumpyBackend(Backend):
+    name = "numpy"
+    algorithms = (CHACHA20_POLY1305,)
+
+    def __init__(self):
+        import numpy  # noqa: F401  未安装时抛出 ImportError
+
+    def encryptor(self, algorithm, key, nonce, aad=b""):
+        return _ChaChaPolyContext(_numpy_keystream, _Poly1305, key, nonce, aad, False)
+
+    def decryptor(self, algorithm, key, nonce, aad=b""):
+        return _ChaChaPolyContext(_numpy_keystream, _Poly1305, key, nonce, aad, True)
+
+class _PycryptodomeContext:
+    def __init__(self, cipher, decrypt):
+        self._cipher = cipher
+        self.update = cipher.decrypt if decrypt else cipher.encrypt
+
+    def finalize(self):
+        return self._cipher.digest()
+
+    def verify(self, tag):
+        self._cipher.verify(tag)       # 失败时抛出 ValueError
+
+class PycryptodomeBackend(Backend):
+    name = "pycryptodome"
+    native = True
+    algorithms = (AES_GCM, CHACHA20_POLY1305)
+
+    def __init__(self):
+        from Crypto.Cipher import AES, ChaCha20_Poly1305
+        self._aes, self._chacha = AES, ChaCha20_Poly1305
+
+    def _new(self, algorithm, key, nonce, aad, decrypt):
+        if algorithm == AES_GCM:
+            cipher = self._aes.new(key, self._aes.MODE_GCM, nonce=nonce)
+        else:
+            cipher = self._chacha.new(key=key, nonce=nonce)
+        if aad:
+            cipher.update(aad)
+        return _PycryptodomeContext(cipher, decrypt)
+
+    def encryptor(self, algorithm, key, nonce, aad=b""):
+        return self._new(algorithm, key, nonce, aad, False)
+
+    def decryptor(self, algorithm, key, nonce, aad=b""):
+        return self._new(algorithm, key, nonce, aad, True)
+
+class _CryptographyGcmContext:
+    def __init__(self, ctx):
+        self._ctx = ctx
+        self.update = ctx.update
+
+    def finalize(self):
+        self._ctx.finalize()
+        return self._ctx.tag
+
+    def verify(self, tag):
+        from cryptography.exceptions import InvalidTag
+        try:
+            self._ctx.finalize_with_tag(tag)
+        except InvalidTag:
+            raise ValueError("MAC check failed")
+
+class CryptographyBackend(Backend):
+    name = "cryptography"
+    native = True
+    algorithms = (AES_GCM, CHACHA20_POLY1305)
+
+    def __init__(self):
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        from cryptography.hazmat.primitives.poly1305 import Poly1305
+        self._cipher, self._algorithms, self._modes = Cipher, algorithms, modes
+        self._poly1305 = Poly1305
+
+    def _chacha_keystream(self, key, nonce, counter, blocks):
+        # cryptography 的 ChaCha20 nonce 为 16 字节：4 字节计数器 || 12 字节 nonce
+        full_nonce = struct.pack("<I", counter) + nonce
+        enc = self._cipher(self._algorithms.ChaCha20(key, full_nonce), mode=None).encryptor()
+        return enc.update(b"\x00" * (64 * blocks))
+
+    def _gcm(self, key, nonce, aad, decrypt):
+        cipher = self._cipher(self._algorithms.AES(key), self._modes.GCM(nonce))
+        ctx = cipher.decryptor() if decrypt else cipher.encryptor()
+        if aad:
+            ctx.authenticate_additional_data(aad)
+        return _CryptographyGcmContext(ctx)
+
+    def encryptor(self, algorithm, key, nonce, aad=b""):
+        if algorithm == AES_GCM:
+            return self._gcm(key, nonce, aad, False)
+        return _ChaChaPolyContext(self._chacha_keystream, self._poly1305, key, nonce, aad, False)
+
+    def decryptor(self, algorithm, key, nonce, aad=b""):
+        if algorithm == AES_GCM:
+            return self._gcm(key, nonce, aad, True)
+        return _ChaChaPolyContext(self._chacha_keystream, self._poly1305, key, nonce, aad, True)
+
+# ======= 注册表与自动选择 =======
+
+_REGISTRY = {}                         # name -> Backend 子类，按注册顺序即优先级
+_instances = {}
+
+def register(cls):
+    _REGISTRY[cls.name] = cls
+    return cls
+
+for _cls in (PycryptodomeBackend, CryptographyBackend, NumpyBackend, PureBackend):
+    register(_cls)
+
+def names():
+    return list(_REGISTRY)
+
+def get(name, algorithm=None):
+    """按名称取得后端实例；依赖缺失或不支持该算法时抛出 ValueError"""
+    if name not in _REGISTRY:
+        raise ValueError(f"未知后端: {name}（可选: {', '.join(_REGISTRY)}）")
+    if name not in _instances:
+        try:
+            _instances[name] = _REGISTRY[name]()
+        except ImportError as e:
+            raise ValueError(f"后端 {name} 不可用: {e}")
+    backend = _instances[name]
+    if algorithm is not None and algorithm not in backend.algorithms:
+        raise ValueError(f"后端 {name} 不支持 {algorithm}")
+    return backend
+
+def available(algorithm):
+    result = []
+    for name in _REGISTRY:
+        try:
+            result.append(get(name, algorithm))
+        except ValueError:
+            continue
+    return result
+
+def benchmark(backend, algorithm):
+    """返回该后端的加密吞吐量（字节/秒）"""
+    key, nonce, data = b"\x01" * 32, b"\x02" * 12, b"\x03" * BENCH_SIZE
+    done = 0
+    start = time.perf_counter()
+    while True:
+        enc = backend.encryptor(algorithm, key, nonce)
+        enc.update(data)
+        enc.finalize()
+        done += len(data)
+        elapsed = time.perf_counter() - start
+        if elapsed >= BENCH_SECONDS:
+            return done / elapsed
+
+def select(algorithm, name="auto"):
+    """name 为 auto 时对所有可用后端做微基准并选出最快者，否则直接返回指定后端"""
+    if name != "auto":
+        return get(name, algorithm)
+    candidates = available(algorithm)
+    if not candidates:
+        raise ValueError(f"没有可用于 {algorithm} 的后端")
+    if len(candidates) == 1:
+        return candidates[0]
+    return max(candidates, key=lambda b: benchmark(b, algorithm))
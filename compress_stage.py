@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+compress_stage.py
+加密工具共用的可选压缩阶段（先压缩、后加密）。
+支持的编码:
+    none / zlib / lzma（标准库）/ zstd（Python 3.14 的 compression.zstd 或 pip install zstandard）
+写入前对首块数据做熵采样，接近随机的数据（jpg/mp4/zip 等）直接跳过压缩。
+解压按块进行，单次输出不超过 OUTPUT_LIMIT，压缩炸弹也不会占满内存。
+用法:
+    codec = choose_codec("zlib", first_chunk)      # 不值得压缩时返回 "none"
+    comp = Compressor(codec); out = comp.compress(data) ... comp.flush()
+    dec = StreamDecompressor(codec)
+    for piece in dec.feed(data): ...
+    dec.finish()                                   # 数据不完整时抛出 ValueError
+"""
+import collections
+import lzma
+import math
+import zlib
+
+try:
+    from compression import zstd as _zstd_std        # Python 3.14+
+except ImportError:
+    _zstd_std = None
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+CODEC_IDS = {"none": 0, "zlib": 1, "lzma": 2, "zstd": 3}     # 写入文件头的编号，不可更改
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+ENTROPY_THRESHOLD = 7.5                # 每字节比特数，高于此值视为不可压缩
+SAMPLE_SIZE = 64 * 1024
+OUTPUT_LIMIT = 1024 * 1024             # 解压时单次输出上限
+
+def available():
+    names = ["none", "zlib", "lzma"]
+    if _zstd_std is not None or _zstandard is not None:
+        names.append("zstd")
+    return names
+
+def entropy(sample):
+    """Shannon 熵，单位为 比特/字节"""
+    if not sample:
+        return 0.0
+    n = len(sample)
+    return -sum(c / n * math.log2(c / n) for c in collections.Counter(sample).values())
+
+def choose_codec(codec, first_chunk):
+    """根据首块数据的熵决定是否真正压缩"""
+    if codec == "none" or not first_chunk or entropy(first_chunk[:SAMPLE_SIZE]) > ENTROPY_THRESHOLD:
+        return "none"
+    return codec
+
+class Compressor:
+    def __init__(self, codec):
+        if codec not in CODEC_IDS:
+            raise ValueError(f"未知压缩编码: {codec}")
+        self.codec = codec
+        if codec == "zlib":
+            self._obj = zlib.compressobj(6)
+        elif codec == "lzma":
+            self._obj = lzma.LZMACompressor()
+        elif codec == "zstd":
+            if _zstd_std is not None:
+                self._obj = _zstd_std.ZstdCompressor()
+            elif _zstandard is not None:
+                self._obj = _zstandard.ZstdCompressor().compressobj()
+            else:
+                raise ValueError("zstd 不可用，请安装 zstandard")
+        else:
+            self._obj = None
+
+    def compress(self, data):
+        return self._obj.compress(data) if self._obj is not None else bytes(data)
+
+    def flush(self):
+        return self._obj.flush() if self._obj is not None else b""
+
+class StreamDecompressor:
+    def __init__(self, codec):
+        if isinstance(codec, int):
+            if codec not in CODEC_NAMES:
+                raise ValueError(f"未知压缩编码编号: {codec}")
+            codec = CODEC_NAMES[codec]
+        self.codec = codec
+        self._done = codec == "none"
+        if codec == "zlib":
+            self._obj = zlib.decompressobj()
+        elif codec == "lzma":
+            self._obj = lzma.LZMADecompressor()
+        elif codec == "zstd":
+            if _zstd_std is not None:
+                self._obj = _zstd_std.ZstdDecompressor()
+            elif _zstandard is not None:
+                self._obj = _zstandard.ZstdDecompressor().decompressobj()
+            else:
+                raise ValueError("zstd 不可用，请安装 zstandard")
+        else:
+            self._obj = None
+
+    def feed(self, data):
+        """逐段产出解压结果，每段不超过 OUTPUT_LIMIT（zstandard 除外）"""
+        if self.codec == "none":
+            if data:
+                yield bytes(data)
+        elif self.codec == "zlib":
+            out = self._obj.decompress(data, OUTPUT_LIMIT)
+            while out:
+                yield out
+                out = self._obj.decompress(self._obj.unconsumed_tail, OUTPUT_LIMIT)
+            self._done = self._obj.eof
+        elif self.codec == "lzma" or _zstd_std is not None:
+            if self._obj.eof:
+                return
+            out = self._obj.decompress(data, max_length=OUTPUT_LIMIT)
+            while True:
+                if out:
+                    yield out
+                if self._obj.eof or self._obj.needs_input:
+                    break
+                out = self._obj.decompress(b"", max_length=OUTPUT_LIMIT)
+            self._done = self._obj.eof
+        else:
+            out = self._obj.decompress(data)
+            if out:
+                yield out
+            self._done = self._obj.eof
+
+    def finish(self):
+        if not self._done:
+            raise ValueError("压缩数据不完整")
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+key_agent.py
+加密工具共用的本地密钥代理（类似 ssh-agent）。守护进程通过 Unix socket 提供服务，
+口令和派生出的密钥保存在 mlock 锁定、不进入 core dump 的内存区中，到期（TTL）后清零。
+工具用 --key-handle NAME 向代理请求密钥，同一口令/盐的 PBKDF2 只计算一次，
+重复运行（例如 cron 任务）不再有密钥派生延迟，也不需要在命令行或脚本里写口令。
+每次运行都生成新随机盐的工具（batch_gcm_tool_mt.py）可以向代理要一个按句柄固定的盐：
+句柄存活期间各次运行使用同一个盐，PBKDF2 只做一次；句柄删除、过期或重新录入后换新盐。
+仅支持 Linux/macOS 等提供 AF_UNIX 的平台。
+用法:
+    python key_agent.py serve [--ttl 3600] &      # 启动代理
+    python key_agent.py add backup [--ttl 600]    # 录入口令（交互输入），句柄名为 backup
+    python key_agent.py list | remove backup | stop
+    python 透明模式.py --key-handle backup
+    python batch_gcm_tool_mt.py --key-handle backup
+socket 路径默认为 $XDG_RUNTIME_DIR/file-cipher-agent.sock，可用环境变量 FILE_CIPHER_AGENT_SOCK 覆盖。
+"""
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import getpass
+import hashlib
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_TTL = 3600
+ARENA_SIZE = 64 * 1024                 # 锁定内存区大小，默认 RLIMIT_MEMLOCK 通常足够
+SLOT_SIZE = 256                        # 每个槽位：1 字节长度 + 最多 255 字节数据
+MAX_REQUEST = 64 * 1024
+MAX_KEYS_PER_HANDLE = 16               # 每个句柄缓存的派生密钥数，超出时按 LRU 淘汰并清零槽位
+# 只接受工具实际使用的 PBKDF2 参数，防止代理被当作低迭代次数的口令猜测器
+ALLOWED_HASHES = {"sha1", "sha256", "sha512"}
+ALLOWED_ENCODINGS = {"utf-8", "latin-1"}
+ALLOWED_DKLEN = {16, 24, 32}
+MIN_ITERATIONS = 100000
+MAX_ITERATIONS = 10000000
+MIN_SALT_SIZE = 8
+MAX_SALT_SIZE = 64
+
+class AgentError(Exception):
+    pass
+
+def default_socket_path():
+    env = os.environ.get("FILE_CIPHER_AGENT_SOCK")
+    if env:
+        return env
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    name = "file-cipher-agent.sock" if os.environ.get("XDG_RUNTIME_DIR") else f"file-cipher-agent-{os.getuid()}.sock"
+    return os.path.join(base, name)
+
+# ======= 锁定内存 =======
+
+def _libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+
+class LockedStore:
+    """mlock 锁定的匿名内存区，按固定大小槽位存放秘密数据，释放时清零"""
+
+    def __init__(self, size=ARENA_SIZE):
+        self.mm = mmap.mmap(-1, size)
+        self.free = list(range(size // SLOT_SIZE))
+        self.lock = threading.Lock()
+        self.locked = False
+        libc = _libc()
+        if libc is not None:
+            addr = ctypes.addressof(ctypes.c_char.from_buffer(self.mm))
+            self.locked = libc.mlock(ctypes.c_void_p(addr), ctypes.c_size_t(size)) == 0
+        if hasattr(mmap, "MADV_DONTDUMP"):
+            self.mm.madvise(mmap.MADV_DONTDUMP)
+
+    def put(self, data):
+        if len(data) >= SLOT_SIZE:
+            raise AgentError(f"秘密数据过长（最多 {SLOT_SIZE - 1} 字节）")
+        with self.lock:
+            if not self.free:
+                raise AgentError("锁定内存区已满")
+            slot = self.free.pop()
+        off = slot * SLOT_SIZE
+        self.mm[off] = len(data)
+        self.mm[off + 1:off + 1 + len(data)] = data
+        return slot
+
+    def get(self, slot):
+        off = slot * SLOT_SIZE
+        return self.mm[off + 1:off + 1 + self.mm[off]]
+
+    def release(self, slot):
+        off = slot * SLOT_SIZE
+        self.mm[off:off + SLOT_SIZE] = b"\x00" * SLOT_SIZE
+        with self.lock:
+            self.free.append(slot)
+
+# ======= 服务端 =======
+
+class KeyAgent:
+    def __init__(self, default_ttl=DEFAULT_TTL):
+        self.default_ttl = default_ttl
+        self.store = LockedStore()
+        # handle -> {"slot", "expires", "keys": OrderedDict(参数 -> slot), "salts": {长度 -> 盐}}
+        self.handles = {}
+        self.lock = threading.Lock()
+        self.running = True
+
+    def _forget(self, handle):
+        entry = self.handles.pop(handle, None)
+        if entry is not None:
+            self.store.release(entry["slot"])
+            for slot in entry["keys"].values():
+                self.store.release(slot)
+
+    def reap(self):
+        now = time.time()
+        with self.lock:
+            for handle in [h for h, e in self.handles.items() if e["expires"] <= now]:
+                self._forget(handle)
+
+    def _live(self, handle):
+        entry = self.handles.get(handle)
+        if entry is None or entry["expires"] <= time.time():
+            raise AgentError(f"未知或已过期的句柄: {handle}")
+        return entry
+
+    def derive(self, req):
+        params = (req["hash"], req["encoding"], req["salt"], int(req["iterations"]), int(req["dklen"]))
+        if params[0] not in ALLOWED_HASHES or params[1] not in ALLOWED_ENCODINGS or params[4] not in ALLOWED_DKLEN:
+            raise AgentError("不支持的密钥派生参数")
+        if not MIN_ITERATIONS <= params[3] <= MAX_ITERATIONS:
+            raise AgentError(f"迭代次数必须在 {MIN_ITERATIONS} 到 {MAX_ITERATIONS} 之间")
+        with self.lock:
+            entry = self._live(req["handle"])
+            slot = entry["keys"].get(params)
+            if slot is not None:
+                entry["keys"].move_to_end(params)
+                return self.store.get(slot)
+            password = self.store.get(entry["slot"]).decode("utf-8")
+        key = hashlib.pbkdf2_hmac(params[0], password.encode(params[1]), bytes.fromhex(params[2]),
+                                  params[3], params[4])
+        with self.lock:
+            entry = self._live(req["handle"])
+            keys = entry["keys"]
+            if params not in keys:
+                while len(keys) >= MAX_KEYS_PER_HANDLE:
+                    self.store.release(keys.popitem(last=False)[1])
+                try:
+                    keys[params] = self.store.put(key)
+                except AgentError:
+                    pass               # 锁定内存区已满：本次只返回密钥，不缓存
+        return key
+
+    def salt(self, req):
+        """返回句柄固定的随机盐（不是秘密，不放进锁定内存区）；同一句柄同一长度始终相同"""
+        size = int(req["size"])
+        if not MIN_SALT_SIZE <= size <= MAX_SALT_SIZE:
+            raise AgentError(f"盐长度必须在 {MIN_SALT_SIZE} 到 {MAX_SALT_SIZE} 字节之间")
+        with self.lock:
+            salts = self._live(req["handle"])["salts"]
+            if size not in salts:
+                salts[size] = os.urandom(size)
+            return salts[size]
+
+    def dispatch(self, req):
+        op = req.get("op")
+        if op == "derive":
+            return {"key": self.derive(req).hex()}
+        if op == "salt":
+            return {"salt": self.salt(req).hex()}
+        if op == "add":
+            ttl = int(req.get("ttl") or self.default_ttl)
+            slot = self.store.put(req["password"].encode("utf-8"))
+            with self.lock:
+                self._forget(req["handle"])
+                self.handles[req["handle"]] = {"slot": slot, "expires": time.time() + ttl,
+                                               "keys": collections.OrderedDict(), "salts": {}}
+            return {}
+        if op == "remove":
+            with self.lock:
+                self._forget(req["handle"])
+            return {}
+        if op == "list":
+            now = time.time()
+            with self.lock:
+                return {"handles": {h: {"ttl": int(e["expires"] - now), "keys": len(e["keys"])}
+                                    for h, e in self.handles.items()}}
+        if op == "stop":
+            self.running = False
+            return {}
+        raise AgentError(f"未知操作: {op}")
+
+    def shutdown(self):
+        with self.lock:
+            for handle in list(self.handles):
+                self._forget(handle)
+
+def _peer_uid(conn):
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+    return os.getuid()                 # 其他平台依赖 socket 文件权限 0600
+
+def _handle_conn(agent, conn):
+    with conn:
+        try:
+            if _peer_uid(conn) != os.getuid():
+                raise AgentError("拒绝其他用户的连接")
+            data = b""
+            while not data.endswith(b"\n") and len(data) < MAX_REQUEST:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            resp = agent.dispatch(json.loads(data.decode("utf-8")))
+            resp["ok"] = True
+        except (AgentError, KeyError, ValueError, TypeError) as e:
+            resp = {"ok": False, "error": str(e)}
+        conn.sendall(json.dumps(resp).encode("utf-8") + b"\n")
+
+def serve(socket_path, ttl):
+    agent = KeyAgent(ttl)
+    libc = _libc()
+    if libc is not None and sys.platform.startswith("linux"):
+        libc.prctl(4, 0, 0, 0, 0)      # PR_SET_DUMPABLE=0：禁止 core dump 与同用户 ptrace
+    if not agent.store.locked:
+        print("警告: mlock 失败（检查 RLIMIT_MEMLOCK），秘密数据可能被换出到磁盘", file=sys.stderr)
+    if os.path.exists(socket_path):
+        try:
+            request({"op": "list"}, socket_path)
+            raise SystemExit(f"代理已在运行: {socket_path}")
+        except AgentError:
+            os.unlink(socket_path)     # 上次异常退出遗留的 socket
+    old_umask = os.umask(0o177)        # socket 文件权限 0600
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    server.settimeout(1.0)
+    print(f"密钥代理已启动: {socket_path}（默认 TTL {ttl}s）")
+    try:
+        while agent.running:
+            agent.reap()
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            threading.Thread(target=_handle_conn, args=(agent, conn), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        agent.shutdown()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    print("密钥代理已退出")
+
+# ======= 客户端 =======
+
+def request(obj, socket_path=None, timeout=30.0):
+    """发送一个请求并返回响应；代理不可用或返回错误时抛出 AgentError"""
+    path = socket_path or default_socket_path()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(path)
+            conn.sendall(json.dumps(obj).encode("utf-8") + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+    except (OSError, AttributeError) as e:    # AttributeError: 平台没有 AF_UNIX
+        raise AgentError(f"无法连接密钥代理 {path}: {e}")
+    try:
+        resp = json.loads(data.decode("utf-8"))
+    except ValueError:
+        raise AgentError("密钥代理响应无效")
+    if not resp.pop("ok", False):
+        raise AgentError(resp.get("error", "未知错误"))
+    return resp
+
+class AgentKey:
+    """通过代理派生 PBKDF2 密钥，参数需与工具本地的 derive_key 完全一致"""
+
+    def __init__(self, handle, hash_name="sha256", encoding="utf-8", iterations=100000, dklen=32,
+                 socket_path=None):
+        self.handle = handle
+        self.params = {"hash": hash_name, "encoding": encoding, "iterations": iterations, "dklen": dklen}
+        self.socket_path = socket_path
+
+    def derive(self, salt):
+        resp = request(dict(self.params, op="derive", handle=self.handle, salt=bytes(salt).hex()),
+                       self.socket_path)
+        return bytes.fromhex(resp["key"])
+
+    def salt(self, size):
+        """句柄固定的随机盐，供每次运行原本都生成新盐的工具使用"""
+        resp = request({"op": "salt", "handle": self.handle, "size": size}, self.socket_path)
+        return bytes.fromhex(resp["salt"])
+
+def main():
+    parser = argparse.ArgumentParser(description="加密工具的本地密钥代理")
+    parser.add_argument("--socket", default=None, help="Unix socket 路径")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve", help="前台运行代理")
+    p.add_argument("--ttl", type=int, default=DEFAULT_TTL, help="默认口令有效期（秒）")
+    p = sub.add_parser("add", help="录入口令")
+    p.add_argument("handle")
+    p.add_argument("--ttl", type=int, default=None, help="该口令的有效期（秒）")
+    p = sub.add_parser("remove", help="删除口令及其派生密钥")
+    p.add_argument("handle")
+    sub.add_parser("list", help="列出句柄与剩余有效期")
+    sub.add_parser("stop", help="停止代理")
+    args = parser.parse_args()
+    socket_path = args.socket or default_socket_path()
+    if args.cmd == "serve":
+        serve(socket_path, args.ttl)
+        return
+    try:
+        if args.cmd == "add":
+            password = getpass.getpass(f"请输入句柄 {args.handle} 的口令: ")
+            request({"op": "add", "handle": args.handle, "password": password, "ttl": args.ttl}, socket_path)
+        elif args.cmd == "remove":
+            request({"op": "remove", "handle": args.handle}, socket_path)
+        elif args.cmd == "list":
+            for handle, info in sorted(request({"op": "list"}, socket_path)["handles"].items()):
+                print(f"{handle}\t剩余 {info['ttl']}s\t已缓存密钥 {info['keys']} 个")
+        elif args.cmd == "stop":
+            request({"op": "stop"}, socket_path)
+    except AgentError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
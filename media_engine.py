@@ -0,0 +1,1027 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+media_engine.py
+Headless core of 媒体文件整理.py: scan, move/copy, deduplicate and find
+near-duplicate media. Nothing here touches Tk; every function reports
+through a progress callback that receives one message string, so the same
+engine runs under the GUI, on a server, or inside another program.
+Usage:
+    python media_engine.py SRC [SRC ...] --dest DEST [--copy] [--dedupe MODE]
+                           [--dry-run] [--similar] [--quiet]
+    python media_engine.py --apply-review DEST/near_duplicates.csv
+    from media_engine import organize
+    organize([Path('a')], Path('out'), do_copy=True, do_dedupe=True, progress=print)
+"""
+import argparse
+import csv
+import errno
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+try:
+    import fcntl
+except ImportError:                     # Windows: no reflink support
+    fcntl = None
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:                     # near-duplicate detection needs Pillow + NumPy
+    np = None
+    Image = None
+from typing import Callable, List, Optional, Set, Tuple, Dict
+ProgressCallback = Callable[[str], None]
+# -------------------------------------------------------------------
+#   Supported extensions
+# -------------------------------------------------------------------
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.flv', '.wmv', '.m4v', '.webm'}
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.aac', '.flac', '.ogg', '.m4a'}
+# -------------------------------------------------------------------
+#   Hashing parameters
+# -------------------------------------------------------------------
+HASH_BUFFER_SIZE = 1024 * 1024          # read size for full hashes
+PARTIAL_HASH_SIZE = 64 * 1024           # bytes hashed from each end of a file
+HASH_WORKERS = min(32, (os.cpu_count() or 1) * 4)   # hashing is mostly I/O bound
+HASH_CACHE_PATH = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'media_mover' / 'hashes.sqlite3'
+HASH_CACHE_MAX_AGE = 90 * 24 * 3600     # drop cache rows not seen for this long (seconds)
+# -------------------------------------------------------------------
+#   Transfer parameters
+# -------------------------------------------------------------------
+TRANSFER_WORKERS = 4                    # parallel copies (renames are instant anyway)
+COPY_CHUNK = 64 * 1024 * 1024           # bytes per copy_file_range/sendfile call
+PROGRESS_INTERVAL = 2.0                 # seconds between throughput reports
+# -------------------------------------------------------------------
+#   Capture date extraction
+# -------------------------------------------------------------------
+EXIF_READ_SIZE = 64 * 1024              # JPEG headers read to find the Exif segment
+MP4_EXTENSIONS = {'.mp4', '.mov', '.m4v', '.m4a'}
+MP4_MAX_ATOMS = 1024                    # give up on files with absurd atom lists
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+# -------------------------------------------------------------------
+#   Deduplication modes
+# -------------------------------------------------------------------
+DEDUPE_MODES = ('delete', 'hardlink', 'reflink')
+FICLONE = 0x40049409                    # linux/fs.h, supported by btrfs, xfs, bcachefs
+# -------------------------------------------------------------------
+#   Near-duplicate (perceptual hash) parameters
+# -------------------------------------------------------------------
+PERCEPTUAL_ALGORITHMS = ('phash', 'dhash')
+SIMILARITY_RADIUS = 8                   # max Hamming distance of 64-bit hashes
+REVIEW_FILE_NAME = 'near_duplicates.csv'
+# -------------------------------------------------------------------
+#   Utility functions
+# -------------------------------------------------------------------
+def compute_sha256(file_path: Path, chunk_size: int = HASH_BUFFER_SIZE) -> str:
+    """Compute SHA-256 hash of a file in streaming mode."""
+    hasher = hashlib.sha256()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with file_path.open('rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.hexdigest()
+def compute_partial_sha256(file_path: Path, size: int) -> str:
+    """
+    SHA-256 of the first and last PARTIAL_HASH_SIZE bytes.
+    Files no larger than 2 * PARTIAL_HASH_SIZE are hashed whole, so for them
+    the result equals compute_sha256().
+    """
+    with file_path.open('rb', buffering=0) as f:
+        if size <= 2 * PARTIAL_HASH_SIZE:
+            return hashlib.sha256(f.read()).hexdigest()
+        hasher = hashlib.sha256(f.read(PARTIAL_HASH_SIZE))
+        f.seek(-PARTIAL_HASH_SIZE, os.SEEK_END)
+        hasher.update(f.read(PARTIAL_HASH_SIZE))
+    return hasher.hexdigest()
+def hash_parallel(
+        func: Callable[..., str],
+        jobs: List[Tuple[Path, int]],
+        progress: ProgressCallback
+    ) -> Dict[Path, str]:
+    """
+    Run func(path, size) for every job in a thread pool.
+    Files that cannot be read are logged and left out of the result.
+    """
+    results: Dict[Path, str] = {}
+    if not jobs:
+        return results
+    with ThreadPoolExecutor(max_workers=min(HASH_WORKERS, len(jobs))) as pool:
+        futures = {pool.submit(func, path, size): path for path, size in jobs}
+        for fut in as_completed(futures):
+            path = futures[fut]
+            try:
+                results[path] = fut.result()
+            except Exception as e:
+                progress(f"Warning: cannot hash {path}: {e}")
+    return results
+def is_image(file_path: Path) -> bool:
+    return file_path.suffix.lower() in IMAGE_EXTENSIONS
+def is_video(file_path: Path) -> bool:
+    return file_path.suffix.lower() in VIDEO_EXTENSIONS
+def is_audio(file_path: Path) -> bool:
+    return file_path.suffix.lower() in AUDIO_EXTENSIONS
+class NameAllocator:
+    """
+    Hands out collision-free destination paths. Each folder's names are
+    listed once into a set, and the next free _N suffix is remembered per
+    (stem, suffix), so placing 10k files called IMG_0001.JPG costs O(1)
+    each instead of probing exists() for _1, _2, ...
+    reserve() creates the file with O_EXCL, so a name taken by another
+    process (or differing only in case on a case-insensitive filesystem)
+    is skipped rather than overwritten.
+    """
+    def __init__(self):
+        self.names: Dict[Path, set] = {}
+        self.next_suffix: Dict[Tuple[Path, str, str], int] = {}
+        self.lock = threading.Lock()
+    def _folder_names(self, folder: Path) -> set:
+        names = self.names.get(folder)
+        if names is None:
+            names = set(os.listdir(folder)) if folder.is_dir() else set()
+            self.names[folder] = names
+        return names
+    def _candidate(self, folder: Path, name: str) -> Path:
+        names = self._folder_names(folder)
+        if name not in names:
+            names.add(name)
+            return folder / name
+        stem, suffix = os.path.splitext(name)
+        key = (folder, stem, suffix)
+        counter = self.next_suffix.get(key, 1)
+        while f"{stem}_{counter}{suffix}" in names:
+            counter += 1
+        self.next_suffix[key] = counter + 1
+        name = f"{stem}_{counter}{suffix}"
+        names.add(name)
+        return folder / name
+    def reserve(self, target_path: Path) -> Path:
+        """Create an empty placeholder at a unique path near target_path and return it."""
+        while True:
+            with self.lock:
+                candidate = self._candidate(target_path.parent, target_path.name)
+            try:
+                os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                return candidate
+            except FileExistsError:
+                continue                # taken behind our back; the name stays in the set
+    def release(self, path: Path):
+        """Remove an unused placeholder so its name can be handed out again."""
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self._folder_names(path.parent).discard(path.name)
+def fast_copy(src: Path, dst: Path):
+    """
+    Copy file data inside the kernel: copy_file_range (which may also reflink
+    or copy server-side), then sendfile, then a plain buffered copy. Metadata
+    is copied like shutil.copy2.
+    """
+    with src.open('rb', buffering=0) as f_src, dst.open('wb', buffering=0) as f_dst:
+        in_fd, out_fd = f_src.fileno(), f_dst.fileno()
+        for syscall in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, syscall):
+                continue
+            try:
+                while True:
+                    if syscall == 'copy_file_range':
+                        n = os.copy_file_range(in_fd, out_fd, COPY_CHUNK)
+                    else:
+                        n = os.sendfile(out_fd, in_fd, None, COPY_CHUNK)
+                    if not n:
+                        break
+                break
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                                   errno.ENOTSUP, errno.ENOTSOCK, errno.EBADF):
+                    raise
+                # start over with the next method
+                os.lseek(in_fd, 0, os.SEEK_SET)
+                os.lseek(out_fd, 0, os.SEEK_SET)
+                os.ftruncate(out_fd, 0)
+        else:
+            shutil.copyfileobj(f_src, f_dst, HASH_BUFFER_SIZE)
+    shutil.copystat(str(src), str(dst))
+def safe_move_or_copy(
+        src: Path,
+        dst: Path,
+        do_copy: bool,
+        allocator: NameAllocator,
+        verify: bool = False,
+        expected_hash: Optional[str] = None
+    ) -> Tuple[Path, Optional[str]]:
+    """
+    Move or copy src -> dst, avoiding overwrite by reserving a unique path.
+    Moves on the same filesystem are a single rename; everything else is a
+    fast_copy (followed by deleting src for moves). With verify, the copy is
+    checked against expected_hash (from the scan) or a fresh hash of src
+    before src is deleted. Returns the final path and the verified SHA-256
+    of the new copy (None for renames and unverified copies).
+    """
+    final_dst = allocator.reserve(dst)
+    digest = None
+    try:
+        if not do_copy:
+            try:
+                os.replace(src, final_dst)
+                return final_dst, None
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+        fast_copy(src, final_dst)
+        if verify:
+            digest = expected_hash or compute_sha256(src)
+            if compute_sha256(final_dst) != digest:
+                raise OSError(errno.EIO, f"hash mismatch after copying to {final_dst}")
+        if not do_copy:
+            src.unlink()
+    except BaseException:
+        allocator.release(final_dst)
+        raise
+    return final_dst, digest
+def reflink_file(src: Path, dst: Path):
+    """Create dst as a copy-on-write clone of src. Raises OSError if unsupported."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported on this platform")
+    with src.open('rb') as f_src, dst.open('xb') as f_dst:
+        fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+def link_duplicate(original: Path, duplicate: Path, mode: str) -> str:
+    """
+    Replace duplicate with a reflink or hardlink to original, atomically via
+    a temporary name in the same folder. Reflink falls back to a hardlink.
+    Returns the link type actually used.
+    """
+    tmp = duplicate.with_name(f".{duplicate.name}.dedupe.tmp")
+    if mode == 'reflink':
+        try:
+            reflink_file(original, tmp)
+            shutil.copystat(str(duplicate), str(tmp))
+            os.replace(tmp, duplicate)
+            return 'reflink'
+        except OSError:
+            if tmp.exists():
+                tmp.unlink()
+    os.link(original, tmp)
+    try:
+        os.replace(tmp, duplicate)
+    except OSError:
+        tmp.unlink()
+        raise
+    return 'hardlink'
+# -------------------------------------------------------------------
+#   Capture date extraction (header-only)
+# -------------------------------------------------------------------
+def _parse_exif_date(raw: bytes) -> Optional[Tuple[int, int]]:
+    """'YYYY:MM:DD HH:MM:SS' -> (year, month); None for blank or bogus dates."""
+    try:
+        year, month = int(raw[0:4]), int(raw[5:7])
+    except ValueError:
+        return None
+    return (year, month) if year > 1900 and 1 <= month <= 12 else None
+def _tiff_date(read_at: Callable[[int, int], bytes]) -> Optional[Tuple[int, int]]:
+    """
+    Walk a TIFF structure (a JPEG Exif block or a .tif file) through
+    read_at(offset, length) and return DateTimeOriginal, DateTimeDigitized
+    or DateTime, in that order of preference.
+    """
+    head = read_at(0, 8)
+    if head[:4] == b'II*\x00':
+        endian = '<'
+    elif head[:4] == b'MM\x00*':
+        endian = '>'
+    else:
+        return None
+    def read_ifd(offset: int) -> Dict[int, Tuple[int, int, int]]:
+        count = struct.unpack(endian + 'H', read_at(offset, 2))[0]
+        raw = read_at(offset + 2, count * 12)
+        tags = {}
+        for i in range(len(raw) // 12):
+            tag, typ, n = struct.unpack(endian + 'HHI', raw[i * 12:i * 12 + 8])
+            tags[tag] = (typ, n, offset + 2 + i * 12 + 8)
+        return tags
+    def ascii_value(entry: Tuple[int, int, int]) -> bytes:
+        typ, n, value_at = entry
+        if typ != 2:
+            return b''
+        if n > 4:
+            value_at = struct.unpack(endian + 'I', read_at(value_at, 4))[0]
+        return read_at(value_at, n)
+    def long_value(entry: Tuple[int, int, int]) -> int:
+        return struct.unpack(endian + 'I', read_at(entry[2], 4))[0]
+    try:
+        ifd0 = read_ifd(struct.unpack(endian + 'I', head[4:8])[0])
+        exif = read_ifd(long_value(ifd0[0x8769])) if 0x8769 in ifd0 else {}
+        for ifd, tag in ((exif, 0x9003), (exif, 0x9004), (ifd0, 0x0132)):
+            if tag in ifd:
+                date = _parse_exif_date(ascii_value(ifd[tag]))
+                if date:
+                    return date
+    except (struct.error, KeyError):
+        pass
+    return None
+def _jpeg_date(f) -> Optional[Tuple[int, int]]:
+    data = f.read(EXIF_READ_SIZE)
+    if data[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xDA:              # start of scan: no more metadata
+            break
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker == 0xE1 and data[pos + 4:pos + 10] == b'Exif\x00\x00':
+            tiff = data[pos + 10:pos + 2 + length]
+            return _tiff_date(lambda off, n: tiff[off:off + n])
+        pos += 2 + length
+    return None
+def _mp4_date(f, file_size: int) -> Optional[Tuple[int, int]]:
+    """Read creation_time from moov/mvhd, seeking over atoms instead of reading them."""
+    def atoms(start: int, end: int):
+        pos = start
+        for _ in range(MP4_MAX_ATOMS):
+            if pos + 8 > end:
+                return
+            f.seek(pos)
+            size, kind = struct.unpack('>I4s', f.read(8))
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+                header = 16
+            elif size == 0:
+                size = end - pos
+            if size < header:
+                return
+            yield kind, pos + header, pos + size
+            pos += size
+    for kind, body, end in atoms(0, file_size):
+        if kind != b'moov':
+            continue
+        for inner, inner_body, _ in atoms(body, end):
+            if inner != b'mvhd':
+                continue
+            f.seek(inner_body)
+            data = f.read(12)
+            if data[0] == 1:
+                created = struct.unpack('>Q', data[4:12])[0]
+            else:
+                created = struct.unpack('>I', data[4:8])[0]
+            if not created:
+                return None
+            when = MP4_EPOCH + timedelta(seconds=created)
+            return (when.year, when.month) if when.year > 1970 else None
+        return None
+    return None
+def capture_date(file_path: Path) -> Tuple[int, int]:
+    """
+    (year, month) the media was captured, read from EXIF (JPEG/TIFF) or the
+    MP4/MOV mvhd atom. Only headers are read. Falls back to the file's mtime.
+    """
+    try:
+        with file_path.open('rb') as f:
+            head = f.read(8)
+            f.seek(0)
+            date = None
+            if head[:2] == b'\xff\xd8':
+                date = _jpeg_date(f)
+            elif head[:4] in (b'II*\x00', b'MM\x00*'):
+                date = _tiff_date(lambda off, n: (f.seek(off), f.read(n))[1])
+            elif file_path.suffix.lower() in MP4_EXTENSIONS or head[4:8] == b'ftyp':
+                date = _mp4_date(f, os.fstat(f.fileno()).st_size)
+            if date:
+                return date
+    except (OSError, struct.error, IndexError):
+        pass
+    mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
+    return mtime.year, mtime.month
+# -------------------------------------------------------------------
+#   Persistent hash cache
+# -------------------------------------------------------------------
+class HashCache:
+    """
+    SQLite cache mapping (device, inode, size, mtime_ns) -> partial / full SHA-256.
+    A row is only used while size and mtime_ns still match the file, so
+    unchanged files are never read again. Rows of files that changed are
+    overwritten; rows not seen for HASH_CACHE_MAX_AGE are pruned on close().
+    Only the thread that opened the cache may use it.
+    """
+    def __init__(self, db_path: Path = HASH_CACHE_PATH):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            ' dev INTEGER NOT NULL, ino INTEGER NOT NULL,'
+            ' size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,'
+            ' partial TEXT, sha256 TEXT, last_seen REAL NOT NULL,'
+            ' PRIMARY KEY (dev, ino))'
+        )
+        self.conn.commit()
+    def lookup(self, st: os.stat_result) -> Tuple[Optional[str], Optional[str]]:
+        """Return (partial, sha256) cached for this exact file version, or (None, None)."""
+        row = self.conn.execute(
+            'SELECT partial, sha256 FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?',
+            (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+    def store_many(self, rows: List[Tuple[os.stat_result, Optional[str], Optional[str]]]):
+        """Insert or replace (stat, partial, sha256) rows and mark them as seen now."""
+        now = time.time()
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO hashes (dev, ino, size, mtime_ns, partial, sha256, last_seen)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, partial, full, now)
+             for st, partial, full in rows]
+        )
+        self.conn.commit()
+    def close(self):
+        self.conn.execute('DELETE FROM hashes WHERE last_seen < ?', (time.time() - HASH_CACHE_MAX_AGE,))
+        self.conn.commit()
+        self.conn.close()
+def open_hash_cache(progress: ProgressCallback) -> Optional[HashCache]:
+    """Open the default cache; on failure log it and run without a cache."""
+    try:
+        return HashCache()
+    except (OSError, sqlite3.Error) as e:
+        progress(f"Warning: hash cache unavailable ({e}), hashing without it.")
+        return None
+# -------------------------------------------------------------------
+#   Core logic functions
+# -------------------------------------------------------------------
+def find_hashes(
+        stats: Dict[Path, os.stat_result],
+        progress: ProgressCallback,
+        cache: Optional[HashCache] = None
+    ) -> Dict[Path, str]:
+    """
+    Return full SHA-256 for every file that may have a duplicate among stats.
+    Hashing runs in three stages so that only possible duplicates are read:
+      1. group files by size; a file with a unique size cannot be a duplicate
+      2. hash the first and last 64 KB of files that share a size
+      3. fully hash only the files whose partial hashes still collide
+    Hashes found in cache are used instead of reading the file, and new ones
+    are written back.
+    """
+    # stage 1: size groups
+    by_size: Dict[int, List[Path]] = {}
+    for path, st in stats.items():
+        by_size.setdefault(st.st_size, []).append(path)
+    candidates = [p for paths in by_size.values() if len(paths) > 1 for p in paths]
+    partial: Dict[Path, str] = {}
+    full_hashes: Dict[Path, str] = {}
+    if cache is not None:
+        for p in candidates:
+            cached_partial, cached_full = cache.lookup(stats[p])
+            if cached_partial:
+                partial[p] = cached_partial
+            if cached_full:
+                full_hashes[p] = cached_full
+    # stage 2: head + tail hash
+    jobs = [(p, stats[p].st_size) for p in candidates if p not in partial]
+    progress(f"{len(stats)} files, {len(candidates)} share a size with another file "
+        f"({len(candidates) - len(jobs)} cached).")
+    partial.update(hash_parallel(compute_partial_sha256, jobs, progress))
+    by_partial: Dict[Tuple[int, str], List[Path]] = {}
+    for p in candidates:
+        if p in partial:
+            by_partial.setdefault((stats[p].st_size, partial[p]), []).append(p)
+    to_hash: List[Tuple[Path, int]] = []
+    for (size, digest), paths in by_partial.items():
+        if len(paths) < 2:
+            continue
+        if size <= 2 * PARTIAL_HASH_SIZE:
+            # the partial hash already covered the whole file
+            for p in paths:
+                full_hashes[p] = digest
+        else:
+            to_hash.extend((p, size) for p in paths if p not in full_hashes)
+    # stage 3: full hash of remaining collisions
+    progress(f"Fully hashing {len(to_hash)} files with matching head/tail.")
+    full_hashes.update(hash_parallel(lambda p, _size: compute_sha256(p), to_hash, progress))
+    if cache is not None:
+        cache.store_many([(stats[p], partial[p], full_hashes.get(p)) for p in candidates if p in partial])
+    return full_hashes
+def scan_sources(
+        source_dirs: List[Path],
+        progress: ProgressCallback,
+        cache: Optional[HashCache] = None
+    ) -> List[Tuple[Path, str, int, Optional[str]]]:
+    """
+    Walk all source_dirs, find supported media files, compute size & sha256.
+    Returns a list of tuples: (file_path, media_type, size_bytes, sha256).
+    sha256 is None for files that find_hashes() ruled out as duplicates early.
+    """
+    found: List[Tuple[Path, str, os.stat_result]] = []
+    progress("Starting pre-scan...")
+    for src_dir in source_dirs:
+        if not src_dir.is_dir():
+            progress(f"Skipping invalid source: {src_dir}")
+            continue
+        for root, _, files in os.walk(src_dir):
+            for filename in files:
+                file_path = Path(root) / filename
+                if is_image(file_path):
+                    media_type = 'image'
+                elif is_video(file_path):
+                    media_type = 'video'
+                elif is_audio(file_path):
+                    media_type = 'audio'
+                else:
+                    continue
+                try:
+                    found.append((file_path, media_type, file_path.stat()))
+                except Exception as e:
+                    progress(f"Warning: cannot process {file_path}: {e}")
+    full_hashes = find_hashes({p: st for p, _, st in found}, progress, cache)
+    entries: List[Tuple[Path, str, int, Optional[str]]] = [
+        (file_path, media_type, st.st_size, full_hashes.get(file_path))
+        for file_path, media_type, st in found
+    ]
+    # summary
+    counts = {'image': 0, 'video': 0, 'audio': 0}
+    total_bytes = 0
+    for _, mtype, size, _ in entries:
+        counts[mtype] += 1
+        total_bytes += size
+    mb = total_bytes / (1024 ** 2)
+    dup_groups: Dict[str, int] = {}
+    for h in full_hashes.values():
+        dup_groups[h] = dup_groups.get(h, 0) + 1
+    duplicates = sum(n - 1 for n in dup_groups.values() if n > 1)
+    progress(f"Found {counts['image']} images, "
+        f"{counts['video']} videos, {counts['audio']} audio, "
+        f"{mb:.2f} MB total, {duplicates} duplicate copies.")
+    return entries
+def place_entry(
+        src: Path,
+        media_folder: Path,
+        do_copy: bool,
+        allocator: NameAllocator,
+        verify: bool,
+        expected_hash: Optional[str],
+        by_date: bool
+    ) -> Tuple[Path, Optional[Tuple[os.stat_result, str, str]]]:
+    """
+    Transfer one file into media_folder, or media_folder/YYYY/MM with by_date.
+    Returns the final path and, for a verified copy, a HashCache row for it
+    so the destination dedupe does not read the copy again. A rename keeps
+    the inode and mtime, so the row cached for the source still matches.
+    """
+    folder = media_folder
+    if by_date:
+        year, month = capture_date(src)
+        folder = media_folder / f"{year:04d}" / f"{month:02d}"
+        folder.mkdir(parents=True, exist_ok=True)
+    final_path, digest = safe_move_or_copy(src, folder / src.name, do_copy, allocator, verify, expected_hash)
+    if digest is None:
+        return final_path, None
+    st = final_path.stat()
+    # head + tail of a file that was just read in full come from the page cache
+    return final_path, (st, compute_partial_sha256(final_path, st.st_size), digest)
+def move_or_copy_entries(
+        entries: List[Tuple[Path, str, int, Optional[str]]],
+        destination: Path,
+        do_copy: bool,
+        progress: ProgressCallback,
+        verify: bool = False,
+        by_date: bool = False,
+        cache: Optional[HashCache] = None
+    ):
+    """
+    Perform move or copy of all entries under destination/images, /videos, /audio,
+    optionally bucketed into YYYY/MM subfolders by capture date.
+    Up to TRANSFER_WORKERS transfers run at once; aggregate MB/s is reported
+    every PROGRESS_INTERVAL seconds and at the end. Hashes of verified copies
+    are written to cache.
+    """
+    folders = {
+        'image': destination / 'images',
+        'video': destination / 'videos',
+        'audio': destination / 'audio'
+    }
+    for fld in folders.values():
+        fld.mkdir(parents=True, exist_ok=True)
+    action, done = ("Copying", "Copied") if do_copy else ("Moving", "Moved")
+    progress(f"{action} files...")
+    allocator = NameAllocator()
+    pending = list(reversed(entries))
+    running = {}
+    finished = 0
+    moved_bytes = 0
+    cache_rows: List[Tuple[os.stat_result, str, str]] = []
+    start = last_report = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=TRANSFER_WORKERS) as pool:
+        while pending or running:
+            # keep a bounded window of submitted transfers
+            while pending and len(running) < TRANSFER_WORKERS * 4:
+                src_path, media_type, size, sha256 = pending.pop()
+                fut = pool.submit(place_entry, src_path, folders[media_type], do_copy, allocator,
+                                  verify, sha256, by_date)
+                running[fut] = (src_path, size)
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in completed:
+                src_path, size = running.pop(fut)
+                try:
+                    final_path, cache_row = fut.result()
+                    if cache_row is not None:
+                        cache_rows.append(cache_row)
+                    progress(f"  {done} {src_path} -> {final_path}")
+                    finished += 1
+                    moved_bytes += size
+                except Exception as e:
+                    progress(f"Error processing {src_path}: {e}")
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                rate = moved_bytes / (1024 ** 2) / (now - start)
+                progress(f"{finished}/{len(entries)} files, {rate:.1f} MB/s")
+    if cache is not None and cache_rows:
+        cache.store_many(cache_rows)       # only the opening thread may use the cache
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    mb = moved_bytes / (1024 ** 2)
+    progress(f"{done} {finished} files, {mb:.2f} MB in {elapsed:.1f}s ({mb / elapsed:.1f} MB/s).")
+def deduplicate_folder(
+        folder: Path,
+        progress: ProgressCallback,
+        cache: Optional[HashCache] = None,
+        mode: str = 'delete',
+        dry_run: bool = False
+    ) -> int:
+    """
+    Deduplicate files in folder (and subfolders) by SHA-256.
+    Keeps first encountered copy. Later copies are deleted (mode 'delete'),
+    or replaced by a hardlink ('hardlink') or a copy-on-write clone
+    ('reflink', falls back to hardlink) so every path stays valid.
+    With dry_run nothing is changed. Returns the bytes reclaimed (or
+    reclaimable with dry_run).
+    """
+    if mode not in DEDUPE_MODES:
+        raise ValueError(f"Unknown dedupe mode: {mode}")
+    progress(f"Deduplicating in {folder} ({mode}{', dry run' if dry_run else ''})...")
+    stats: Dict[Path, os.stat_result] = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = Path(root) / name
+            try:
+                stats[path] = path.stat()
+            except Exception as e:
+                progress(f"Warning: cannot hash {path}: {e}")
+    hashes = find_hashes(stats, progress, cache)
+    seen_hashes: Dict[str, Path] = {}
+    duplicates: List[Tuple[Path, Path]] = []
+    for path in stats:
+        h = hashes.get(path)
+        if h is None:
+            continue
+        if h not in seen_hashes:
+            seen_hashes[h] = path
+            continue
+        original = seen_hashes[h]
+        if (stats[path].st_dev, stats[path].st_ino) == (stats[original].st_dev, stats[original].st_ino):
+            continue                    # already the same file
+        duplicates.append((path, original))
+    # an inode's blocks are freed only when all of its links are replaced
+    links_replaced: Dict[Tuple[int, int], int] = {}
+    for path, _ in duplicates:
+        key = (stats[path].st_dev, stats[path].st_ino)
+        links_replaced[key] = links_replaced.get(key, 0) + 1
+    reclaimed = 0
+    counted = set()
+    for path, original in duplicates:
+        st = stats[path]
+        key = (st.st_dev, st.st_ino)
+        try:
+            if dry_run:
+                progress(f"  Would {mode} duplicate {path} (original: {original})")
+            elif mode == 'delete':
+                path.unlink()
+                progress(f"  Deleted duplicate {path} (original: {original})")
+            else:
+                used = link_duplicate(original, path, mode)
+                progress(f"  Replaced duplicate {path} with {used} to {original}")
+        except Exception as e:
+            progress(f"Error deduplicating {path}: {e}")
+            continue
+        if key not in counted and links_replaced[key] >= st.st_nlink:
+            counted.add(key)
+            reclaimed += st.st_size
+    mb = reclaimed / (1024 ** 2)
+    verb = "reclaimable" if dry_run else "reclaimed"
+    progress(f"{len(duplicates)} duplicates in {folder}, {mb:.2f} MB {verb}.")
+    return reclaimed
+# -------------------------------------------------------------------
+#   Perceptual near-duplicate detection
+# -------------------------------------------------------------------
+def _bits_to_int(bits) -> int:
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+def _dct_matrix(n: int):
+    k = np.arange(n).reshape(-1, 1)
+    return np.cos(np.pi * (2 * np.arange(n) + 1) * k / (2 * n))
+def perceptual_hash(path: str, algorithm: str = 'phash') -> Tuple[str, Optional[int], int, str]:
+    """
+    Compute a 64-bit perceptual hash in a worker process.
+    Returns (path, hash, pixel_count, error); hash is None on failure.
+    dhash compares neighbouring pixels of a 9x8 thumbnail, phash keeps the
+    signs of the low 8x8 DCT coefficients of a 32x32 thumbnail against their median.
+    """
+    try:
+        with Image.open(path) as img:
+            pixels = img.width * img.height
+            img.draft('L', (64, 64))    # let the JPEG decoder downscale while decoding
+            gray = img.convert('L')
+            if algorithm == 'dhash':
+                arr = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+                return path, _bits_to_int(arr[:, 1:] > arr[:, :-1]), pixels, ''
+            arr = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+            dct = _dct_matrix(32)
+            low = (dct @ arr @ dct.T)[:8, :8]
+            median = np.median(low.flatten()[1:])       # skip the DC term
+            return path, _bits_to_int(low > median), pixels, ''
+    except Exception as e:
+        return path, None, 0, str(e)
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance.
+    A radius query only descends into children whose edge distance lies in
+    [d - radius, d + radius], so it visits a small part of the tree.
+    """
+    def __init__(self):
+        self.root = None                # [hash, items, {distance: child}]
+    def add(self, value: int, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+    def query(self, value: int, radius: int) -> List[Tuple[int, object]]:
+        """Return (distance, item) for every item within radius of value."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                found.extend((d, item) for item in node[1])
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        return found
+def find_similar_images(
+        paths: List[Path],
+        progress: ProgressCallback,
+        radius: int = SIMILARITY_RADIUS,
+        algorithm: str = 'phash'
+    ) -> List[List[Tuple[Path, int, int]]]:
+    """
+    Group visually similar images. Hashes are computed in a process pool and
+    indexed in a BK-tree; clusters are the connected components of the
+    "within radius" relation. Each cluster is a list of
+    (path, distance_to_keeper, pixel_count), keeper first: the image with
+    the most pixels, then the largest file. Matches can chain (A~B~C), so
+    members may lie farther than radius from the keeper; the distance lets
+    write_review_file() tell them apart.
+    """
+    if np is None or Image is None:
+        progress("Near-duplicate detection needs Pillow and NumPy (pip install pillow numpy).")
+        return []
+    if algorithm not in PERCEPTUAL_ALGORITHMS:
+        raise ValueError(f"Unknown perceptual hash: {algorithm}")
+    progress(f"Computing {algorithm} for {len(paths)} images...")
+    hashes: Dict[Path, int] = {}
+    pixels: Dict[Path, int] = {}
+    with ProcessPoolExecutor() as pool:
+        results = pool.map(perceptual_hash, [str(p) for p in paths], [algorithm] * len(paths),
+                           chunksize=64)
+        for path, value, count, error in results:
+            if value is None:
+                progress(f"Warning: cannot decode {path}: {error}")
+                continue
+            hashes[Path(path)] = value
+            pixels[Path(path)] = count
+    tree = BKTree()
+    for path, value in hashes.items():
+        tree.add(value, path)
+    # union-find over radius queries
+    parent: Dict[Path, Path] = {p: p for p in hashes}
+    def find(p: Path) -> Path:
+        while parent[p] != p:
+            parent[p] = parent[parent[p]]
+            p = parent[p]
+        return p
+    for path, value in hashes.items():
+        for _, other in tree.query(value, radius):
+            a, b = find(path), find(other)
+            if a != b:
+                parent[a] = b
+    groups: Dict[Path, List[Path]] = {}
+    for path in hashes:
+        groups.setdefault(find(path), []).append(path)
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda p: (pixels[p], p.stat().st_size), reverse=True)
+        keeper = hashes[members[0]]
+        clusters.append([(p, hamming(keeper, hashes[p]), pixels[p]) for p in members])
+    progress(f"Found {len(clusters)} clusters of similar images "
+        f"({sum(len(c) - 1 for c in clusters)} candidates for removal).")
+    return clusters
+def write_review_file(
+        clusters: List[List[Tuple[Path, int, int]]],
+        review_path: Path,
+        radius: int = SIMILARITY_RADIUS
+    ):
+    """
+    Write clusters as CSV for manual review. The keeper of each cluster is
+    marked 'keep', members within radius of it 'delete', and members only
+    reached through a chain of matches 'review' (never deleted unless
+    changed to 'delete'). Edit the action column, then run
+    apply_review_file(). Nothing is deleted before that.
+    """
+    with review_path.open('w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['cluster', 'action', 'distance', 'pixels', 'size', 'path'])
+        for n, cluster in enumerate(clusters, 1):
+            for i, (path, distance, count) in enumerate(cluster):
+                if i == 0:
+                    action = 'keep'
+                elif distance <= radius:
+                    action = 'delete'
+                else:
+                    action = 'review'
+                writer.writerow([n, action, distance, count, path.stat().st_size, str(path)])
+def apply_review_file(review_path: Path, progress: ProgressCallback) -> int:
+    """
+    Delete the files marked 'delete' in a reviewed CSV. A cluster is skipped
+    unless at least one of its files is still marked 'keep' and exists, and
+    files whose size changed since the review are left alone.
+    Returns the bytes freed.
+    """
+    clusters: Dict[str, List[Dict[str, str]]] = {}
+    with review_path.open(newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            clusters.setdefault(row['cluster'], []).append(row)
+    freed = 0
+    for number, rows in clusters.items():
+        if not any(r['action'] == 'keep' and Path(r['path']).exists() for r in rows):
+            progress(f"Skipping cluster {number}: no file marked keep.")
+            continue
+        for r in rows:
+            if r['action'] != 'delete':
+                continue
+            path = Path(r['path'])
+            try:
+                size = path.stat().st_size
+                if size != int(r['size']):
+                    progress(f"Skipping {path}: changed since review.")
+                    continue
+                path.unlink()
+                freed += size
+                progress(f"  Deleted near-duplicate {path}")
+            except Exception as e:
+                progress(f"Error deleting {path}: {e}")
+    progress(f"Freed {freed / (1024 ** 2):.2f} MB.")
+    return freed
+# -------------------------------------------------------------------
+#   Full run
+# -------------------------------------------------------------------
+def report_dry_run(
+        entries: List[Tuple[Path, str, int, Optional[str]]],
+        destination: Path,
+        do_copy: bool,
+        do_dedupe: bool,
+        progress: ProgressCallback,
+        cache: Optional[HashCache],
+        dedupe_mode: str
+    ):
+    """
+    Report what organize() would transfer and, with do_dedupe, how much
+    space duplicates among the sources (and in the existing destination)
+    would free. Changes nothing.
+    """
+    total = sum(size for _, _, size, _ in entries)
+    progress(f"Dry run: would {'copy' if do_copy else 'move'} {len(entries)} files "
+             f"({total / (1024 ** 2):.2f} MB) into {destination}.")
+    if do_dedupe:
+        seen: Set[str] = set()
+        duplicates = reclaimable = 0
+        for _, _, size, sha256 in entries:
+            if sha256 is None:
+                continue
+            if sha256 in seen:
+                duplicates += 1
+                reclaimable += size
+            else:
+                seen.add(sha256)
+        progress(f"Dry run: {duplicates} duplicate files among the sources, "
+                 f"{reclaimable / (1024 ** 2):.2f} MB reclaimable after transfer.")
+        for sub in ('images', 'videos', 'audio'):
+            if (destination / sub).is_dir():
+                deduplicate_folder(destination / sub, progress, cache, dedupe_mode, dry_run=True)
+    progress("Dry run finished; nothing was changed.")
+def organize(
+        source_dirs: List[Path],
+        destination: Path,
+        do_copy: bool,
+        do_dedupe: bool,
+        progress: ProgressCallback,
+        dedupe_mode: str = 'delete',
+        dry_run: bool = False,
+        find_similar: bool = False,
+        verify: bool = False,
+        by_date: bool = False
+    ) -> bool:
+    """
+    Scan sources, move/copy media under destination, then optionally
+    deduplicate and write a near-duplicate review file. With dry_run
+    nothing is moved, copied, linked or deleted; only a report is printed.
+    Returns False if no media files were found.
+    """
+    cache = open_hash_cache(progress)
+    try:
+        entries = scan_sources(source_dirs, progress, cache)
+        if not entries:
+            progress("No media files found. Aborting.")
+            return False
+        if dry_run:
+            report_dry_run(entries, destination, do_copy, do_dedupe, progress, cache, dedupe_mode)
+            return True
+        move_or_copy_entries(entries, destination, do_copy, progress, verify, by_date, cache)
+        if do_dedupe:
+            for sub in ('images', 'videos', 'audio'):
+                deduplicate_folder(destination / sub, progress, cache, dedupe_mode)
+        if find_similar:
+            images = [Path(root) / name
+                      for root, _, files in os.walk(destination / 'images')
+                      for name in files if is_image(Path(name))]
+            clusters = find_similar_images(images, progress)
+            if clusters:
+                review_path = destination / REVIEW_FILE_NAME
+                write_review_file(clusters, review_path)
+                progress(f"Review {review_path}, then apply it to delete.")
+        progress(f"All done! Files are under {destination.resolve()}")
+        return True
+    finally:
+        if cache is not None:
+            cache.close()
+# -------------------------------------------------------------------
+#   Command line entry point
+# -------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Organize and deduplicate media files (headless).")
+    parser.add_argument("sources", nargs="*", type=Path, help="source folders")
+    parser.add_argument("--dest", type=Path, help="destination folder")
+    parser.add_argument("--copy", action="store_true", help="copy instead of move")
+    parser.add_argument("--verify", action="store_true", help="hash-check every copied file")
+    parser.add_argument("--by-date", action="store_true", help="sort into YYYY/MM folders by capture date")
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, default=None,
+                        help="deduplicate the destination with this mode")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be transferred and deduplicated; change nothing")
+    parser.add_argument("--similar", action="store_true", help="write a near-duplicate review file")
+    parser.add_argument("--apply-review", type=Path, metavar="CSV", help="apply a reviewed near-duplicate file")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary lines")
+    args = parser.parse_args()
+    def progress(message: str):
+        if not (args.quiet and message.startswith("  ")):
+            print(message)
+    if args.apply_review:
+        apply_review_file(args.apply_review, progress)
+        return
+    if not args.sources or args.dest is None:
+        parser.error("SRC and --dest are required")
+    args.dest.mkdir(parents=True, exist_ok=True)
+    ok = organize(args.sources, args.dest, args.copy, args.dedupe is not None, progress,
+                  args.dedupe or 'delete', args.dry_run, args.similar, args.verify,
+                  args.by_date)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
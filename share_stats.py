@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+share_stats.py
+云盘分享功能共用的访问计数器。每次浏览/下载只在内存里按分享累加（浏览次数、下载次数、发送字节数），
+后台线程每隔 FLUSH_INTERVAL 秒把累积的增量交给 write_batch 回调，在一个事务里批量写入数据库，
+热门分享的每次下载不再各自提交一次 SQLAlchemy 写操作。
+    - 写库失败时增量合并回内存，下一轮重试，计数不丢
+    - 进程退出时（atexit）再写一次，最多丢失被强制杀死前几秒的计数
+    - 后台线程在第一次计数时才启动，Flask 调试模式的重载父进程不会启动它
+用法:
+    counters = ShareCounters(write_batch)          # write_batch({分享: [浏览, 下载, 字节]})
+    counters.record(token, views=1)
+    counters.record_download(token, response)      # 按状态码计数：200 整次下载，206 只计字节，304 不计
+    counters.flush()                               # 立即写入，例如展示统计之前
+"""
+import atexit
+import sys
+import threading
+import time
+
+FLUSH_INTERVAL = 5                     # 秒
+
+class ShareCounters:
+    def __init__(self, write_batch, interval=FLUSH_INTERVAL):
+        self.write_batch = write_batch
+        self.interval = interval
+        self._pending = {}                     # 分享 -> [浏览, 下载, 字节]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()    # 同一时刻只有一个批次在写库
+        self._thread = None
+
+    def record(self, share, views=0, downloads=0, nbytes=0):
+        with self._lock:
+            counts = self._pending.get(share)
+            if counts is None:
+                counts = self._pending[share] = [0, 0, 0]
+            counts[0] += views
+            counts[1] += downloads
+            counts[2] += nbytes
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="share-stats", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def record_download(self, share, response):
+        """按下载响应计数：只有 200 算一次下载；206 分段请求只累加实际发送的字节
+        （断点续传、视频拖动会对同一文件发出很多个 Range 请求）；304 等没有发送文件内容，不计"""
+        if response.status_code == 200:
+            self.record(share, downloads=1, nbytes=response.content_length or 0)
+        elif response.status_code == 206:
+            self.record(share, nbytes=response.content_length or 0)
+
+    def _merge(self, batch):
+        with self._lock:
+            for share, (views, downloads, nbytes) in batch.items():
+                counts = self._pending.setdefault(share, [0, 0, 0])
+                counts[0] += views
+                counts[1] += downloads
+                counts[2] += nbytes
+
+    def flush(self):
+        """把当前累积的增量写入数据库；失败时放回内存并抛出异常"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                self.write_batch(batch)
+            except Exception:
+                self._merge(batch)
+                raise
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"分享访问计数写入失败，稍后重试: {e}", file=sys.stderr)
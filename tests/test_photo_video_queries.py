@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+图片视频管理.py 的查询次数测试：首页和相册页执行的 SQL 条数不随相册/照片数量增长（没有 N+1 查询）。
+使用内存 SQLite，不写仓库目录。
+"""
+import importlib.util
+import importlib.metadata
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parents[1]
+# 仓库根目录下的 flask.py 会遮蔽 Flask 包，导入应用前把根目录移出 sys.path
+sys.path[:] = [p for p in sys.path if Path(p or '.').resolve() != REPO]
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('flask_login')
+if int(importlib.metadata.version('flask-sqlalchemy').split('.')[0]) >= 3:
+    pytest.skip('应用在导入时调用 create_all()，需要 Flask-SQLAlchemy 2.x', allow_module_level=True)
+
+from sqlalchemy import event
+
+
+@pytest.fixture(scope='module')
+def media_app():
+    os.environ['MEDIA_DATABASE_URI'] = 'sqlite://'
+    os.environ['MEDIA_UPLOAD_DIRECTORY'] = tempfile.mkdtemp()
+    spec = importlib.util.spec_from_file_location('photo_video_app', REPO / '图片视频管理.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def app(media_app):
+    database = media_app.DATABASE
+    with media_app.APPLICATION.app_context():
+        database.drop_all()
+        database.create_all()
+    return media_app
+
+
+def seed(app, collections, photos_per_collection):
+    database = app.DATABASE
+    with app.APPLICATION.app_context():
+        for n in range(collections):
+            # 每个相册一个所有者，否则 owner 的懒加载会命中同一会话的缓存，掩盖 N+1 查询
+            owner = app.User(user_name=f'owner {n}', password_hash='x')
+            database.session.add(owner)
+            database.session.flush()
+            album = app.PhotoCollection(title=f'album {n}', owner_identifier=owner.identifier)
+            reel = app.VideoCollection(title=f'reel {n}', owner_identifier=owner.identifier)
+            database.session.add_all([album, reel])
+            database.session.flush()
+            for k in range(photos_per_collection):
+                database.session.add(app.Photo(filename=f'{n}_{k}.jpg', collection_identifier=album.identifier))
+                database.session.add(app.Video(filename=f'{n}_{k}.mp4', mime_type='video/mp4',
+                                               collection_identifier=reel.identifier))
+        database.session.commit()
+        return album.identifier
+
+
+def count_queries(app, url):
+    executed = []
+
+    def record(*args, **kwargs):
+        executed.append(args[2])
+
+    engine = app.DATABASE.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = app.APPLICATION.test_client().get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(executed)
+
+
+@pytest.mark.parametrize('url', ['/', '/?q=album'])
+def test_homepage_query_count_is_constant(media_app, url):
+    counts = []
+    for collections in (1, 20):
+        with media_app.APPLICATION.app_context():
+            media_app.DATABASE.drop_all()
+            media_app.DATABASE.create_all()
+        seed(media_app, collections, 3)
+        counts.append(count_queries(media_app, url))
+    assert counts[0] == counts[1]
+
+
+def test_collection_page_query_count_is_constant(app):
+    small = seed(app, 1, 1)
+    small_count = count_queries(app, f'/collections/photos/{small}')
+    with app.APPLICATION.app_context():
+        app.DATABASE.drop_all()
+        app.DATABASE.create_all()
+    large = seed(app, 1, app.COLLECTION_PAGE_SIZE * 3)
+    assert count_queries(app, f'/collections/photos/{large}') == small_count
+    assert count_queries(app, f'/collections/photos/{large}?page=2') == small_count
+    assert count_queries(app, f'/collections/videos/{large}') == small_count
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+带分享功能的云盘.py 的签名分享链接测试：签名载荷可被任何人解码，其中不能出现分享的 uuid token，
+否则限时/只读链接的持有者能拿 uuid 访问 /s/<uuid> 获得永久全权限；以及下载计数只统计完整下载。
+"""
+import importlib.metadata
+import importlib.util
+import json
+import sys
+import zlib
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parents[1]
+# 仓库根目录下的 flask.py 会遮蔽 Flask 包，导入应用前把根目录移出 sys.path
+sys.path[:] = [p for p in sys.path if Path(p or '.').resolve() != REPO]
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('flask_login')
+flask_version = tuple(int(x) for x in importlib.metadata.version('flask').split('.')[:2])
+if flask_version >= (2, 3):
+    pytest.skip('应用使用 before_first_request，需要 Flask 2.2 及以下', allow_module_level=True)
+
+from itsdangerous import base64_decode
+
+
+@pytest.fixture
+def cloud(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # 仓库根目录放在最后：能导入 share_stats，flask 仍解析到已安装的包
+    monkeypatch.setattr(sys, 'path', sys.path + [str(REPO)])
+    spec = importlib.util.spec_from_file_location('cloud_share_app', REPO / '带分享功能的云盘.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'users.db')
+    client = module.app.test_client()
+    client.post('/register', data={'username': 'alice', 'password': 'pw'})
+    client.post('/login', data={'username': 'alice', 'password': 'pw'})
+    (tmp_path / 'uploads' / 'alice' / 'pub').mkdir(parents=True)
+    (tmp_path / 'uploads' / 'alice' / 'pub' / 'a.txt').write_text('hi')
+    return module, client
+
+
+def decode_payload(token):
+    # itsdangerous 格式：[.]base64(载荷)[.时间戳].签名，开头的 '.' 表示载荷经过 zlib 压缩
+    compressed = token.startswith('.')
+    raw = base64_decode(token.lstrip('.').split('.')[0])
+    return json.loads(zlib.decompress(raw) if compressed else raw)
+
+
+def share_link(client, **form):
+    response = client.post('/api/share', data=dict(path='pub', **form))
+    return response.get_json()['link'].rsplit('/', 1)[1]
+
+
+def test_signed_payload_does_not_reveal_share_token(cloud):
+    module, client = cloud
+    uuid_token = share_link(client)
+    for form in ({'signed': '1'}, {'signed': '1', 'expires': '60'}):
+        signed = share_link(client, **form)
+        payload = decode_payload(signed)
+        assert uuid_token not in json.dumps(payload)
+        assert uuid_token.replace('-', '') not in json.dumps(payload)
+        assert payload['i'] == module.share_public_id(uuid_token)
+        assert client.get(f'/s/{signed}/api/download?path=a.txt').data == b'hi'
+
+
+def test_unshare_revokes_signed_links(cloud):
+    module, client = cloud
+    signed = share_link(client, signed='1')
+    anonymous = module.app.test_client()
+    assert anonymous.get(f'/s/{signed}/api/tree').status_code == 200
+    assert client.post('/api/unshare', data={'path': 'pub'}).get_json()['success']
+    assert anonymous.get(f'/s/{signed}/api/tree').status_code == 404
+    module.revoked_shares.loaded_at = 0        # 强制从数据库重建过滤器
+    assert anonymous.get(f'/s/{signed}/api/tree').status_code == 404
+
+
+def test_only_full_downloads_are_counted(cloud, monkeypatch):
+    module, client = cloud
+    batches = []
+    monkeypatch.setattr(module, 'share_counters', module.ShareCounters(batches.append))
+    (Path(module.user_base_dir('alice')) / 'pub' / 'a.txt').write_text('0123456789')
+    url = f"/s/{share_link(client)}/api/download?path=a.txt"
+    full = client.get(url)
+    assert full.status_code == 200
+    assert client.get(url, headers={'Range': 'bytes=0-3'}).status_code == 206
+    assert client.get(url, headers={'If-None-Match': full.headers['ETag']}).status_code == 304
+    module.share_counters.flush()
+    (counts,) = batches[0].values()
+    assert counts == [0, 1, 10 + 4]             # 一次下载；字节包含 206 分段发送的 4 字节
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+透明模式.py 尾部篡改测试：压缩文件（尾部 version 2）的 magic/version 参与认证，
+把版本字节改成 1 或把未压缩文件改成 2 都必须在解压、写出之前被 tag 校验拦下。
+"""
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope='module')
+def tool():
+    # 仓库根目录放在最后：能导入 cipher_backends 等共用模块，又不会让根目录下的 flask.py 遮蔽 Flask 包
+    sys.path.append(str(REPO))
+    spec = importlib.util.spec_from_file_location('transparent_mode', REPO / '透明模式.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def backend(tool):
+    return tool.cipher_backends.select(tool.ALGORITHM)
+
+
+def set_footer_version(tool, path, version):
+    offset = os.path.getsize(path) - tool.FOOTER.size + len(tool.FOOTER_MAGIC)   # version 紧跟 magic
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(bytes([version]))
+
+
+def encrypt(tool, backend, path, data, compress):
+    path.write_bytes(data)
+    key = os.urandom(32)
+    assert tool.encrypt_file(str(path), key, backend, compress)
+    return key
+
+
+def test_compressed_round_trip(tool, backend, tmp_path):
+    data = b'compressible text ' * 4000
+    path = tmp_path / 'note.txt'
+    key = encrypt(tool, backend, path, data, 'zlib')
+    assert tool.verify_file(str(path), key, backend)[0] == 'ok'
+    assert tool.decrypt_file(str(path), key, backend)
+    assert path.read_bytes() == data
+
+
+def test_downgrading_compressed_footer_fails_authentication(tool, backend, tmp_path):
+    path = tmp_path / 'note.txt'
+    key = encrypt(tool, backend, path, b'compressible text ' * 4000, 'zlib')
+    set_footer_version(tool, path, tool.FOOTER_VERSION)
+    encrypted = path.read_bytes()
+    assert tool.verify_file(str(path), key, backend)[0] == 'bad_tag'
+    assert not tool.decrypt_file(str(path), key, backend)
+    assert path.read_bytes() == encrypted
+
+
+def test_upgrading_raw_footer_never_reaches_decompressor(tool, backend, tmp_path, monkeypatch):
+    path = tmp_path / 'raw.bin'
+    key = encrypt(tool, backend, path, os.urandom(4096), 'none')
+    set_footer_version(tool, path, tool.FOOTER_VERSION_COMPRESSED)
+    encrypted = path.read_bytes()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('未认证的数据被交给了解压器')
+
+    monkeypatch.setattr(tool.compress_stage, 'StreamDecompressor', fail)
+    assert tool.verify_file(str(path), key, backend)[0] == 'bad_tag'
+    assert not tool.decrypt_file(str(path), key, backend)
+    assert path.read_bytes() == encrypted
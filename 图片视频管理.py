@@ -6,6 +6,8 @@ from flask import (
     send_from_directory, abort, render_template
 )
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 from flask_login import (
     LoginManager, UserMixin, login_user,
     login_required, logout_user, current_user
@@ -19,16 +21,20 @@ from jinja2 import DictLoader
 # Configuration
 # -----------------------------------------------------------------------------
 BASE_DIRECTORY = os.path.abspath(os.path.dirname(__file__))
-UPLOAD_DIRECTORY = os.path.join(BASE_DIRECTORY, 'uploads')
+# 上传目录与数据库可用环境变量覆盖（例如测试时使用临时目录和内存数据库）
+UPLOAD_DIRECTORY = os.environ.get('MEDIA_UPLOAD_DIRECTORY', os.path.join(BASE_DIRECTORY, 'uploads'))
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov'}
+COLLECTION_PAGE_SIZE = 24  # photos/videos shown per collection page
 
 APPLICATION = Flask(__name__)
 APPLICATION.config.update(
     SECRET_KEY='please-change-this-secret-key',
-    SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(BASE_DIRECTORY, 'media_database.db'),
+    SQLALCHEMY_DATABASE_URI=os.environ.get(
+        'MEDIA_DATABASE_URI', 'sqlite:///' + os.path.join(BASE_DIRECTORY, 'media_database.db')
+    ),
     SQLALCHEMY_TRACK_MODIFICATIONS=False,
     UPLOAD_FOLDER=UPLOAD_DIRECTORY,
     MAX_CONTENT_LENGTH=50 * 1024 * 1024,  # 50 MB max upload size
@@ -70,7 +76,8 @@ class PhotoCollection(DATABASE.Model):
     owner_identifier = DATABASE.Column(
         DATABASE.Integer,
         DATABASE.ForeignKey('user.identifier'),
-        nullable=False
+        nullable=False,
+        index=True
     )
     photos = DATABASE.relationship(
         'Photo', backref='collection', cascade='all,delete-orphan'
@@ -83,7 +90,8 @@ class VideoCollection(DATABASE.Model):
     owner_identifier = DATABASE.Column(
         DATABASE.Integer,
         DATABASE.ForeignKey('user.identifier'),
-        nullable=False
+        nullable=False,
+        index=True
     )
     videos = DATABASE.relationship(
         'Video', backref='collection', cascade='all,delete-orphan'
@@ -96,7 +104,8 @@ class Photo(DATABASE.Model):
     collection_identifier = DATABASE.Column(
         DATABASE.Integer,
         DATABASE.ForeignKey('photo_collection.identifier'),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
 
@@ -107,11 +116,16 @@ class Video(DATABASE.Model):
     collection_identifier = DATABASE.Column(
         DATABASE.Integer,
         DATABASE.ForeignKey('video_collection.identifier'),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
 
 DATABASE.create_all()
+# create_all() skips tables that already exist, so add indexes missing from older databases
+for table in DATABASE.metadata.tables.values():
+    for table_index in table.indexes:
+        table_index.create(bind=DATABASE.engine, checkfirst=True)
 
 
 # -----------------------------------------------------------------------------
@@ -139,6 +153,40 @@ def get_unique_filename(filename):
     return f"{unique_str}.{ext}"
 
 
+def collections_with_stats(collection_model, item_model, search_query=''):
+    """
+    Return (collection, item_count, cover_filename) rows for every collection.
+    Counts and the cover (first item) come from one grouped subquery joined to
+    the collections, and owners are loaded with one selectin query, so the
+    number of queries does not grow with the number of collections.
+    """
+    stats = DATABASE.session.query(
+        item_model.collection_identifier.label('collection_identifier'),
+        func.count(item_model.identifier).label('item_count'),
+        func.min(item_model.identifier).label('cover_identifier'),
+    ).group_by(item_model.collection_identifier).subquery()
+    query = DATABASE.session.query(
+        collection_model,
+        func.coalesce(stats.c.item_count, 0),
+        item_model.filename,
+    ).outerjoin(
+        stats, stats.c.collection_identifier == collection_model.identifier
+    ).outerjoin(
+        item_model, item_model.identifier == stats.c.cover_identifier
+    ).options(selectinload(collection_model.owner))
+    if search_query:
+        query = query.filter(collection_model.title.contains(search_query))
+    return query.order_by(collection_model.identifier).all()
+
+
+def collection_page(item_model, collection_id):
+    """One page of a collection's items, ordered by upload."""
+    page_number = request.args.get('page', 1, type=int)
+    return item_model.query.filter_by(collection_identifier=collection_id).order_by(
+        item_model.identifier
+    ).paginate(page=page_number, per_page=COLLECTION_PAGE_SIZE, error_out=False)
+
+
 # -----------------------------------------------------------------------------
 # Routes
 # -----------------------------------------------------------------------------
@@ -151,12 +199,8 @@ def homepage():
     else:
         matched_users = []
 
-    if search_query:
-        photo_collections = PhotoCollection.query.filter(PhotoCollection.title.contains(search_query)).all()
-        video_collections = VideoCollection.query.filter(VideoCollection.title.contains(search_query)).all()
-    else:
-        photo_collections = PhotoCollection.query.all()
-        video_collections = VideoCollection.query.all()
+    photo_collections = collections_with_stats(PhotoCollection, Photo, search_query)
+    video_collections = collections_with_stats(VideoCollection, Video, search_query)
 
     return render_template('home.html',
                            photo_collections=photo_collections,
@@ -246,7 +290,9 @@ def delete_photo_collection(collection_id):
 
 @APPLICATION.route('/collections/photos/<int:collection_id>', methods=['GET', 'POST'])
 def view_photo_collection(collection_id):
-    collection_record = PhotoCollection.query.get_or_404(collection_id)
+    collection_record = PhotoCollection.query.options(
+        joinedload(PhotoCollection.owner)
+    ).get_or_404(collection_id)
     if request.method == 'POST':
         if not current_user.is_authenticated or collection_record.owner != current_user:
             abort(403)
@@ -265,7 +311,8 @@ def view_photo_collection(collection_id):
             DATABASE.session.commit()
             flash('Photo uploaded successfully', 'success')
         return redirect(url_for('view_photo_collection', collection_id=collection_id))
-    return render_template('view_photo_collection.html', collection=collection_record)
+    return render_template('view_photo_collection.html', collection=collection_record,
+                           page=collection_page(Photo, collection_id))
 
 
 @APPLICATION.route('/photos/<int:photo_id>/delete', methods=['POST'])
@@ -317,7 +364,9 @@ def delete_video_collection(collection_id):
 
 @APPLICATION.route('/collections/videos/<int:collection_id>', methods=['GET', 'POST'])
 def view_video_collection(collection_id):
-    collection_record = VideoCollection.query.get_or_404(collection_id)
+    collection_record = VideoCollection.query.options(
+        joinedload(VideoCollection.owner)
+    ).get_or_404(collection_id)
     if request.method == 'POST':
         if not current_user.is_authenticated or collection_record.owner != current_user:
             abort(403)
@@ -340,7 +389,8 @@ def view_video_collection(collection_id):
             DATABASE.session.commit()
             flash('Video uploaded successfully', 'success')
         return redirect(url_for('view_video_collection', collection_id=collection_id))
-    return render_template('view_video_collection.html', collection=collection_record)
+    return render_template('view_video_collection.html', collection=collection_record,
+                           page=collection_page(Video, collection_id))
 
 
 @APPLICATION.route('/videos/<int:video_id>/delete', methods=['POST'])
@@ -418,11 +468,12 @@ TEMPLATE_HOME = """
 <hr>
 <h4>Photo Collections</h4>
 <div class="row">
-  {% for collection in photo_collections %}
+  {% for collection, item_count, cover in photo_collections %}
   <div class="col-md-3 mb-3">
     <div class="card p-2">
+      {% if cover %}<img src="{{ url_for('serve_uploaded_file', filename=cover) }}" class="card-img-top mb-2" alt="Cover">{% endif %}
       <h5>{{ collection.title }}</h5>
-      <p>by {{ collection.owner.user_name }}</p>
+      <p>by {{ collection.owner.user_name }} &middot; {{ item_count }} photos</p>
       <a class="btn btn-sm btn-primary" href="{{ url_for('view_photo_collection', collection_id=collection.identifier) }}">View</a>
     </div>
   </div>
@@ -433,11 +484,12 @@ TEMPLATE_HOME = """
 <hr>
 <h4>Video Collections</h4>
 <div class="row">
-  {% for collection in video_collections %}
+  {% for collection, item_count, cover in video_collections %}
   <div class="col-md-3 mb-3">
     <div class="card p-2">
+      {% if cover %}<video src="{{ url_for('serve_uploaded_file', filename=cover) }}" class="card-img-top mb-2" preload="metadata" muted></video>{% endif %}
       <h5>{{ collection.title }}</h5>
-      <p>by {{ collection.owner.user_name }}</p>
+      <p>by {{ collection.owner.user_name }} &middot; {{ item_count }} videos</p>
       <a class="btn btn-sm btn-primary" href="{{ url_for('view_video_collection', collection_id=collection.identifier) }}">View</a>
     </div>
   </div>
@@ -525,7 +577,7 @@ TEMPLATE_VIEW_PHOTO_COLLECTION = """
 <hr>
 {% endif %}
 <div class="row">
-  {% for photo in collection.photos %}
+  {% for photo in page.items %}
   <div class="col-md-3 mb-3">
     <div class="card">
       <img src="{{ url_for('serve_uploaded_file', filename=photo.filename) }}" class="card-img-top" alt="Photo">
@@ -540,6 +592,15 @@ TEMPLATE_VIEW_PHOTO_COLLECTION = """
     <p>No photos in this collection.</p>
   {% endfor %}
 </div>
+{% if page.pages > 1 %}
+<nav>
+  <ul class="pagination">
+    <li class="page-item {{ '' if page.has_prev else 'disabled' }}"><a class="page-link" href="{{ url_for(request.endpoint, collection_id=collection.identifier, page=page.prev_num) }}">Previous</a></li>
+    <li class="page-item disabled"><span class="page-link">{{ page.page }} / {{ page.pages }}</span></li>
+    <li class="page-item {{ '' if page.has_next else 'disabled' }}"><a class="page-link" href="{{ url_for(request.endpoint, collection_id=collection.identifier, page=page.next_num) }}">Next</a></li>
+  </ul>
+</nav>
+{% endif %}
 {% endblock %}
 """
 
@@ -567,7 +628,7 @@ TEMPLATE_VIEW_VIDEO_COLLECTION = """
 <hr>
 {% endif %}
 <div class="row">
-  {% for video in collection.videos %}
+  {% for video in page.items %}
   <div class="col-md-4 mb-3">
     <div class="card">
       <video controls class="w-100">
@@ -585,6 +646,15 @@ TEMPLATE_VIEW_VIDEO_COLLECTION = """
     <p>No videos in this collection.</p>
   {% endfor %}
 </div>
+{% if page.pages > 1 %}
+<nav>
+  <ul class="pagination">
+    <li class="page-item {{ '' if page.has_prev else 'disabled' }}"><a class="page-link" href="{{ url_for(request.endpoint, collection_id=collection.identifier, page=page.prev_num) }}">Previous</a></li>
+    <li class="page-item disabled"><span class="page-link">{{ page.page }} / {{ page.pages }}</span></li>
+    <li class="page-item {{ '' if page.has_next else 'disabled' }}"><a class="page-link" href="{{ url_for(request.endpoint, collection_id=collection.identifier, page=page.next_num) }}">Next</a></li>
+  </ul>
+</nav>
+{% endif %}
 {% endblock %}
 """
 
@@ -8,7 +8,8 @@ import os
 import shutil
 from flask import Flask, request, send_from_directory, jsonify, render_template_string, abort
 from flask_httpauth import HTTPBasicAuth
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import generate_password_hash
+from auth_cache import CredentialCache
 
 # 配置部分
 ROOT_DIR = os.path.abspath('./shared')  # 共享目录（相对于脚本目录）
@@ -22,10 +23,11 @@ USERS = {
 
 app = Flask(__name__)
 auth = HTTPBasicAuth()
+credential_cache = CredentialCache()  # 缓存校验成功的口令，避免每个请求都重算哈希
 
 @auth.verify_password
 def verify_password(username, password):
-    if username in USERS and check_password_hash(USERS.get(username), password):
+    if credential_cache.check(username, password, USERS.get(username)):
         return username
     return None
 
@@ -1,10 +1,16 @@
+import hashlib
 import os
 import shutil
+import threading
+import time
 import uuid
-from flask import Flask, render_template_string, request, redirect, url_for, jsonify, send_from_directory, abort
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin, LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.utils import secure_filename
+from jinja2 import DictLoader
+from itsdangerous import URLSafeSerializer, BadSignature
+from share_stats import ShareCounters  # 分享访问计数，内存累加后批量写库
 
 app = Flask(__name__)
 app.config.update(
@@ -12,8 +18,14 @@ app.config.update(
     SQLALCHEMY_DATABASE_URI='sqlite:///users.db',
     UPLOAD_FOLDER='uploads',
     ALLOWED_EXTENSIONS={'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'},
+    # 可查看热门分享统计的用户 id（逗号分隔，由部署者通过环境变量指定）；
+    # 注册开放，用户名可以被任何人抢注，所以不按用户名判断
+    ADMIN_USER_IDS={int(i) for i in os.environ.get('CLOUD_ADMIN_USER_IDS', '').split(',') if i.strip()},
 )
 
+SHARE_PERMISSIONS = 'rd'       # 签名分享链接的权限：r 浏览目录树，d 下载文件
+REVOCATION_REFRESH = 30        # 秒，撤销过滤器从数据库重新加载的间隔（多进程部署时同步其他进程的撤销）
+
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -32,6 +44,19 @@ class Share(db.Model):
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     relative_path = db.Column(db.String(300), nullable=False)  # 分享路径（相对用户上传根目录）
 
+class RevokedShare(db.Model):
+    # 已取消分享的公开 id（见 share_public_id）；签名链接不查 Share 表，取消分享后靠这里让旧链接失效
+    share_id = db.Column(db.String(32), primary_key=True)
+    revoked_at = db.Column(db.Float, nullable=False, default=time.time)
+
+class ShareStats(db.Model):
+    # 按分享的公开 id 统计访问量；单独建表，旧数据库由 create_all 自动补建
+    share_id = db.Column(db.String(32), primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+    bytes_served = db.Column(db.BigInteger, nullable=False, default=0)
+    last_access = db.Column(db.Float)
+
 # === 创建数据库及上传文件夹 ===
 @app.before_first_request
 def init_app():
@@ -61,6 +86,106 @@ def safe_join(base, *paths):
         raise RuntimeError("访问越界")
     return abs_path
 
+# === 签名分享链接 ===
+# 链接本身携带 (分享 id, 用户名, 路径, 权限, 过期时间) 并用 SECRET_KEY 签名，
+# 访问时验签即可，不需要查询 Share 表和 owner。载荷只签名不加密，任何人都能解码，
+# 所以其中的分享 id 是 token 的单向摘要，不能是 token 本身（token 即 /s/<uuid> 的永久全权限凭据）。
+# 取消分享后 id 写入 RevokedShare，由布隆过滤器判断：未命中即确定未撤销（绝大多数请求），命中时再查库确认。
+
+class RevocationFilter:
+    def __init__(self, bits=1 << 16, hashes=4):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray(bits // 8)
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 4:i * 4 + 4], 'big') % self.bits
+
+    def _set(self, array, key):
+        for pos in self._positions(key):
+            array[pos >> 3] |= 1 << (pos & 7)
+
+    def add(self, key):
+        with self.lock:
+            self._set(self.array, key)
+
+    def __contains__(self, key):
+        return all(self.array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def refresh(self):
+        # 定期从数据库重建，其他进程取消的分享也能生效；
+        # 重建期间持有锁，本进程同时 add() 的撤销不会被换掉的旧数组丢失
+        if time.time() - self.loaded_at < REVOCATION_REFRESH:
+            return
+        with self.lock:
+            if time.time() - self.loaded_at < REVOCATION_REFRESH:
+                return
+            array = bytearray(self.bits // 8)
+            for (share_id,) in db.session.query(RevokedShare.share_id):
+                self._set(array, share_id)
+            self.array = array
+            self.loaded_at = time.time()
+
+revoked_shares = RevocationFilter()
+
+def share_serializer():
+    return URLSafeSerializer(app.config['SECRET_KEY'], salt='share-link')
+
+def share_public_id(share_token):
+    # uuid4 token 的 SHA-256 摘要：可公开，不能反推出 token，也不会像自增 id 那样被新分享复用
+    return hashlib.sha256(share_token.encode('utf-8')).hexdigest()[:32]
+
+def sign_share(share, username, expires_in=None, permissions=SHARE_PERMISSIONS):
+    payload = {'i': share_public_id(share.token), 'u': username, 'p': share.relative_path, 'm': permissions}
+    if expires_in:
+        payload['e'] = int(time.time()) + expires_in
+    return share_serializer().dumps(payload)
+
+def write_share_stats(batch):
+    # 一个事务写入一批增量；用 SET x = x + 增量，多进程同时写也不会互相覆盖
+    with app.app_context():
+        now = time.time()
+        for share_id, (views, downloads, nbytes) in batch.items():
+            updated = ShareStats.query.filter_by(share_id=share_id).update({
+                ShareStats.views: ShareStats.views + views,
+                ShareStats.downloads: ShareStats.downloads + downloads,
+                ShareStats.bytes_served: ShareStats.bytes_served + nbytes,
+                ShareStats.last_access: now,
+            }, synchronize_session=False)
+            if not updated:
+                db.session.add(ShareStats(share_id=share_id, views=views, downloads=downloads,
+                                          bytes_served=nbytes, last_access=now))
+        db.session.commit()
+
+share_counters = ShareCounters(write_share_stats)
+
+def share_revoked(share_id):
+    revoked_shares.refresh()
+    if share_id not in revoked_shares:
+        return False
+    return RevokedShare.query.get(share_id) is not None
+
+def resolve_share(token, permission):
+    """返回分享的 (分享 id, 用户名, 分享路径)；签名链接（含 '.'）只验签，旧的 uuid 链接查 Share 表"""
+    if '.' not in token:
+        share = Share.query.filter_by(token=token).first_or_404()
+        return share_public_id(share.token), share.owner.username, share.relative_path
+    try:
+        payload = share_serializer().loads(token)
+    except BadSignature:
+        abort(404)
+    if 'e' in payload and payload['e'] < time.time():
+        abort(410)
+    if permission not in payload['m']:
+        abort(403)
+    if share_revoked(payload['i']):
+        abort(404)
+    return payload['i'], payload['u'], payload['p']
+
 def get_file_tree(base, rel_path=""):
     abs_path = safe_join(base, rel_path)
     tree = []
@@ -81,7 +206,7 @@ def get_file_tree(base, rel_path=""):
 
 # === 模板字符串管理 ===
 templates = {
-    "base": '''
+    "base.html": '''
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
@@ -108,6 +233,7 @@ li {margin:5px 0; cursor:pointer;}
     <span>用户：{{ current_user.username }}</span>
     <a href="{{ url_for('logout') }}">登出</a>
     <a href="{{ url_for('my_shares') }}">我的分享</a>
+    {% if current_user.id in config.ADMIN_USER_IDS %}<a href="{{ url_for('hot_shares') }}">热门分享</a>{% endif %}
   {% else %}
     <a href="{{ url_for('login') }}">登录</a>
     <a href="{{ url_for('register') }}">注册</a>
@@ -123,8 +249,8 @@ li {margin:5px 0; cursor:pointer;}
 </html>
 ''',
 
-    "register": '''
-{% extends "base" %}
+    "register.html": '''
+{% extends "base.html" %}
 {% block title %}注册{% endblock %}
 {% block content %}
 <h2>注册新用户</h2>
@@ -136,8 +262,8 @@ li {margin:5px 0; cursor:pointer;}
 {% endblock %}
 ''',
 
-    "login": '''
-{% extends "base" %}
+    "login.html": '''
+{% extends "base.html" %}
 {% block title %}登录{% endblock %}
 {% block content %}
 <h2>用户登录</h2>
@@ -149,8 +275,8 @@ li {margin:5px 0; cursor:pointer;}
 {% endblock %}
 ''',
 
-    "index": '''
-{% extends "base" %}
+    "index.html": '''
+{% extends "base.html" %}
 {% block title %}文件管理首页{% endblock %}
 {% block content %}
 <h2>文件管理</h2>
@@ -252,6 +378,36 @@ function showContextMenu(x, y, node) {
       });
     };
     menu.appendChild(shareItem);
+
+    const signedItem = document.createElement('div');
+    signedItem.textContent = '签名分享（可限时）';
+    signedItem.onclick = () => {
+      const hours = prompt('链接有效期（小时，留空为永久）', '');
+      if(hours === null) return;
+      let expires = '';
+      if(hours.trim()) {
+        const value = Number(hours.trim());
+        if(!Number.isFinite(value) || value <= 0) {
+          alert('有效期必须是大于 0 的数字（小时）');
+          return;
+        }
+        expires = Math.max(1, Math.round(value * 3600));
+      }
+      fetch('/api/share', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+        body: `path=${encodeURIComponent(node.path)}&signed=1&expires=${expires}`
+      }).then(r => r.json()).then(res => {
+        if(res.success) {
+          copyTextToClipboard(res.link);
+          alert('分享链接已生成并复制到剪贴板:\n' + res.link);
+          document.getElementById('shareLink').textContent = '分享链接: ' + res.link;
+        }
+        else alert(res.error);
+        menu.remove();
+      });
+    };
+    menu.appendChild(signedItem);
   }
 
   document.body.appendChild(menu);
@@ -341,8 +497,8 @@ document.body.addEventListener('click', () => {
 {% endblock %}
 ''',
 
-    "my_shares": '''
-{% extends "base" %}
+    "my_shares.html": '''
+{% extends "base.html" %}
 {% block title %}我的分享{% endblock %}
 {% block content %}
 <h2>我的分享目录</h2>
@@ -352,6 +508,7 @@ document.body.addEventListener('click', () => {
     <li>
       <strong>{{ s.path or "/" }}</strong>
       — <a href="{{ s.link }}" target="_blank">访问链接</a>
+      | <a href="{{ s.signed_link }}" target="_blank">签名链接</a>
     </li>
   {% endfor %}
 </ul>
@@ -361,8 +518,36 @@ document.body.addEventListener('click', () => {
 {% endblock %}
 ''',
 
-    "shared_view": '''
-{% extends "base" %}
+    "hot_shares.html": '''
+{% extends "base.html" %}
+{% block title %}热门分享{% endblock %}
+{% block content %}
+<h2>热门分享 Top {{ limit }}</h2>
+<p>排序：
+  {% for key, label in [('views', '浏览'), ('downloads', '下载'), ('bytes', '流量')] %}
+    <a href="{{ url_for('hot_shares', by=key, n=limit) }}">{{ label }}</a>
+  {% endfor %}
+</p>
+<table border="1" cellpadding="6" style="border-collapse:collapse;">
+  <tr><th>分享者</th><th>路径</th><th>浏览</th><th>下载</th><th>流量</th><th>最近访问</th></tr>
+  {% for s in stats %}
+  <tr>
+    <td>{{ s.username or "-" }}</td>
+    <td>{{ "/" + s.path if s.path is not none else "（已取消）" }}</td>
+    <td>{{ s.views }}</td>
+    <td>{{ s.downloads }}</td>
+    <td>{{ s.bytes_served|filesizeformat }}</td>
+    <td>{{ s.last_access }}</td>
+  </tr>
+  {% else %}
+  <tr><td colspan="6">暂无访问记录</td></tr>
+  {% endfor %}
+</table>
+{% endblock %}
+''',
+
+    "shared_view.html": '''
+{% extends "base.html" %}
 {% block title %}{{ username }} 的分享：{{ base_path or "/" }}{% endblock %}
 {% block content %}
 <h2>公开分享目录：{{ base_path or "/" }}</h2>
@@ -371,7 +556,7 @@ document.body.addEventListener('click', () => {
 {% block scripts %}
 <script>
 const token = "{{ token }}";
-let currentPath = "{{ base_path or '' }}";
+let currentPath = "";
 
 function fetchTree(path=currentPath) {
   fetch(`/s/${token}/api/tree?path=${encodeURIComponent(path)}`)
@@ -417,12 +602,16 @@ fetchTree();
 '''
 }
 
+# 模板注册到 Jinja 环境，按名称编译一次后缓存，请求时不再重复编译；
+# 名称带 .html 后缀，Flask 才会对其开启自动转义
+app.jinja_loader = DictLoader(templates)
+
 # === 路由实现 ===
 
 @app.route('/')
 @login_required
 def index():
-    return render_template_string(templates['index'], error=None)
+    return render_template('index.html', error=None)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -430,16 +619,16 @@ def register():
         username = request.form.get('username','').strip()
         password = request.form.get('password','').strip()
         if not username or not password:
-            return render_template_string(templates['register'], error="用户名密码不能为空")
+            return render_template('register.html', error="用户名密码不能为空")
         if User.query.filter_by(username=username).first():
-            return render_template_string(templates['register'], error="用户名已存在")
+            return render_template('register.html', error="用户名已存在")
         user = User(username=username, password=password)
         db.session.add(user)
         db.session.commit()
         # 创建用户目录
         os.makedirs(user_base_dir(username), exist_ok=True)
         return redirect(url_for('login'))
-    return render_template_string(templates['register'], error=None)
+    return render_template('register.html', error=None)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -450,8 +639,8 @@ def login():
         if user and user.password==password:
             login_user(user)
             return redirect(url_for('index'))
-        return render_template_string(templates['login'], error="用户名或密码错误")
-    return render_template_string(templates['login'], error=None)
+        return render_template('login.html', error="用户名或密码错误")
+    return render_template('login.html', error=None)
 
 @app.route('/logout')
 @login_required
@@ -577,6 +766,18 @@ def api_share():
     path = request.form.get('path', '').strip('/')
     if not path:
         return jsonify(success=False, error="缺少路径参数")
+    signed = request.form.get('signed') == '1'
+    expires = request.form.get('expires', '').strip()    # 秒，仅签名链接有效；留空为永久
+    if expires:
+        # 格式错误时报错，不能悄悄退化成永久链接
+        try:
+            expires = int(expires)
+        except ValueError:
+            return jsonify(success=False, error="有效期必须是整数秒")
+        if expires <= 0:
+            return jsonify(success=False, error="有效期必须大于 0")
+    else:
+        expires = None
     base = user_base_dir(current_user.username)
     try:
         abs_path = safe_join(base, path)
@@ -587,7 +788,8 @@ def api_share():
             share = Share(owner=current_user, relative_path=path)
             db.session.add(share)
             db.session.commit()
-        return jsonify(success=True, link=url_for('shared_view', token=share.token, _external=True))
+        token = sign_share(share, current_user.username, expires) if signed else share.token
+        return jsonify(success=True, link=url_for('shared_view', token=token, _external=True))
     except Exception as e:
         return jsonify(success=False, error=str(e))
 
@@ -601,32 +803,59 @@ def api_unshare():
     share = Share.query.filter_by(owner=current_user, relative_path=path).first()
     if not share:
         return jsonify(success=False, error="分享不存在")
+    share_id = share_public_id(share.token)
     db.session.delete(share)
+    if RevokedShare.query.get(share_id) is None:
+        db.session.add(RevokedShare(share_id=share_id))
     db.session.commit()
+    revoked_shares.add(share_id)
     return jsonify(success=True)
 
 @app.route('/my_shares')
 @login_required
 def my_shares():
     shares = Share.query.filter_by(owner=current_user).all()
-    shares_info = [{"path": "/" + s.relative_path, "link": url_for('shared_view', token=s.token, _external=True)} for s in shares]
-    return render_template_string(templates['my_shares'], shares=shares_info, error=None)
+    shares_info = [{"path": "/" + s.relative_path,
+                    "link": url_for('shared_view', token=s.token, _external=True),
+                    "signed_link": url_for('shared_view', token=sign_share(s, current_user.username), _external=True)}
+                   for s in shares]
+    return render_template('my_shares.html', shares=shares_info, error=None)
+
+@app.route('/admin/hot_shares')
+@login_required
+def hot_shares():
+    if current_user.id not in app.config['ADMIN_USER_IDS']:
+        abort(403)
+    order = {'views': ShareStats.views, 'downloads': ShareStats.downloads,
+             'bytes': ShareStats.bytes_served}.get(request.args.get('by'), ShareStats.views)
+    limit = min(request.args.get('n', 20, type=int), 200)
+    share_counters.flush()     # 先写入内存中尚未落库的计数
+    rows = ShareStats.query.order_by(order.desc()).limit(limit).all()
+    # 统计按 token 的摘要记录，无法在 SQL 中关联 Share，这里在内存中对照（仅管理页面使用）
+    shares = {share_public_id(token): (path, username) for token, path, username in
+              db.session.query(Share.token, Share.relative_path, User.username).join(User, User.id == Share.owner_id)}
+    stats = []
+    for s in rows:
+        path, username = shares.get(s.share_id, (None, None))
+        stats.append({"username": username, "path": path, "views": s.views, "downloads": s.downloads,
+                      "bytes_served": s.bytes_served,
+                      "last_access": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s.last_access)) if s.last_access else "-"})
+    return render_template('hot_shares.html', stats=stats, limit=limit, error=None)
 
 # 访问分享视图
 @app.route('/s/<token>')
 def shared_view(token):
-    share = Share.query.filter_by(token=token).first_or_404()
-    user = share.owner
-    base_path = share.relative_path
-    return render_template_string(templates['shared_view'], username=user.username, token=token, base_path=base_path)
+    share_id, username, base_path = resolve_share(token, 'r')
+    share_counters.record(share_id, views=1)
+    return render_template('shared_view.html', username=username, token=token, base_path=base_path)
 
 # 分享视图访问共享目录的文件树
 @app.route('/s/<token>/api/tree')
 def shared_view_api_tree(token):
-    share = Share.query.filter_by(token=token).first_or_404()
+    _, username, relative_path = resolve_share(token, 'r')
     rel_path = request.args.get('path', '').strip('/')
-    user_base = user_base_dir(share.owner.username)
-    share_base = safe_join(user_base, share.relative_path)
+    user_base = user_base_dir(username)
+    share_base = safe_join(user_base, relative_path)
     try:
         tree = get_file_tree(share_base, rel_path)
         return jsonify(success=True, tree=tree)
@@ -636,19 +865,21 @@ def shared_view_api_tree(token):
 # 分享视图下载文件
 @app.route('/s/<token>/api/download')
 def shared_view_api_download(token):
-    share = Share.query.filter_by(token=token).first_or_404()
+    share_id, username, relative_path = resolve_share(token, 'd')
     path = request.args.get('path', '').strip('/')
-    user_base = user_base_dir(share.owner.username)
-    share_base = safe_join(user_base, share.relative_path)
+    user_base = user_base_dir(username)
+    share_base = safe_join(user_base, relative_path)
     try:
         file_path = safe_join(share_base, path)
         if not os.path.isfile(file_path):
             abort(404)
         directory = os.path.dirname(file_path)
         filename = os.path.basename(file_path)
-        return send_from_directory(directory, filename, as_attachment=True)
+        response = send_from_directory(directory, filename, as_attachment=True)
     except Exception:
         abort(404)
+    share_counters.record_download(share_id, response)
+    return response
 
 if __name__=='__main__':
     app.run(debug=True)
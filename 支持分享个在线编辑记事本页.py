@@ -1,7 +1,12 @@
+import hashlib
+import mimetypes
 import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from flask import (
-    Flask, request, redirect, url_for, render_template_string,
-    send_from_directory, jsonify, flash, abort
+    Flask, request, redirect, url_for, render_template,
+    send_from_directory, jsonify, flash, abort, session
 )
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import (
@@ -12,6 +17,8 @@ from flask_login import (
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from uuid import uuid4
+from jinja2 import DictLoader
+from share_stats import ShareCounters  # 分享访问计数，内存累加后批量写库
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'files')
@@ -23,11 +30,19 @@ ALLOWED_EXTENSIONS = set([
     'mp4', 'webm', 'ogg'
 ])
 
+SHARE_CACHE_BYTES = 32 * 1024 * 1024    # 分享页响应缓存的总大小上限
+SHARE_CACHE_MAX_ITEM = 1024 * 1024      # 超过此大小的响应不进缓存（大文件由 send_from_directory 直接发送）
+
 app = Flask(__name__)
 app.secret_key = 'change_this_to_a_secret_key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# 可查看热门分享统计的用户 id（逗号分隔，由部署者通过环境变量指定）；
+# 注册开放，用户名可以被任何人抢注，所以不按用户名判断
+app.config['ADMIN_USER_IDS'] = {
+    int(i) for i in os.environ.get('NOTEPAD_ADMIN_USER_IDS', '').split(',') if i.strip()
+}
 
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
@@ -52,6 +67,14 @@ class Share(db.Model):
         super().__init__(**kwargs)
         self.token = uuid4().hex
 
+class ShareStats(db.Model):
+    # 按分享 token 统计访问量；单独建表，旧数据库由 create_all 自动补建
+    token = db.Column(db.String(64), primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+    bytes_served = db.Column(db.BigInteger, nullable=False, default=0)
+    last_access = db.Column(db.Float)
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -140,6 +163,286 @@ img, video { max-width: 100%; height: auto; }
 </html>
 """
 
+# 所有页面模板在启动时注册到 Jinja 环境，按名称编译一次后缓存，请求时不再重复编译
+TEMPLATES = {
+    'base.html': base_template,
+    'register.html': '''
+{% extends "base.html" %}
+{% block title %}注册{% endblock %}
+{% block body %}
+<h2>注册新用户</h2>
+<form method="post">
+  <div class="mb-3">
+    <label>用户名</label>
+    <input class="form-control" name="username" required />
+  </div>
+  <div class="mb-3">
+    <label>密码</label>
+    <input class="form-control" type="password" name="password" required />
+  </div>
+  <button class="btn btn-primary">注册</button>
+  <a href="{{ url_for('login') }}" class="btn btn-link">登录</a>
+</form>
+{% endblock %}
+''',
+    'login.html': '''
+{% extends "base.html" %}
+{% block title %}登录{% endblock %}
+{% block body %}
+<h2>登录</h2>
+<form method="post">
+  <div class="mb-3">
+    <label>用户名</label>
+    <input class="form-control" name="username" required />
+  </div>
+  <div class="mb-3">
+    <label>密码</label>
+    <input class="form-control" type="password" name="password" required />
+  </div>
+  <button class="btn btn-primary">登录</button>
+  <a href="{{ url_for('register') }}" class="btn btn-link">注册</a>
+</form>
+{% endblock %}
+''',
+    'files.html': '''
+{% extends "base.html" %}
+{% block title %}文件浏览{% endblock %}
+{% block body %}
+{% if current_user.id in config.ADMIN_USER_IDS %}
+<p class="text-end"><a href="{{ url_for('hot_shares') }}">热门分享</a></p>
+{% endif %}
+{{ bread_html|safe }}
+<div class="d-flex mb-3">
+  <form id="uploadForm" class="d-flex" enctype="multipart/form-data" method="post" action="{{ url_for('upload_file', subpath=safe_subpath) }}">
+    <input type="file" name="file" class="form-control form-control-sm" />
+    <button class="btn btn-sm btn-primary ms-2">上传</button>
+  </form>
+  <button class="btn btn-sm btn-success ms-3" id="btnNewFolder">新建文件夹</button>
+</div>
+<table class="table table-sm table-bordered align-middle">
+  <thead>
+    <tr>
+      <th>名称</th>
+      <th class="text-center" style="width:150px;">操作</th>
+    </tr>
+  </thead>
+  <tbody>
+   {% for d in tree.dirs %}
+    <tr>
+      <td><a href="{{ url_for('files', subpath=(safe_subpath + '/' if safe_subpath else '') + d) }}"><span class="me-2">📁</span>{{ d }}</a></td>
+      <td class="text-center">
+        <button class="btn btn-outline-danger btn-sm btnDel" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + d }}">删除</button>
+        <button class="btn btn-outline-secondary btn-sm btnRename" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + d }}">重命名</button>
+      </td>
+    </tr>
+   {% endfor %}
+   {% for f in tree.files %}
+    <tr>
+      <td>
+        {% if is_text_file(f) %}
+        <span class="me-2">📄</span><a href="{{ url_for('edit_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
+        {% elif f.lower().endswith(('.png','.jpg','.jpeg','.bmp','.gif')) %}
+        <span class="me-2">🖼️</span><a href="{{ url_for('view_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
+        {% elif f.lower().endswith(('.mp4','.webm','.ogg')) %}
+        <span class="me-2">🎞️</span><a href="{{ url_for('view_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
+        {% else %}
+        <span class="me-2">📄</span><a href="{{ url_for('download_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
+        {% endif %}
+      </td>
+      <td class="text-center">
+        <a class="btn btn-outline-primary btn-sm" href="{{ url_for('download_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}" download>下载</a>
+        <button class="btn btn-outline-danger btn-sm btnDel" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + f }}">删除</button>
+        <button class="btn btn-outline-secondary btn-sm btnRename" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + f }}">重命名</button>
+      </td>
+    </tr>
+   {% endfor %}
+  </tbody>
+</table>
+<hr />
+<h5>生成分享链接</h5>
+<form id="formShare" class="row g-2 mb-3">
+  <div class="col-auto">
+    <input type="text" class="form-control" readonly id="sharePath" value="{{ safe_subpath }}">
+  </div>
+  <div class="col-auto">
+    <button class="btn btn-primary" type="submit">生成分享链接</button>
+  </div>
+</form>
+<div id="shareResult"></div>
+{% endblock %}
+{% block scripts %}
+<script>
+// 新建文件夹
+document.getElementById('btnNewFolder').addEventListener('click', function(){
+  let name=prompt('请输入新文件夹名称');
+  if(!name)return alert('名称不能为空');
+  fetch("{{ url_for('mkdir') }}", {
+    method:'POST',
+    headers:{'Content-Type':'application/json'},
+    body:JSON.stringify({parent:"{{ safe_subpath }}", folder_name:name})
+  }).then(r=>r.json()).then(j=> {
+    alert(j.msg);
+    if(j.ok) location.reload();
+  }).catch(()=>alert('请求失败'));
+});
+// 删除
+document.querySelectorAll('.btnDel').forEach(b=>{
+  b.onclick = function(){
+    if(!confirm("确定删除吗？")) return;
+    fetch("{{ url_for('delete') }}", {
+      method:'POST',
+      headers:{'Content-Type':'application/json'},
+      body:JSON.stringify({path:this.dataset.path})
+    }).then(r=>r.json()).then(j=>{
+      alert(j.msg);
+      if(j.ok) location.reload();
+    }).catch(()=>alert('请求失败'));
+  };
+});
+// 重命名
+document.querySelectorAll('.btnRename').forEach(b=>{
+  b.onclick = function(){
+    let oldname=this.dataset.path;
+    let newname=prompt('请输入新名称', oldname.split('/').pop());
+    if(!newname) return alert('新名称不能为空');
+    fetch("{{ url_for('rename') }}", {
+      method:'POST',
+      headers:{'Content-Type':'application/json'},
+      body:JSON.stringify({old_path:oldname, new_name:newname})
+    }).then(r=>r.json()).then(j=>{
+      alert(j.msg);
+      if(j.ok) location.reload();
+    }).catch(()=>alert('请求失败'));
+  };
+});
+// 生成分享链接
+document.getElementById('formShare').onsubmit = function(e){
+  e.preventDefault();
+  let p = document.getElementById('sharePath').value;
+  fetch("{{ url_for('share_create') }}", {
+    method:'POST',
+    headers:{'Content-Type':'application/json'},
+    body:JSON.stringify({path:p})
+  }).then(r => r.json()).then(j => {
+    if(j.ok){
+      document.getElementById('shareResult').innerHTML =
+        '<div class="alert alert-info">分享链接：<a href="'+j.url+'" target="_blank">'+j.url+'</a></div>';
+    } else {
+      alert(j.msg || '失败');
+    }
+  }).catch(()=>alert('请求失败'));
+};
+</script>
+{% endblock %}
+''',
+    'view_image.html': '''
+{% extends "base.html" %}
+{% block title %}图片查看{% endblock %}
+{% block body %}
+  <h4>图片预览: {{ filename }}</h4>
+  <img src="{{ url_for('file_raw', subpath=subpath) }}" alt="{{ filename }}" />
+  <p><a href="{{ url_for('files', subpath=subpath.rsplit('/',1)[0]) }}">返回</a></p>
+{% endblock %}
+''',
+    'view_video.html': '''
+{% extends "base.html" %}
+{% block title %}视频查看{% endblock %}
+{% block body %}
+  <h4>视频播放: {{ filename }}</h4>
+  <video controls autoplay style="max-width:100%">
+    <source src="{{ url_for('file_raw', subpath=subpath) }}" type="video/{{ filename.rsplit('.',1)[-1] }}">
+    您的浏览器不支持视频播放。
+  </video>
+  <p><a href="{{ url_for('files', subpath=subpath.rsplit('/',1)[0]) }}">返回</a></p>
+{% endblock %}
+''',
+    'edit.html': '''
+{% extends "base.html" %}
+{% block title %}编辑 {{ filename }}{% endblock %}
+{% block body %}
+<h4>编辑文件: {{ filename }}</h4>
+<form method="post">
+  <textarea name="content" style="width:100%; height:400px; font-family:monospace; font-size:14px;">{{ content }}</textarea>
+  <br/>
+  <button class="btn btn-primary mt-2">保存</button>
+  <a href="{{ url_for('files', subpath=subpath.rsplit('/', 1)[0]) }}" class="btn btn-secondary mt-2">返回</a>
+</form>
+{% endblock %}
+''',
+    'hot_shares.html': '''
+{% extends "base.html" %}
+{% block title %}热门分享{% endblock %}
+{% block body %}
+<h4>热门分享 Top {{ limit }}</h4>
+<p>排序：
+  {% for key, label in [('views', '浏览'), ('downloads', '下载'), ('bytes', '流量')] %}
+    <a href="{{ url_for('hot_shares', by=key, n=limit) }}" class="me-2">{{ label }}</a>
+  {% endfor %}
+</p>
+<table class="table table-sm">
+  <thead><tr><th>路径</th><th>浏览</th><th>下载</th><th>流量</th><th>最近访问</th></tr></thead>
+  <tbody>
+  {% for s in stats %}
+  <tr>
+    <td>{% if s.path is not none %}<a href="{{ url_for('share_access', token=s.token) }}">{{ s.path }}</a>{% else %}（已删除）{% endif %}</td>
+    <td>{{ s.views }}</td>
+    <td>{{ s.downloads }}</td>
+    <td>{{ s.bytes_served|filesizeformat }}</td>
+    <td>{{ s.last_access }}</td>
+  </tr>
+  {% else %}
+  <tr><td colspan="5">暂无访问记录</td></tr>
+  {% endfor %}
+  </tbody>
+</table>
+{% endblock %}
+''',
+    'share_dir.html': '''
+{% extends "base.html" %}
+{% block title %}分享的目录{% endblock %}
+{% block body %}
+<h4>分享目录（只读）: {{ share.path }}</h4>
+{{ bread_html|safe }}
+<ul>
+{% for d in tree.dirs %}
+  <li>📁 {{ d }}</li>
+{% endfor %}
+{% for f in tree.files %}
+  <li>📄 {{ f }}</li>
+{% endfor %}
+</ul>
+{% endblock %}
+''',
+    'share_text.html': '''
+{% extends "base.html" %}
+{% block title %}分享的文件{% endblock %}
+{% block body %}
+<h4>分享文本文件: {{ share.path }}</h4>
+<pre>{{ content }}</pre>
+{% endblock %}
+''',
+    'share_image.html': '''
+{% extends "base.html" %}
+{% block title %}分享的图片{% endblock %}
+{% block body %}
+<h4>分享图片: {{ share.path }}</h4>
+<img src="{{ url_for('share_raw_file', token=share.token) }}" alt="共享图片" style="max-width:100%"/>
+{% endblock %}
+''',
+    'share_video.html': '''
+{% extends "base.html" %}
+{% block title %}分享的视频{% endblock %}
+{% block body %}
+<h4>分享视频: {{ share.path }}</h4>
+<video controls style="max-width: 100%;" autoplay>
+  <source src="{{ url_for('share_raw_file', token=share.token) }}" type="video/{{ share.path.rsplit('.',1)[-1] }}"/>
+  你的浏览器不支持播放视频。
+</video>
+{% endblock %}
+''',
+}
+app.jinja_loader = DictLoader(TEMPLATES)
+
 @app.route('/register', methods=['GET','POST'])
 def register():
     if current_user.is_authenticated:
@@ -159,25 +462,7 @@ def register():
         db.session.commit()
         flash("注册成功，请登录")
         return redirect(url_for('login'))
-    return render_template_string("""
-    {% extends base_template %}
-    {% block title %}注册{% endblock %}
-    {% block body %}
-    <h2>注册新用户</h2>
-    <form method="post">
-      <div class="mb-3">
-        <label>用户名</label>
-        <input class="form-control" name="username" required />
-      </div>
-      <div class="mb-3">
-        <label>密码</label>
-        <input class="form-control" type="password" name="password" required />
-      </div>
-      <button class="btn btn-primary">注册</button>
-      <a href="{{ url_for('login') }}" class="btn btn-link">登录</a>
-    </form>
-    {% endblock %}
-    """, base_template=base_template)
+    return render_template('register.html')
 
 @app.route('/login', methods=['GET','POST'])
 def login():
@@ -192,25 +477,7 @@ def login():
             return redirect(url_for('files'))
         flash("账号或密码错误")
         return redirect(url_for('login'))
-    return render_template_string("""
-    {% extends base_template %}
-    {% block title %}登录{% endblock %}
-    {% block body %}
-    <h2>登录</h2>
-    <form method="post">
-      <div class="mb-3">
-        <label>用户名</label>
-        <input class="form-control" name="username" required />
-      </div>
-      <div class="mb-3">
-        <label>密码</label>
-        <input class="form-control" type="password" name="password" required />
-      </div>
-      <button class="btn btn-primary">登录</button>
-      <a href="{{ url_for('register') }}" class="btn btn-link">注册</a>
-    </form>
-    {% endblock %}
-    """, base_template=base_template)
+    return render_template('login.html')
 
 @app.route('/logout')
 @login_required
@@ -218,6 +485,91 @@ def logout():
     logout_user()
     return redirect(url_for('login'))
 
+# === 分享页响应缓存 ===
+# 分享链接可能被大量访问，每次都查库、列目录或读整个文本再渲染模板开销很大。
+# 渲染结果按 (token, 页面, 是否登录, 目标 mtime, 大小) 缓存，文件或目录一改动键就变，旧条目随 LRU 淘汰；
+# 同时返回 ETag/Last-Modified，浏览器再次访问时直接得到 304。
+
+SharedItem = namedtuple('SharedItem', 'token path')
+
+class ResponseCache:
+    """按字节数限制总大小的 LRU 缓存"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()   # 键 -> (值, 大小)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > SHARE_CACHE_MAX_ITEM:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+share_cache = ResponseCache(SHARE_CACHE_BYTES)
+
+def write_share_stats(batch):
+    # 一个事务写入一批增量；用 SET x = x + 增量，多进程同时写也不会互相覆盖
+    with app.app_context():
+        now = time.time()
+        for token, (views, downloads, nbytes) in batch.items():
+            updated = ShareStats.query.filter_by(token=token).update({
+                ShareStats.views: ShareStats.views + views,
+                ShareStats.downloads: ShareStats.downloads + downloads,
+                ShareStats.bytes_served: ShareStats.bytes_served + nbytes,
+                ShareStats.last_access: now,
+            }, synchronize_session=False)
+            if not updated:
+                db.session.add(ShareStats(token=token, views=views, downloads=downloads,
+                                          bytes_served=nbytes, last_access=now))
+        db.session.commit()
+
+share_counters = ShareCounters(write_share_stats)
+
+def lookup_share(token):
+    # 分享创建后 token 与路径不再变化，缓存后重复访问不查数据库
+    key = ('share', token)
+    path = share_cache.get(key)
+    if path is None:
+        path = Share.query.filter_by(token=token).first_or_404().path
+        share_cache.put(key, path, len(token) + len(path))
+    return SharedItem(token, path)
+
+def cached_share_response(token, fullpath, render, accept_ranges=False):
+    """render() 返回 (body 字节, mimetype)，仅在缓存未命中时调用"""
+    st = os.stat(fullpath)
+    key = (token, request.endpoint, current_user.is_authenticated, st.st_mtime_ns, st.st_size)
+    if session.get('_flashes'):
+        # 有待显示的提示消息时页面内容不固定，直接渲染且不缓存
+        body, mimetype = render()
+    else:
+        entry = share_cache.get(key)
+        if entry is None:
+            entry = render()
+            share_cache.put(key, entry, len(entry[0]))
+        body, mimetype = entry
+    response = app.response_class(body, mimetype=mimetype)
+    response.set_etag(hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+    response.last_modified = st.st_mtime
+    response.cache_control.no_cache = True     # 允许浏览器缓存，但每次用 ETag 向服务器确认
+    return response.make_conditional(request, accept_ranges=accept_ranges, complete_length=len(body))
+
 def breadcrumb_paths(path):
     parts = []
     if not path:
@@ -266,136 +618,8 @@ def files(subpath):
     tree = build_tree(fullpath)
     bread_html = render_breadcrumb(safe_subpath)
 
-    template = """
-    {% extends base_template %}
-    {% block title %}文件浏览{% endblock %}
-    {% block body %}
-    {{ bread_html|safe }}
-    <div class="d-flex mb-3">
-      <form id="uploadForm" class="d-flex" enctype="multipart/form-data" method="post" action="{{ url_for('upload_file', subpath=safe_subpath) }}">
-        <input type="file" name="file" class="form-control form-control-sm" />
-        <button class="btn btn-sm btn-primary ms-2">上传</button>
-      </form>
-      <button class="btn btn-sm btn-success ms-3" id="btnNewFolder">新建文件夹</button>
-    </div>
-    <table class="table table-sm table-bordered align-middle">
-      <thead>
-        <tr>
-          <th>名称</th>
-          <th class="text-center" style="width:150px;">操作</th>
-        </tr>
-      </thead>
-      <tbody>
-       {% for d in tree.dirs %}
-        <tr>
-          <td><a href="{{ url_for('files', subpath=(safe_subpath + '/' if safe_subpath else '') + d) }}"><span class="me-2">📁</span>{{ d }}</a></td>
-          <td class="text-center">
-            <button class="btn btn-outline-danger btn-sm btnDel" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + d }}">删除</button>
-            <button class="btn btn-outline-secondary btn-sm btnRename" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + d }}">重命名</button>
-          </td>
-        </tr>
-       {% endfor %}
-       {% for f in tree.files %}
-        <tr>
-          <td>
-            {% if is_text_file(f) %}
-            <span class="me-2">📄</span><a href="{{ url_for('edit_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
-            {% elif f.lower().endswith(('.png','.jpg','.jpeg','.bmp','.gif')) %}
-            <span class="me-2">🖼️</span><a href="{{ url_for('view_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
-            {% elif f.lower().endswith(('.mp4','.webm','.ogg')) %}
-            <span class="me-2">🎞️</span><a href="{{ url_for('view_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
-            {% else %}
-            <span class="me-2">📄</span><a href="{{ url_for('download_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}">{{ f }}</a>
-            {% endif %}
-          </td>
-          <td class="text-center">
-            <a class="btn btn-outline-primary btn-sm" href="{{ url_for('download_file', subpath=(safe_subpath + '/' if safe_subpath else '') + f) }}" download>下载</a>
-            <button class="btn btn-outline-danger btn-sm btnDel" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + f }}">删除</button>
-            <button class="btn btn-outline-secondary btn-sm btnRename" data-path="{{ (safe_subpath + '/' if safe_subpath else '') + f }}">重命名</button>
-          </td>
-        </tr>
-       {% endfor %}
-      </tbody>
-    </table>
-    <hr />
-    <h5>生成分享链接</h5>
-    <form id="formShare" class="row g-2 mb-3">
-      <div class="col-auto">
-        <input type="text" class="form-control" readonly id="sharePath" value="{{ safe_subpath }}">
-      </div>
-      <div class="col-auto">
-        <button class="btn btn-primary" type="submit">生成分享链接</button>
-      </div>
-    </form>
-    <div id="shareResult"></div>
-    {% endblock %}
-    {% block scripts %}
-    <script>
-    // 新建文件夹
-    document.getElementById('btnNewFolder').addEventListener('click', function(){
-      let name=prompt('请输入新文件夹名称');
-      if(!name)return alert('名称不能为空');
-      fetch("{{ url_for('mkdir') }}", {
-        method:'POST',
-        headers:{'Content-Type':'application/json'},
-        body:JSON.stringify({parent:"{{ safe_subpath }}", folder_name:name})
-      }).then(r=>r.json()).then(j=> {
-        alert(j.msg);
-        if(j.ok) location.reload();
-      }).catch(()=>alert('请求失败'));
-    });
-    // 删除
-    document.querySelectorAll('.btnDel').forEach(b=>{
-      b.onclick = function(){
-        if(!confirm("确定删除吗？")) return;
-        fetch("{{ url_for('delete') }}", {
-          method:'POST',
-          headers:{'Content-Type':'application/json'},
-          body:JSON.stringify({path:this.dataset.path})
-        }).then(r=>r.json()).then(j=>{
-          alert(j.msg);
-          if(j.ok) location.reload();
-        }).catch(()=>alert('请求失败'));
-      };
-    });
-    // 重命名
-    document.querySelectorAll('.btnRename').forEach(b=>{
-      b.onclick = function(){
-        let oldname=this.dataset.path;
-        let newname=prompt('请输入新名称', oldname.split('/').pop());
-        if(!newname) return alert('新名称不能为空');
-        fetch("{{ url_for('rename') }}", {
-          method:'POST',
-          headers:{'Content-Type':'application/json'},
-          body:JSON.stringify({old_path:oldname, new_name:newname})
-        }).then(r=>r.json()).then(j=>{
-          alert(j.msg);
-          if(j.ok) location.reload();
-        }).catch(()=>alert('请求失败'));
-      };
-    });
-    // 生成分享链接
-    document.getElementById('formShare').onsubmit = function(e){
-      e.preventDefault();
-      let p = document.getElementById('sharePath').value;
-      fetch("{{ url_for('share_create') }}", {
-        method:'POST',
-        headers:{'Content-Type':'application/json'},
-        body:JSON.stringify({path:p})
-      }).then(r => r.json()).then(j => {
-        if(j.ok){
-          document.getElementById('shareResult').innerHTML =
-            '<div class="alert alert-info">分享链接：<a href="'+j.url+'" target="_blank">'+j.url+'</a></div>';
-        } else {
-          alert(j.msg || '失败');
-        }
-      }).catch(()=>alert('请求失败'));
-    };
-    </script>
-    {% endblock %}
-    """
-    return render_template_string(template,
-        base_template=base_template, safe_subpath=safe_subpath,
+    return render_template('files.html',
+        safe_subpath=safe_subpath,
         tree=tree, bread_html=bread_html, is_text_file=is_text_file)
 
 @app.route('/upload/<path:subpath>', methods=['POST'])
@@ -455,29 +679,10 @@ def view_file(subpath):
     folder, filename = os.path.split(full_path)
     if ext in ('png', 'jpg', 'jpeg', 'bmp', 'gif'):
         # 图片直接显示
-        return render_template_string("""
-        {% extends base_template %}
-        {% block title %}图片查看{% endblock %}
-        {% block body %}
-          <h4>图片预览: {{ filename }}</h4>
-          <img src="{{ url_for('file_raw', subpath=subpath) }}" alt="{{ filename }}" />
-          <p><a href="{{ url_for('files', subpath=subpath.rsplit('/',1)[0]) }}">返回</a></p>
-        {% endblock %}
-        """, base_template=base_template, filename=filename, subpath=subpath)
+        return render_template('view_image.html', filename=filename, subpath=subpath)
     elif ext in ('mp4','webm','ogg'):
         # 视频播放
-        return render_template_string("""
-        {% extends base_template %}
-        {% block title %}视频查看{% endblock %}
-        {% block body %}
-          <h4>视频播放: {{ filename }}</h4>
-          <video controls autoplay style="max-width:100%">
-            <source src="{{ url_for('file_raw', subpath=subpath) }}" type="video/{{ filename.rsplit('.',1)[-1] }}">
-            您的浏览器不支持视频播放。
-          </video>
-          <p><a href="{{ url_for('files', subpath=subpath.rsplit('/',1)[0]) }}">返回</a></p>
-        {% endblock %}
-        """, base_template=base_template, filename=filename, subpath=subpath)
+        return render_template('view_video.html', filename=filename, subpath=subpath)
     else:
         return redirect(url_for('download_file', subpath=subpath))
 
@@ -526,19 +731,7 @@ def edit_file(subpath):
         flash('读取文件失败: '+str(e))
         return redirect(url_for('files'))
     filename = os.path.basename(full_path)
-    return render_template_string("""
-    {% extends base_template %}
-    {% block title %}编辑 {{ filename }}{% endblock %}
-    {% block body %}
-    <h4>编辑文件: {{ filename }}</h4>
-    <form method="post">
-      <textarea name="content" style="width:100%; height:400px; font-family:monospace; font-size:14px;">{{ content }}</textarea>
-      <br/>
-      <button class="btn btn-primary mt-2">保存</button>
-      <a href="{{ url_for('files', subpath=subpath.rsplit('/', 1)[0]) }}" class="btn btn-secondary mt-2">返回</a>
-    </form>
-    {% endblock %}
-    """, base_template=base_template, filename=filename, content=content, subpath=subpath)
+    return render_template('edit.html', filename=filename, content=content, subpath=subpath)
 
 @app.route('/mkdir', methods=['POST'])
 @login_required
@@ -657,78 +850,64 @@ def share_create():
     url = url_for('share_access', token=share.token, _external=True)
     return jsonify(ok=True, url=url)
 
+@app.route('/admin/hot_shares')
+@login_required
+def hot_shares():
+    if current_user.id not in app.config['ADMIN_USER_IDS']:
+        abort(403)
+    order = {'views': ShareStats.views, 'downloads': ShareStats.downloads,
+             'bytes': ShareStats.bytes_served}.get(request.args.get('by'), ShareStats.views)
+    limit = min(request.args.get('n', 20, type=int), 200)
+    share_counters.flush()     # 先写入内存中尚未落库的计数
+    rows = db.session.query(ShareStats, Share.path).outerjoin(
+        Share, Share.token == ShareStats.token
+    ).order_by(order.desc()).limit(limit).all()
+    stats = [{'token': s.token, 'path': path, 'views': s.views, 'downloads': s.downloads,
+              'bytes_served': s.bytes_served,
+              'last_access': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s.last_access)) if s.last_access else '-'}
+             for s, path in rows]
+    return render_template('hot_shares.html', stats=stats, limit=limit)
+
 @app.route('/s/<token>')
 def share_access(token):
-    share = Share.query.filter_by(token=token).first_or_404()
+    share = lookup_share(token)
+    share_counters.record(token, views=1)
     try:
         fullpath = secure_path_join(UPLOAD_FOLDER, share.path)
     except:
         abort(404)
     if os.path.isdir(fullpath):
         # 显示目录（同 files）
-        tree = build_tree(fullpath)
-        bread_html = render_breadcrumb(share.path)
-        return render_template_string("""
-        {% extends base_template %}
-        {% block title %}分享的目录{% endblock %}
-        {% block body %}
-        <h4>分享目录（只读）: {{ share.path }}</h4>
-        {{ bread_html|safe }}
-        <ul>
-        {% for d in tree.dirs %}
-          <li>📁 {{ d }}</li>
-        {% endfor %}
-        {% for f in tree.files %}
-          <li>📄 {{ f }}</li>
-        {% endfor %}
-        </ul>
-        {% endblock %}
-        """, base_template=base_template, tree=tree, share=share, bread_html=bread_html)
+        def render():
+            tree = build_tree(fullpath)
+            bread_html = render_breadcrumb(share.path)
+            return render_template('share_dir.html', tree=tree, share=share, bread_html=bread_html).encode('utf-8'), 'text/html'
+        return cached_share_response(token, fullpath, render)
     elif os.path.isfile(fullpath):
         ext = fullpath.rsplit('.',1)[-1].lower()
         if is_text_file(fullpath):
-            try:
-                with open(fullpath,'r',encoding='utf-8') as f:
-                    content = f.read()
-            except:
-                content = ""
-            return render_template_string("""
-            {% extends base_template %}
-            {% block title %}分享的文件{% endblock %}
-            {% block body %}
-            <h4>分享文本文件: {{ share.path }}</h4>
-            <pre>{{ content }}</pre>
-            {% endblock %}
-            """, base_template=base_template, share=share, content=content)
+            def render():
+                try:
+                    with open(fullpath,'r',encoding='utf-8') as f:
+                        content = f.read()
+                except:
+                    content = ""
+                return render_template('share_text.html', share=share, content=content).encode('utf-8'), 'text/html'
         elif ext in ('png','jpg','jpeg','bmp','gif'):
-            return render_template_string("""
-            {% extends base_template %}
-            {% block title %}分享的图片{% endblock %}
-            {% block body %}
-            <h4>分享图片: {{ share.path }}</h4>
-            <img src="{{ url_for('share_raw_file', token=share.token) }}" alt="共享图片" style="max-width:100%"/>
-            {% endblock %}
-            """, base_template=base_template, share=share)
+            def render():
+                return render_template('share_image.html', share=share).encode('utf-8'), 'text/html'
         elif ext in ('mp4','webm','ogg'):
-            return render_template_string("""
-            {% extends base_template %}
-            {% block title %}分享的视频{% endblock %}
-            {% block body %}
-            <h4>分享视频: {{ share.path }}</h4>
-            <video controls style="max-width: 100%;" autoplay>
-              <source src="{{ url_for('share_raw_file', token=share.token) }}" type="video/{{ share.path.rsplit('.',1)[-1] }}"/>
-              你的浏览器不支持播放视频。
-            </video>
-            {% endblock %}
-            """, base_template=base_template, share=share)
+            def render():
+                return render_template('share_video.html', share=share).encode('utf-8'), 'text/html'
         else:
             return redirect(url_for('share_raw_file', token=share.token))
+        return cached_share_response(token, fullpath, render)
     else:
         abort(404)
 
 @app.route('/s/<token>/raw')
 def share_raw_file(token):
-    share = Share.query.filter_by(token=token).first_or_404()
+    share = lookup_share(token)
     try:
         fullpath = secure_path_join(UPLOAD_FOLDER, share.path)
     except:
@@ -736,7 +915,17 @@ def share_raw_file(token):
     if not os.path.isfile(fullpath):
         abort(404)
     folder, filename = os.path.split(fullpath)
-    return send_from_directory(folder, filename)
+    if os.path.getsize(fullpath) > SHARE_CACHE_MAX_ITEM:
+        # 大文件不占用缓存，send_from_directory 本身支持 ETag/Range
+        response = send_from_directory(folder, filename)
+    else:
+        def render():
+            with open(fullpath, 'rb') as f:
+                body = f.read()
+            return body, mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = cached_share_response(token, fullpath, render, accept_ranges=True)
+    share_counters.record_download(token, response)
+    return response
 
 # 初始化数据库和首个用户
 @app.before_first_request
@@ -1,6 +1,9 @@
 from flask import Flask, request, jsonify, send_from_directory, render_template_string, redirect, url_for, flash  # 导入Flask相关模块
 import os  # 文件和路径操作
 import sqlite3  # 数据库操作
+import threading  # 线程本地连接与缓存锁
+import time  # 缓存过期时间
+from collections import OrderedDict  # LRU缓存
 from werkzeug.security import generate_password_hash, check_password_hash  # 密码加密验证
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required  # 登录管理相关
 from datetime import timedelta  # 时间处理
@@ -22,16 +25,53 @@ def initialize_database():  # 初始化数据库
 
 initialize_database()  # 确保数据库和表存在
 
+class User(UserMixin):  # flask-login需要的用户对象（提供is_authenticated、get_id等）
+    def __init__(self, user_id, username):
+        self.id = str(user_id)
+        self.username = username
+
+USER_CACHE_TTL = 300  # 用户缓存有效期（秒）
+USER_CACHE_SIZE = 1024  # 用户缓存最多条目数
+_user_cache = OrderedDict()  # user_id -> (User或None, 过期时间)，None表示用户不存在
+_user_cache_lock = threading.Lock()
+_thread_local = threading.local()  # 每个线程一个持久数据库连接
+
+def get_connection():  # 获取当前线程的持久连接，避免每个请求都重新打开数据库
+    connection = getattr(_thread_local, 'connection', None)
+    if connection is None:
+        connection = sqlite3.connect(DATABASE_PATH)
+        _thread_local.connection = connection
+    return connection
+
+def invalidate_user(user_id=None):  # 注册、删除用户后清除缓存，不传参数则全部清除
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(str(user_id), None)
+
 @login_manager.user_loader
-def load_user(user_id):  # flask-login载入用户函数
-    with sqlite3.connect(DATABASE_PATH) as connection:
-        row = connection.execute('SELECT id, username FROM users WHERE id=?', (user_id,)).fetchone()  # 查询用户
-    if row:
-        user_id_value, username_value = row
-        # 用字典模拟User对象，必须有id和is_authenticated属性
-        user_object = {'id': str(user_id_value), 'username': username_value, 'is_authenticated': True}
-        return user_object  # 返回用户字典
-    return None
+def load_user(user_id):  # flask-login载入用户函数，先查内存缓存，未命中再查库
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is not None and entry[1] > now:
+            _user_cache.move_to_end(user_id)
+            return entry[0]
+    row = get_connection().execute('SELECT id, username FROM users WHERE id=?', (user_id,)).fetchone()  # 查询用户
+    user_object = User(row[0], row[1]) if row else None
+    with _user_cache_lock:
+        _user_cache[user_id] = (user_object, now + USER_CACHE_TTL)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)  # 淘汰最久未使用的条目
+    return user_object
+
+def delete_user(user_id):  # 删除用户并清除其缓存
+    connection = get_connection()
+    with connection:
+        connection.execute('DELETE FROM users WHERE id=?', (user_id,))
+    invalidate_user(user_id)
 
 def safe_path(requested_path):  # 检查路径安全，防止目录穿越攻击
     absolute_path = os.path.abspath(os.path.join(ROOT_DIRECTORY, requested_path.strip('/')))  # 计算绝对路径
@@ -72,7 +112,7 @@ def login():  # 登录接口
         if row:
             user_identifier, password_hash_value = row
             if check_password_hash(password_hash_value, password_value):  # 验证密码
-                user_instance = {'id': str(user_identifier), 'username': username_value, 'is_authenticated': True}  # 构造用户字典
+                user_instance = User(user_identifier, username_value)  # 构造用户对象
                 login_user(user_instance)  # 登录用户
                 flash('登录成功！')  # 提示
                 return redirect(url_for('index'))  # 跳转首页
@@ -100,10 +140,12 @@ def register():  # 注册接口
                     flash('用户名已被注册')
                 else:
                     hashed_password = generate_password_hash(password_value)  # 哈希密码
-                    connection.execute(
+                    cursor = connection.execute(
                         'INSERT INTO users (username, password_hash) VALUES (?, ?)',
                         (username_value, hashed_password)
                     )  # 插入新用户
+                    connection.commit()
+                    invalidate_user(cursor.lastrowid)  # 清除该id可能缓存的“用户不存在”记录
                     flash('注册成功，请登录')
                     return redirect(url_for('login'))
     return render_template_string(REGISTER_PAGE_HTML)  # 注册页面
@@ -4,156 +4,142 @@
 import os
 import sys
 import json
-import struct
 import base64
 import hashlib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import mmap
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import getpass
+import argparse
+from datetime import datetime
+
+import cipher_backends
+import compress_stage
+import key_agent
+from batch_scheduler import BudgetScheduler, DEFAULT_BUDGET_MB, file_sizes
+
+TAIL_END = b"###END###"                     # 旧格式 JSON 尾部结束标记
+LEGACY_TAIL_MAX = 1024 + len(TAIL_END)      # 旧格式尾部最多占用的字节数
+# 二进制尾部：magic(8) | version(1) | nonce(12) | tag(16) | 密文长度(8)，固定 45 字节
+# version 1：密文即原文；version 2：明文首字节为压缩编码，其后为压缩数据。
+# version 2 把 magic 与 version 作为 AAD 参与认证，改动版本字节会导致 tag 校验失败；
+# 密文长度在加密前未知（压缩），由 read_footer 与文件大小比对约束。version 1 保持无 AAD 以兼容旧文件
+FOOTER = struct.Struct("<8sB12s16sQ")
+FOOTER_MAGIC = b"CC20FOOT"
+FOOTER_VERSION = 1
+FOOTER_VERSION_COMPRESSED = 2
+CHUNK_SIZE = 1024 * 1024
+ALGORITHM = cipher_backends.CHACHA20_POLY1305
+
+class TruncatedError(ValueError):
+    pass
+
+class NullWriter:
+    # 校验模式下丢弃解密输出
+    def write(self, data):
+        return len(data)
+
+class CompressingContext:
+    # 先压缩后加密：包装加密上下文，接口与加密上下文一致
+    def __init__(self, enc, compressor):
+        self.enc = enc
+        self.compressor = compressor
+
+    def update(self, data):
+        return self.enc.update(self.compressor.compress(data))
+
+class DecompressingWriter:
+    # 解密输出的首字节为压缩编码，其后的数据边解压边写入；
+    # 只用于 tag 已校验通过的文件（见 decrypt_file），解压器不会处理被篡改的数据
+    def __init__(self, f_out):
+        self.f_out = f_out
+        self.dec = None
+        self.error = None
+
+    def write(self, data):
+        if self.error is not None:
+            return
+        if self.dec is None:
+            if not data:
+                return
+            try:
+                self.dec = compress_stage.StreamDecompressor(data[0])
+            except ValueError as e:
+                self.error = e             # 先让 tag 校验报告篡改，再报告此错误
+                return
+            data = data[1:]
+        for piece in self.dec.feed(data):
+            self.f_out.write(piece)
+
+    def finish(self):
+        if self.error is not None:
+            raise self.error
+        if self.dec is None:
+            raise ValueError("缺少压缩编码标记")
+        self.dec.finish()
+
+def footer_aad(version):
+    return b"" if version == FOOTER_VERSION else FOOTER_MAGIC + bytes([version])
+
+def read_at(f, size, offset):
+    # 定位读取：支持 os.pread 的平台只需一次系统调用
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset)
+    return f.read(size)
 
-TAIL_END = b"###END###"
-
-def rotate_left(v, c):
-    return ((v << c) & 0xffffffff) | (v >> (32 - c))
-
-def quarter_round(state, a, b, c, d):
-    state[a] = (state[a] + state[b]) & 0xffffffff
-    state[d] ^= state[a]
-    state[d] = rotate_left(state[d], 16)
-    state[c] = (state[c] + state[d]) & 0xffffffff
-    state[b] ^= state[c]
-    state[b] = rotate_left(state[b], 12)
-    state[a] = (state[a] + state[b]) & 0xffffffff
-    state[d] ^= state[a]
-    state[d] = rotate_left(state[d], 8)
-    state[c] = (state[c] + state[d]) & 0xffffffff
-    state[b] ^= state[c]
-    state[b] = rotate_left(state[b], 7)
-
-def chacha20_block(key, counter, nonce):
-    if len(key) != 32 or len(nonce) != 12:
-        raise ValueError("Key必须32字节，Nonce必须12字节")
-    constants = b"expand 32-byte k"
-    state_bytes = constants + key + struct.pack("<I", counter) + nonce
-    state = list(struct.unpack("<16I", state_bytes))
-    working = state[:]
-    for _ in range(10):
-        quarter_round(working, 0, 4, 8,12)
-        quarter_round(working, 1, 5, 9,13)
-        quarter_round(working, 2, 6,10,14)
-        quarter_round(working, 3, 7,11,15)
-        quarter_round(working, 0, 5,10,15)
-        quarter_round(working, 1, 6,11,12)
-        quarter_round(working, 2, 7, 8,13)
-        quarter_round(working, 3, 4, 9,14)
-    result = []
-    for i in range(16):
-        result.append((working[i] + state[i]) & 0xffffffff)
-    return struct.pack("<16I", *result)
-
-def chacha20_encrypt(key, nonce, counter, plaintext):
-    out = bytearray(len(plaintext))
-    block_count = (len(plaintext) + 63) // 64
-    for i in range(block_count):
-        keystream = chacha20_block(key, counter + i, nonce)
-        for j in range(64):
-            idx = i * 64 + j
-            if idx >= len(plaintext):
-                break
-            out[idx] = plaintext[idx] ^ keystream[j]
-    return bytes(out)
-
-def poly1305_clamp(r):
-    r_list = list(r)
-    r_list[3] &= 15
-    r_list[7] &= 15
-    r_list[11] &= 15
-    r_list[15] &= 15
-    r_list[4] &= 252
-    r_list[8] &= 252
-    r_list[12] &= 252
-    return bytes(r_list)
-
-def poly1305_mac(msg, key):
-    if len(key) != 32:
-        raise ValueError("Poly1305密钥必须32字节")
-    r = poly1305_clamp(key[:16])
-    s = key[16:]
-    p = (1 << 130) - 5
-    # 转换r为整数
-    r_num = 0
-    for i in range(16):
-        r_num |= r[i] << (8 * i)
-    acc = 0
-    # 每16字节分块累加计算
-    offset = 0
-    msg_len = len(msg)
-    while offset < msg_len:
-        block = msg[offset:offset+16]
-        n = 0
-        for i in range(len(block)):
-            n |= block[i] << (8 * i)
-        n += 1 << (8 * len(block))
-        acc = (acc + n) % p
-        acc = (acc * r_num) % p
-        offset += 16
-    s_num = 0
-    for i in range(16):
-        s_num |= s[i] << (8 * i)
-    acc = (acc + s_num) % (1 << 128)
-    # 输出16字节tag
-    tag = bytearray(16)
-    for i in range(16):
-        tag[i] = (acc >> (8 * i)) & 0xff
-    return bytes(tag)
-
-def pad16(data):
-    pad_len = (16 - (len(data) % 16)) % 16
-    if pad_len == 0:
-        return data
-    return data + b'\x00' * pad_len
-
-def poly1305_input(aad, ciphertext):
-    result = pad16(aad)
-    result += pad16(ciphertext)
-    result += struct.pack("<Q", len(aad))
-    result += struct.pack("<Q", len(ciphertext))
-    return result
-
-def chacha20poly1305_encrypt(key, plaintext, nonce, aad=b""):
-    poly_key = chacha20_block(key, 0, nonce)[:32]
-    ciphertext = chacha20_encrypt(key, nonce, 1, plaintext)
-    auth_data = poly1305_input(aad, ciphertext)
-    tag = poly1305_mac(auth_data, poly_key)
-    return ciphertext, tag
-
-def chacha20poly1305_decrypt(key, ciphertext, nonce, tag, aad=b""):
-    poly_key = chacha20_block(key, 0, nonce)[:32]
-    auth_data = poly1305_input(aad, ciphertext)
-    expected_tag = poly1305_mac(auth_data, poly_key)
-    if expected_tag != tag:
-        raise ValueError("认证失败，标签不匹配")
-    plaintext = chacha20_encrypt(key, nonce, 1, ciphertext)
-    return plaintext
-
-def encode_tail(nonce, tag):
-    obj = {"nonce": base64.b64encode(nonce).decode("ascii"), "tag": base64.b64encode(tag).decode("ascii")}
-    return json.dumps(obj, separators=(',', ':')).encode("utf-8") + TAIL_END
+def stream_region(f_in, offset, length, ctx, f_out):
+    # 通过 mmap 分块处理 [offset, offset+length)，不把整个文件读入内存
+    if length == 0:
+        return
+    with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        end = offset + length
+        for pos in range(offset, end, CHUNK_SIZE):
+            f_out.write(ctx.update(mm[pos:min(pos + CHUNK_SIZE, end)]))
 
 def decode_tail(filedata):
+    # 旧格式：密文 || {"nonce":..,"tag":..} || ###END###
     idx = filedata.rfind(TAIL_END)
     if idx == -1:
         raise ValueError("未找到尾部标记")
-    search_start = max(0, idx - 1024)
-    for start in range(idx - 1, search_start - 1, -1):
-        try:
-            js = filedata[start:idx]
-            obj = json.loads(js.decode("utf-8"))
-            nonce = base64.b64decode(obj["nonce"])
-            tag = base64.b64decode(obj["tag"])
-            return nonce, tag, start
-        except Exception:
-            continue
-    raise ValueError("尾部结构解析失败")
+    # base64 中不含花括号，标记前最后一个 "{" 即为 JSON 起点
+    start = filedata.rfind(b"{", 0, idx)
+    try:
+        obj = json.loads(filedata[start:idx].decode("utf-8"))
+        nonce = base64.b64decode(obj["nonce"])
+        tag = base64.b64decode(obj["tag"])
+    except Exception:
+        raise ValueError("尾部结构解析失败")
+    return nonce, tag, start
+
+def read_footer(f, size):
+    # 返回 (nonce, tag, 密文长度, 尾部版本)；只读取文件末尾，兼容旧的 JSON 尾部格式
+    if size >= FOOTER.size:
+        magic, version, nonce, tag, length = FOOTER.unpack(read_at(f, FOOTER.size, size - FOOTER.size))
+        if magic == FOOTER_MAGIC:
+            if version not in (FOOTER_VERSION, FOOTER_VERSION_COMPRESSED):
+                raise ValueError(f"不支持的尾部版本: {version}")
+            if length != size - FOOTER.size:
+                raise TruncatedError("文件长度与尾部记录不符，可能已被截断")
+            return nonce, tag, length, version
+    tail_len = min(size, LEGACY_TAIL_MAX)
+    nonce, tag, start = decode_tail(read_at(f, tail_len, size - tail_len))
+    return nonce, tag, size - tail_len + start, FOOTER_VERSION
+
+def make_temp(filepath):
+    # 在同目录创建临时文件，处理完成后原子替换原文件
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filepath) or ".",
+                               prefix="." + os.path.basename(filepath) + ".", suffix=".tmp")
+    return os.fdopen(fd, "wb"), tmp
+
+def remove_temp(tmp):
+    try:
+        os.remove(tmp)
+    except OSError:
+        pass
 
 def backup_file_attrs(filename):
     try:
@@ -171,65 +157,134 @@ def restore_file_attrs(filename, times, mode):
     except Exception:
         pass
 
+KDF_SALT = b"ChaCha20Poly1305Salt"
+KDF_ITERATIONS = 100000
+
 def derive_key(password):
-    salt = b"ChaCha20Poly1305Salt"
-    key = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, 100000, 32)
+    key = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), KDF_SALT, KDF_ITERATIONS, 32)
     return key
 
-def encrypt_file(filepath, key):
+def agent_key(handle, socket_path=None):
+    # 向密钥代理请求与 derive_key 相同参数派生的密钥，代理已缓存时无需重新计算 PBKDF2
+    agent = key_agent.AgentKey(handle, "sha256", "utf-8", KDF_ITERATIONS, 32, socket_path)
+    return agent.derive(KDF_SALT)
+
+def encrypt_file(filepath, key, backend, compress="none"):
+    times, mode = backup_file_attrs(filepath)
     try:
-        f = open(filepath, "rb")
-        plaintext = f.read()
-        f.close()
+        f_in = open(filepath, "rb")
     except Exception as e:
         print(f"[读取失败] {filepath} : {e}")
         return False
     nonce = os.urandom(12)
-    ciphertext, tag = chacha20poly1305_encrypt(key, plaintext, nonce)
-    times, mode = backup_file_attrs(filepath)
+    f_out, tmp = None, None
     try:
-        f = open(filepath, "wb")
-        f.write(ciphertext)
-        f.write(encode_tail(nonce, tag))
-        f.close()
+        with f_in:
+            size = os.fstat(f_in.fileno()).st_size
+            codec = "none"
+            if compress != "none":
+                codec = compress_stage.choose_codec(compress, read_at(f_in, compress_stage.SAMPLE_SIZE, 0))
+            version = FOOTER_VERSION if codec == "none" else FOOTER_VERSION_COMPRESSED
+            enc = backend.encryptor(ALGORITHM, key, nonce, footer_aad(version))
+            f_out, tmp = make_temp(filepath)
+            with f_out:
+                if codec == "none":
+                    stream_region(f_in, 0, size, enc, f_out)
+                    length = size
+                else:
+                    compressor = compress_stage.Compressor(codec)
+                    f_out.write(enc.update(bytes([compress_stage.CODEC_IDS[codec]])))
+                    stream_region(f_in, 0, size, CompressingContext(enc, compressor), f_out)
+                    f_out.write(enc.update(compressor.flush()))
+                    length = f_out.tell()
+                f_out.write(FOOTER.pack(FOOTER_MAGIC, version, nonce, enc.finalize(), length))
+        os.replace(tmp, filepath)
         restore_file_attrs(filepath, times, mode)
         print(f"[加密成功] {filepath}")
         return True
     except Exception as e:
+        if tmp:
+            remove_temp(tmp)
         print(f"[写入失败] {filepath} : {e}")
         return False
 
-def decrypt_file(filepath, key):
+def decrypt_file(filepath, key, backend):
+    times, mode = backup_file_attrs(filepath)
     try:
-        f = open(filepath, "rb")
-        data = f.read()
-        f.close()
+        f_in = open(filepath, "rb")
     except Exception as e:
         print(f"[读取失败] {filepath} : {e}")
         return False
+    with f_in:
+        try:
+            nonce, tag, length, version = read_footer(f_in, os.fstat(f_in.fileno()).st_size)
+        except Exception as e:
+            print(f"[尾部解析失败] {filepath} : {e}")
+            return False
+        if version == FOOTER_VERSION_COMPRESSED:
+            # 先完整校验 tag，确认未被篡改后才把数据交给解压器
+            check = backend.decryptor(ALGORITHM, key, nonce, footer_aad(version))
+            try:
+                stream_region(f_in, 0, length, check, NullWriter())
+                check.verify(tag)
+            except ValueError:
+                print(f"[认证失败] {filepath} : 认证失败，标签不匹配")
+                return False
+            except Exception as e:
+                print(f"[读取失败] {filepath} : {e}")
+                return False
+        dec = backend.decryptor(ALGORITHM, key, nonce, footer_aad(version))
+        tmp = None
+        try:
+            f_out, tmp = make_temp(filepath)
+            with f_out:
+                writer = DecompressingWriter(f_out) if version == FOOTER_VERSION_COMPRESSED else f_out
+                stream_region(f_in, 0, length, dec, writer)   # 明文只写入临时文件
+            try:
+                dec.verify(tag)
+            except ValueError:
+                remove_temp(tmp)
+                print(f"[认证失败] {filepath} : 认证失败，标签不匹配")
+                return False
+            if writer is not f_out:
+                writer.finish()
+        except Exception as e:
+            if tmp:
+                remove_temp(tmp)
+            print(f"[写入失败] {filepath} : {e}")
+            return False
     try:
-        nonce, tag, tail_start = decode_tail(data)
-    except Exception as e:
-        print(f"[尾部解析失败] {filepath} : {e}")
-        return False
-    ciphertext = data[:tail_start]
-    try:
-        plaintext = chacha20poly1305_decrypt(key, ciphertext, nonce, tag)
-    except Exception as e:
-        print(f"[认证失败] {filepath} : {e}")
-        return False
-    times, mode = backup_file_attrs(filepath)
-    try:
-        f = open(filepath, "wb")
-        f.write(plaintext)
-        f.close()
+        os.replace(tmp, filepath)
         restore_file_attrs(filepath, times, mode)
         print(f"[解密成功] {filepath}")
         return True
     except Exception as e:
+        remove_temp(tmp)
         print(f"[写入失败] {filepath} : {e}")
         return False
 
+def verify_file(filepath, key, backend):
+    # 只校验 tag，不写任何文件；返回 (状态, 说明)
+    try:
+        f_in = open(filepath, "rb")
+    except Exception as e:
+        return "unreadable", str(e)
+    with f_in:
+        try:
+            nonce, tag, length, version = read_footer(f_in, os.fstat(f_in.fileno()).st_size)
+        except TruncatedError as e:
+            return "truncated", str(e)
+        except ValueError as e:
+            # 尾部在文件末尾，正文被截断时尾部随之丢失，与未加密的文件无法区分
+            return "wrong_format", f"{e}（文件未加密，或尾部已随截断丢失）"
+        dec = backend.decryptor(ALGORITHM, key, nonce, footer_aad(version))
+        stream_region(f_in, 0, length, dec, NullWriter())
+    try:
+        dec.verify(tag)
+    except ValueError:
+        return "bad_tag", "认证失败，标签不匹配（文件被篡改或损坏）"
+    return "ok", ""
+
 def collect_files(path):
     files = []
     if os.path.isfile(path):
@@ -240,40 +295,109 @@ def collect_files(path):
                 files.append(os.path.join(root, fn))
     return files
 
-def batch_process(files, key, mode, max_workers=4):
+_worker_key = None
+_worker_backend = None
+_worker_compress = "none"
+
+def _init_worker(key, backend_name, compress):
+    # 每个工作者启动时只接收一次密钥和配置，避免每个任务重复传递
+    global _worker_key, _worker_backend, _worker_compress
+    _worker_key = key
+    _worker_backend = cipher_backends.get(backend_name, ALGORITHM)
+    _worker_compress = compress
+
+def _process_one(filepath, mode):
     if mode == "enc":
-        func = encrypt_file
+        return encrypt_file(filepath, _worker_key, _worker_backend, _worker_compress)
+    if mode == "verify":
+        return verify_file(filepath, _worker_key, _worker_backend)
+    return decrypt_file(filepath, _worker_key, _worker_backend)
+
+def make_executor(max_workers, key, backend, compress="none"):
+    # 纯 Python 实现受 GIL 限制，线程无法利用多核；原生密码库释放 GIL，线程池即可
+    if backend.native:
+        pool = ThreadPoolExecutor
     else:
-        func = decrypt_file
+        pool = ProcessPoolExecutor
+    return pool(max_workers=max_workers, initializer=_init_worker, initargs=(key, backend.name, compress))
+
+def memory_cost(size):
+    # 不超过 CHUNK_SIZE 的文件一次处理完，更大的文件按块流式处理；
+    # 工作集约为输入块、输出块和 keystream 各一份，解压时另有一段输出缓冲
+    return 3 * min(size, CHUNK_SIZE) + compress_stage.OUTPUT_LIMIT + FOOTER.size
+
+def batch_process(files, key, mode, max_workers=4, backend=None, budget_mb=DEFAULT_BUDGET_MB,
+                  compress="none"):
+    if backend is None:
+        backend = cipher_backends.select(ALGORITHM)
     success_files = []
     failed_files = []
-    executor = ThreadPoolExecutor(max_workers=max_workers)
-    futures = {}
-    for f in files:
-        future = executor.submit(func, f, key)
-        futures[future] = f
-    for future in as_completed(futures):
-        try:
-            result = future.result()
-            if result:
-                success_files.append(futures[future])
-            else:
-                failed_files.append(futures[future])
-        except Exception:
-            failed_files.append(futures[future])
+    executor = make_executor(max_workers, key, backend, compress)
+    scheduler = BudgetScheduler(executor, budget_mb * 1024 * 1024, memory_cost)
+    for f, result, error in scheduler.run(_process_one, files, file_sizes(files), mode):
+        if error is not None:
+            print(f"[处理异常] {f} : {error}")
+            failed_files.append(f)
+        elif result:
+            success_files.append(f)
+        else:
+            failed_files.append(f)
+    executor.shutdown(wait=True)
+    return success_files, failed_files, scheduler.report()
+
+def batch_verify(files, key, max_workers=4, backend=None, budget_mb=DEFAULT_BUDGET_MB):
+    # 并行校验，返回 ([{path, status, detail}], 调度报告)
+    if backend is None:
+        backend = cipher_backends.select(ALGORITHM)
+    results = []
+    executor = make_executor(max_workers, key, backend)
+    scheduler = BudgetScheduler(executor, budget_mb * 1024 * 1024, memory_cost)
+    for f, result, error in scheduler.run(_process_one, files, file_sizes(files), "verify"):
+        if error is not None:
+            result = ("unreadable", str(error))
+        results.append({"path": f, "status": result[0], "detail": result[1]})
     executor.shutdown(wait=True)
-    return success_files, failed_files
+    results.sort(key=lambda r: r["path"])
+    return results, scheduler.report()
+
+def write_verify_report(path, results):
+    summary = {}
+    for r in results:
+        summary[r["status"]] = summary.get(r["status"], 0) + 1
+    report_file = os.path.join(os.getcwd(), f"verify_report_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump({"tool": "透明模式", "path": os.path.abspath(path),
+                   "finished": datetime.now().isoformat(), "summary": summary,
+                   "files": results}, f, ensure_ascii=False, indent=2)
+    return report_file, summary
 
 def main():
+    parser = argparse.ArgumentParser(description="ChaCha20-Poly1305 文件批量加解密工具")
+    parser.add_argument("--backend", default="auto", choices=["auto"] + cipher_backends.names(),
+                        help="密码后端，auto 表示启动时测速选择最快者")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_BUDGET_MB, metavar="MB",
+                        help=f"并发任务的内存预算（默认 {DEFAULT_BUDGET_MB} MB）")
+    parser.add_argument("--compress", default="none", choices=compress_stage.available(),
+                        help="加密前先压缩；首块熵过高（jpg/mp4 等）的文件不压缩")
+    parser.add_argument("--key-handle", default=None, metavar="NAME",
+                        help="从密钥代理（key_agent.py）获取密钥，不再输入口令")
+    parser.add_argument("--agent-socket", default=None, help="密钥代理的 socket 路径")
+    args = parser.parse_args()
     print("="*60)
     print("ChaCha20-Poly1305 文件批量加解密工具 (免费纯净版)")
     print("="*60)
+    try:
+        backend = cipher_backends.select(ALGORITHM, args.backend)
+    except ValueError as e:
+        print(e)
+        return
+    print(f"密码后端: {backend.name}")
     mode = ""
     while True:
-        mode = input("操作模式 (enc=加密, dec=解密): ").strip().lower()
-        if mode == "enc" or mode == "dec":
+        mode = input("操作模式 (enc=加密, dec=解密, verify=只校验): ").strip().lower()
+        if mode in ("enc", "dec", "verify"):
             break
-        print("请输入 'enc' 或 'dec'")
+        print("请输入 'enc'、'dec' 或 'verify'")
     path = ""
     while True:
         path = input("输入文件或目录路径: ").strip()
@@ -282,19 +406,38 @@ def main():
         print("路径不存在，请重新输入")
     threads = 4
     while True:
-        t = input("并发线程数 (默认4): ").strip()
+        t = input("并发数 (默认4): ").strip()
         if t == "":
             break
         if t.isdigit() and int(t) > 0:
             threads = int(t)
             break
         print("请输入正整数")
-    password = getpass.getpass("请输入密码（用于密钥派生）: ")
-    key = derive_key(password)
+    key = None
+    if args.key_handle:
+        try:
+            key = agent_key(args.key_handle, args.agent_socket)
+        except key_agent.AgentError as e:
+            print(f"密钥代理不可用，改为输入密码: {e}")
+    if key is None:
+        password = getpass.getpass("请输入密码（用于密钥派生）: ")
+        key = derive_key(password)
     files = collect_files(path)
+    if mode == "verify":
+        print(f"\n共找到 {len(files)} 个文件，开始校验（不写入任何文件）...\n")
+        results, report = batch_verify(files, key, threads, backend, args.memory_budget)
+        report_file, summary = write_verify_report(path, results)
+        print(report)
+        print("校验结果: " + ", ".join(f"{k}={v}" for k, v in sorted(summary.items())))
+        print(f"报告文件: {report_file}")
+        if summary.get("ok", 0) != len(results):
+            sys.exit(1)
+        return
     print(f"\n共找到 {len(files)} 个文件，开始{'加密' if mode=='enc' else '解密'}任务...\n")
-    success_files, failed_files = batch_process(files, key, mode, threads)
+    success_files, failed_files, report = batch_process(files, key, mode, threads, backend,
+                                                        args.memory_budget, args.compress)
     print("\n处理完成!")
+    print(report)
     print(f"成功文件数: {len(success_files)}")
     print(f"失败文件数: {len(failed_files)}")
     if len(failed_files) > 0: